@@ -1,76 +1,244 @@
 from typing import Optional, List, Callable
-from .model import MMUStatus, MMUState, Slot, MMUConfig
+from .model import MMUStatus, MMUState, MMUConfig
+from .loader import (
+    LoadError,
+    LoadProfile,
+    LoadResult,
+    MotionDriver,
+    SensorEdge,
+    SimulatedDriver,
+    sensor_guided_load,
+)
+from .state import MMUSnapshot
+from array import array
+import logging
 import time
 import threading
 
+log = logging.getLogger(__name__)
+
 class MMUController:
-    def __init__(self, config: MMUConfig):
+    """MMU state machine.
+
+    State is an immutable MMUSnapshot. ``_lock`` only serializes writers
+    building the next snapshot; readers take ``snapshot()`` without
+    locking. Journal and broadcast happen after the lock is released, in
+    version order, so a slow broadcaster never holds up a state change.
+    """
+
+    # Simulated unload/load and recovery durations; divided by sim_speedup
+    # so replays can run faster than real time.
+    SIM_MOVE_S = 0.3
+    SIM_RECOVER_S = 0.2
+
+    def __init__(self, config: MMUConfig, driver: Optional[MotionDriver] = None):
         self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published_version = -1
         self.config = config
+        self.driver = driver or SimulatedDriver()
+        self.sim_speedup = 1.0
         self._broadcast: Optional[Callable[[str, dict], None]] = None
-        self.status = MMUStatus(
-            state=MMUState.IDLE,
-            active_slot=None,
-            last_error=None,
-            slots=[
-                Slot(index=i, color=config.colors[i] if i < len(config.colors) else f"Slot {i+1}")
-                for i in range(config.drive_motors)
-            ],
-            simulation=True,
-            updated_at=time.time(),
+        self._journal = None
+        self._edges = [SensorEdge() for _ in range(config.drive_motors)]
+        # Park -> sensor distance per slot, refined by every measured load.
+        self._calibrated_mm = [config.feed_distance_mm] * config.drive_motors
+        self._snapshot = MMUSnapshot.initial(
+            config.colors[i] if i < len(config.colors) else f"Slot {i+1}"
+            for i in range(config.drive_motors)
         )
 
     def set_broadcaster(self, fn: Callable[[str, dict], None]) -> None:
         self._broadcast = fn
 
-    def _update(self, **kwargs) -> None:
-        for k, v in kwargs.items():
-            setattr(self.status, k, v)
-        self.status.updated_at = time.time()
+    def set_journal(self, journal) -> None:
+        """Persist every status change to ``journal`` (a StateJournal)."""
+        self._journal = journal
+
+    def restore(self, state: dict) -> None:
+        """Warm-restart from a journaled status without re-homing lanes.
+
+        A restart in the middle of a move leaves the filament position
+        unknown, so that case comes back as an error to be recovered.
+        """
+        with self._lock:
+            snap = self._snapshot
+            saved = {s["index"]: s for s in state.get("slots", [])}
+            present = bytearray(snap.has_filament)
+            loads = array("d", snap.last_load_mm)
+            for index in range(snap.slot_count):
+                prev = saved.get(index)
+                if prev is None:
+                    continue
+                present[index] = bool(prev.get("has_filament", False))
+                if prev.get("last_load_mm"):
+                    loads[index] = prev["last_load_mm"]
+                    self._calibrated_mm[index] = prev["last_load_mm"]
+
+            active = state.get("active_slot")
+            if active is not None and not 0 <= active < snap.slot_count:
+                active = None
+            last_error = state.get("last_error")
+            prev_state = state.get("state", MMUState.IDLE.value)
+            if prev_state in (MMUState.IDLE.value, MMUState.ERROR.value):
+                new_state = MMUState(prev_state)
+            else:
+                new_state = MMUState.ERROR
+                last_error = f"Backend restarted during {prev_state}; filament position unknown"
+            self._snapshot = snap.replace(
+                state=new_state,
+                active_slot=active,
+                last_error=last_error,
+                has_filament=bytes(present),
+                last_load_mm=loads,
+            )
+
+    def _update(self, slot: Optional[int] = None, has_filament: Optional[bool] = None,
+                last_load_mm: Optional[float] = None, **kwargs) -> MMUSnapshot:
+        """Swap in the next snapshot. Caller holds ``_lock``; call
+        ``_publish`` with the result after releasing it."""
+        if slot is None:
+            self._snapshot = self._snapshot.replace(**kwargs)
+        else:
+            self._snapshot = self._snapshot.with_slot(slot, has_filament, last_load_mm, **kwargs)
+        return self._snapshot
+
+    def _publish(self, snap: MMUSnapshot) -> None:
+        with self._publish_lock:
+            # A newer snapshot may have been published already by another
+            # writer; never let an older one overwrite it downstream.
+            if snap.version <= self._published_version:
+                return
+            self._published_version = snap.version
+            data = snap.to_dict()
+            if self._journal is not None:
+                self._journal.record("mmu_controller", data)
+            if self._broadcast:
+                try:
+                    self._broadcast("mmu_status", data)
+                except Exception:
+                    log.exception("mmu_status broadcast failed")
+
+    def _emit(self, kind: str, **data) -> None:
+        """Broadcast a one-off ``mmu_event`` (phase timing, sensor edge)."""
         if self._broadcast:
             try:
-                self._broadcast("mmu_status", self.status.dict())
+                self._broadcast("mmu_event", dict(data, kind=kind, t=time.time()))
             except Exception:
-                pass
+                log.exception("mmu_event %s broadcast failed", kind)
 
-    def get_status(self) -> MMUStatus:
+    def _phase_done(self, phase: str, slot: Optional[int], started: float, error: Optional[str] = None, **data) -> None:
+        if error is not None:
+            log.warning("%s failed on lane %s: %s", phase, slot, error, extra={"lane": slot, "phase": phase})
+        self._emit("phase", phase=phase, slot=slot, duration_s=round(time.monotonic() - started, 4),
+                   ok=error is None, error=error, **data)
+
+    def _set(self, **kwargs) -> None:
         with self._lock:
-            return self.status.copy()
+            snap = self._update(**kwargs)
+        self._publish(snap)
+
+    def snapshot(self) -> MMUSnapshot:
+        return self._snapshot
+
+    def get_status(self) -> MMUStatus:
+        return self._snapshot.to_model()
 
     def simulate_load_slot(self, slot_index: int) -> None:
         with self._lock:
-            if slot_index < 0 or slot_index >= len(self.status.slots):
-                self._update(state=MMUState.ERROR, last_error=f"Invalid slot {slot_index}")
-                return
-            self._update(state=MMUState.LOADING, active_slot=slot_index)
-        time.sleep(0.3)
+            if slot_index < 0 or slot_index >= self._snapshot.slot_count:
+                snap = self._update(state=MMUState.ERROR, last_error=f"Invalid slot {slot_index}")
+                valid = False
+            else:
+                snap = self._update(state=MMUState.LOADING, active_slot=slot_index)
+                valid = True
+        self._publish(snap)
+        if not valid:
+            return
+        time.sleep(self.SIM_MOVE_S / self.sim_speedup)
+        self._set(slot=slot_index, has_filament=True, state=MMUState.IDLE)
+
+    def notify_sensor(self, slot_index: int, triggered: bool) -> None:
+        self._edges[slot_index].notify(triggered)
+        self._emit("sensor", slot=slot_index, triggered=triggered)
+
+    def load_slot(self, slot_index: int) -> Optional[LoadResult]:
+        started = time.monotonic()
         with self._lock:
-            for s in self.status.slots:
-                if s.index == slot_index:
-                    s.has_filament = True
-            self._update(state=MMUState.IDLE)
+            if slot_index < 0 or slot_index >= self._snapshot.slot_count:
+                snap = self._update(state=MMUState.ERROR, last_error=f"Invalid slot {slot_index}")
+                calibrated = None
+            else:
+                snap = self._update(state=MMUState.LOADING, active_slot=slot_index)
+                calibrated = self._calibrated_mm[slot_index]
+        self._publish(snap)
+        if calibrated is None:
+            self._phase_done("load", slot_index, started, snap.last_error)
+            return None
+
+        edge = self._edges[slot_index]
+        edge.arm(False)
+        if isinstance(self.driver, SimulatedDriver):
+            self.driver.reset(calibrated, lambda t: self.notify_sensor(slot_index, t))
+
+        profile = LoadProfile(
+            calibrated_mm=calibrated,
+            fast_speed_mm_s=self.config.load_fast_speed_mm_s,
+            slow_speed_mm_s=self.config.load_slow_speed_mm_s,
+            margin_mm=self.config.load_margin_mm,
+        )
+        try:
+            result = sensor_guided_load(self.driver, edge, profile)
+        except LoadError as e:
+            self._set(state=MMUState.ERROR, last_error=str(e))
+            self._phase_done("load", slot_index, started, str(e))
+            return None
 
-    def simulate_unload(self) -> None:
         with self._lock:
-            if self.status.active_slot is None:
-                self._update(state=MMUState.ERROR, last_error="No active slot to unload")
-                return
-            slot_index = self.status.active_slot
-            self._update(state=MMUState.UNLOADING)
-        time.sleep(0.3)
+            self._calibrated_mm[slot_index] = result.measured_mm
+            snap = self._update(
+                slot=slot_index,
+                has_filament=True,
+                last_load_mm=round(result.measured_mm, 2),
+                state=MMUState.IDLE,
+            )
+        self._publish(snap)
+        self._phase_done("load", slot_index, started, measured_mm=round(result.measured_mm, 2),
+                         fast_mm=round(result.fast_mm, 2), slow_mm=round(result.slow_mm, 2),
+                         triggered_early=result.triggered_early)
+        return result
+
+    def simulate_unload(self) -> None:
+        started = time.monotonic()
         with self._lock:
-            for s in self.status.slots:
-                if s.index == slot_index:
-                    s.has_filament = False
-            self._update(state=MMUState.IDLE, active_slot=None)
+            slot_index = self._snapshot.active_slot
+            if slot_index is None:
+                snap = self._update(state=MMUState.ERROR, last_error="No active slot to unload")
+            else:
+                snap = self._update(state=MMUState.UNLOADING)
+        self._publish(snap)
+        if slot_index is None:
+            self._phase_done("unload", None, started, snap.last_error)
+            return
+        time.sleep(self.SIM_MOVE_S / self.sim_speedup)
+        self._set(slot=slot_index, has_filament=False, state=MMUState.IDLE, active_slot=None)
+        self._phase_done("unload", slot_index, started)
 
     def simulate_toolchange(self, slot_index: int) -> None:
-        self.simulate_unload()
-        self.simulate_load_slot(slot_index)
+        snap = self._snapshot
+        if snap.active_slot == slot_index and snap.has_filament_at(slot_index):
+            return  # already loaded: the macro skips this transition too
+        started = time.monotonic()
+        if snap.active_slot is not None:
+            self.simulate_unload()
+        self.load_slot(slot_index)
+        after = self._snapshot
+        error = after.last_error if after.state == MMUState.ERROR else None
+        self._phase_done("toolchange", slot_index, started, error, from_slot=snap.active_slot)
 
     def simulate_recover(self) -> None:
-        with self._lock:
-            self._update(state=MMUState.RECOVERING, last_error=None)
-        time.sleep(0.2)
-        with self._lock:
-            self._update(state=MMUState.IDLE)
+        started = time.monotonic()
+        self._set(state=MMUState.RECOVERING, last_error=None)
+        time.sleep(self.SIM_RECOVER_S / self.sim_speedup)
+        self._set(state=MMUState.IDLE)
+        self._phase_done("recover", self._snapshot.active_slot, started)
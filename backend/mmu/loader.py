@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+import threading
+import time
+
+
+class MotionDriver(Protocol):
+    def move(self, distance_mm: float, speed_mm_s: float, stop: Optional[threading.Event] = None) -> float:
+        """Feed filament; return the distance actually moved.
+
+        When ``stop`` is given the move must end as soon as it is set.
+        """
+        ...
+
+
+class LoadError(RuntimeError):
+    pass
+
+
+@dataclass
+class LoadProfile:
+    calibrated_mm: float
+    fast_speed_mm_s: float = 30.0
+    slow_speed_mm_s: float = 5.0
+    margin_mm: float = 10.0
+    # How far past the calibrated distance the slow approach may go before
+    # the load is declared failed.
+    overshoot_mm: float = 10.0
+
+
+@dataclass
+class LoadResult:
+    measured_mm: float
+    fast_mm: float
+    slow_mm: float
+    duration_s: float
+    triggered_early: bool
+
+
+class SensorEdge:
+    """Latches the next rising edge of one filament sensor.
+
+    Sensor updates arrive from outside (API route, Moonraker subscription)
+    via ``notify``; the loader blocks on the event instead of polling.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._state = False
+
+    @property
+    def event(self) -> threading.Event:
+        return self._event
+
+    def arm(self, current_state: bool = False) -> None:
+        self._state = current_state
+        self._event.clear()
+
+    def notify(self, triggered: bool) -> None:
+        if triggered and not self._state:
+            self._event.set()
+        self._state = triggered
+
+
+def sensor_guided_load(driver: MotionDriver, edge: SensorEdge, profile: LoadProfile) -> LoadResult:
+    """Fast feed to just short of the sensor, slow approach, stop on the edge."""
+    start = time.monotonic()
+    fast_target = max(0.0, profile.calibrated_mm - profile.margin_mm)
+
+    fast = driver.move(fast_target, profile.fast_speed_mm_s, stop=edge.event)
+    if edge.event.is_set():
+        # Sensor fired during the fast phase: the calibration is long.
+        return LoadResult(
+            measured_mm=fast,
+            fast_mm=fast,
+            slow_mm=0.0,
+            duration_s=time.monotonic() - start,
+            triggered_early=True,
+        )
+
+    approach = profile.margin_mm + profile.overshoot_mm
+    slow = driver.move(approach, profile.slow_speed_mm_s, stop=edge.event)
+    if not edge.event.is_set():
+        raise LoadError(
+            f"Filament sensor did not trigger within {fast + slow:.1f} mm "
+            f"(calibrated {profile.calibrated_mm:.1f} mm)"
+        )
+
+    return LoadResult(
+        measured_mm=fast + slow,
+        fast_mm=fast,
+        slow_mm=slow,
+        duration_s=time.monotonic() - start,
+        triggered_early=False,
+    )
+
+
+class SimulatedDriver:
+    """Driver for simulation mode: moves take (scaled) real time and the
+    sensor fires once the filament has travelled ``sensor_at_mm``."""
+
+    def __init__(self, time_scale: float = 0.01) -> None:
+        self.time_scale = time_scale
+        self.position = 0.0
+        self.sensor_at_mm: Optional[float] = None
+        self.on_sensor: Optional[Callable[[bool], None]] = None
+
+    def reset(self, sensor_at_mm: Optional[float], on_sensor: Callable[[bool], None]) -> None:
+        self.position = 0.0
+        self.sensor_at_mm = sensor_at_mm
+        self.on_sensor = on_sensor
+
+    def _wait(self, distance_mm: float, speed_mm_s: float, stop: Optional[threading.Event]) -> bool:
+        duration = distance_mm / speed_mm_s * self.time_scale if speed_mm_s > 0 else 0.0
+        if stop is not None:
+            return stop.wait(duration)
+        time.sleep(duration)
+        return False
+
+    def move(self, distance_mm: float, speed_mm_s: float, stop: Optional[threading.Event] = None) -> float:
+        hit = self.sensor_at_mm is not None and self.position < self.sensor_at_mm <= self.position + distance_mm
+        travel = self.sensor_at_mm - self.position if hit else distance_mm
+
+        if self._wait(travel, speed_mm_s, stop):
+            return 0.0
+        self.position += travel
+        if not hit:
+            return travel
+
+        if self.on_sensor:
+            self.on_sensor(True)
+        if stop is not None and stop.is_set():
+            return travel
+        rest = distance_mm - travel
+        self._wait(rest, speed_mm_s, None)
+        self.position += rest
+        return distance_mm
@@ -15,6 +15,7 @@ class Slot(BaseModel):
     index: int
     color: str
     has_filament: bool = False
+    last_load_mm: Optional[float] = None
 
 class MMUStatus(BaseModel):
     state: MMUState
@@ -33,3 +34,6 @@ class MMUConfig(BaseModel):
     cutter_pin: Optional[str]
     feed_distance_mm: float
     retract_distance_mm: float
+    load_fast_speed_mm_s: float = 30.0
+    load_slow_speed_mm_s: float = 5.0
+    load_margin_mm: float = 10.0
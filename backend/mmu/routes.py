@@ -2,20 +2,26 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from pathlib import Path
 import json
+import time
 from pydantic import BaseModel
 
 from .model import MMUStatus, MMUConfig
 from .controller import MMUController
+from fluxpath.core.state import journal
+from fp_core.macros import load_lane_geometry
+from fp_core.transitions import plan_transition, transition_table
 
 router = APIRouter()
 
 CONFIG_PATH = Path.home() / "FluxPath" / "config" / "fluxpath_config.json"
 _mmu_controller: MMUController | None = None
+_transitions: tuple | None = None  # (config mtime, geometry, table)
 
-def load_config() -> MMUConfig:
-    if not CONFIG_PATH.exists():
-        raise RuntimeError(f"FluxPath config not found at {CONFIG_PATH}")
-    data = json.loads(CONFIG_PATH.read_text())
+def load_config(path: Path | None = None) -> MMUConfig:
+    path = path or CONFIG_PATH
+    if not path.exists():
+        raise RuntimeError(f"FluxPath config not found at {path}")
+    data = json.loads(path.read_text())
     return MMUConfig(
         drive_motors=data["drive_motors"],
         motor_pins=data["motor_pins"],
@@ -25,21 +31,70 @@ def load_config() -> MMUConfig:
         cutter_pin=data.get("cutter_pin"),
         feed_distance_mm=float(data["feed_distance_mm"]),
         retract_distance_mm=float(data["retract_distance_mm"]),
+        load_fast_speed_mm_s=float(data.get("load_fast_speed_mm_s", 30.0)),
+        load_slow_speed_mm_s=float(data.get("load_slow_speed_mm_s", 5.0)),
+        load_margin_mm=float(data.get("load_margin_mm", 10.0)),
     )
 
 def get_mmu() -> MMUController:
     global _mmu_controller
     if _mmu_controller is None:
-        _mmu_controller = MMUController(load_config())
+        controller = MMUController(load_config())
+        saved = journal().get("mmu_controller")
+        if saved:
+            controller.restore(saved)
+        controller.set_journal(journal())
+        _mmu_controller = controller
     return _mmu_controller
 
 @router.get("/mmu/status", response_model=MMUStatus)
 def mmu_status(mmu: MMUController = Depends(get_mmu)):
     return mmu.get_status()
 
+def _lane_transitions():
+    """Lane geometry and transition table, rebuilt when the config changes."""
+    global _transitions
+    try:
+        mtime = CONFIG_PATH.stat().st_mtime
+    except OSError:
+        mtime = None
+    if _transitions is None or _transitions[0] != mtime:
+        geom = load_lane_geometry(CONFIG_PATH)
+        _transitions = (mtime, geom, transition_table(geom))
+    return _transitions[1], _transitions[2]
+
+def warm_up() -> dict:
+    """Pay at startup what the first MMU request would otherwise pay:
+    config parsing, controller construction and journal restore, the lane
+    transition table and a status render. Returns ms per step."""
+    timings = {}
+    for name, fn in (
+        ("controller", get_mmu),
+        ("transitions", _lane_transitions),
+        ("status", lambda: get_mmu().get_status()),
+    ):
+        started = time.perf_counter()
+        fn()
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+@router.get("/mmu/transitions")
+def mmu_transitions():
+    geom, table = _lane_transitions()
+    return {"result": "ok", "lanes": geom.lane_table(), "transitions": table}
+
+@router.get("/mmu/transitions/{from_lane}/{to_lane}")
+def mmu_transition(from_lane: int, to_lane: int, partial: bool = True):
+    geom, _ = _lane_transitions()
+    try:
+        plan = plan_transition(geom, from_lane, to_lane, partial=partial)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", "transition": plan.to_dict()}
+
 @router.post("/mmu/load_slot/{slot}")
 def mmu_load_slot(slot: int, mmu: MMUController = Depends(get_mmu)):
-    mmu.simulate_load_slot(slot)
+    mmu.load_slot(slot)
     st = mmu.get_status()
     if st.state == "error":
         raise HTTPException(status_code=400, detail=st.last_error)
@@ -83,15 +138,22 @@ def motors(mmu: MMUController = Depends(get_mmu)):
         for i in range(cfg.drive_motors)
     ]
 
+@router.post("/sensors/{index}")
+def sensor_edge(index: int, triggered: bool, mmu: MMUController = Depends(get_mmu)):
+    if index < 0 or index >= mmu.config.drive_motors:
+        raise HTTPException(status_code=404, detail=f"Unknown sensor {index}")
+    mmu.notify_sensor(index, triggered)
+    return {"result": "ok"}
+
 @router.get("/sensors", response_model=List[SensorInfo])
 def sensors(mmu: MMUController = Depends(get_mmu)):
     cfg = mmu.config
-    st = mmu.get_status()
+    snap = mmu.snapshot()
     return [
         SensorInfo(
             index=i,
             pin=cfg.sensor_pins[i],
-            triggered=st.slots[i].has_filament,
+            triggered=snap.has_filament_at(i),
         )
         for i in range(cfg.drive_motors)
     ]
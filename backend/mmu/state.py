@@ -0,0 +1,136 @@
+from array import array
+from math import isnan
+from typing import Iterable, List, Optional, Tuple
+import time
+
+from .model import MMUState, MMUStatus, Slot
+
+_NO_LOAD = float("nan")
+
+
+class MMUSnapshot:
+    """Immutable MMU state.
+
+    The controller replaces its snapshot on every change and never mutates
+    a published one, so readers just take the current reference; no lock,
+    no copy. Per-lane data lives in flat arrays (bytes for filament
+    presence, array('d') for last load length, NaN = never measured)
+    instead of one object per slot. Pydantic models are only built by
+    ``to_model`` at the API boundary.
+    """
+
+    __slots__ = (
+        "state", "active_slot", "last_error", "colors", "has_filament",
+        "last_load_mm", "simulation", "updated_at", "version",
+    )
+
+    def __init__(
+        self,
+        state: MMUState,
+        active_slot: Optional[int],
+        last_error: Optional[str],
+        colors: Tuple[str, ...],
+        has_filament: bytes,
+        last_load_mm: array,
+        simulation: bool = True,
+        updated_at: Optional[float] = None,
+        version: int = 0,
+    ) -> None:
+        set_ = object.__setattr__
+        set_(self, "state", state)
+        set_(self, "active_slot", active_slot)
+        set_(self, "last_error", last_error)
+        set_(self, "colors", colors)
+        set_(self, "has_filament", has_filament)
+        set_(self, "last_load_mm", last_load_mm)
+        set_(self, "simulation", simulation)
+        set_(self, "updated_at", time.time() if updated_at is None else updated_at)
+        set_(self, "version", version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MMUSnapshot is immutable; use replace()")
+
+    @classmethod
+    def initial(cls, colors: Iterable[str]) -> "MMUSnapshot":
+        colors = tuple(colors)
+        return cls(
+            state=MMUState.IDLE,
+            active_slot=None,
+            last_error=None,
+            colors=colors,
+            has_filament=bytes(len(colors)),
+            last_load_mm=array("d", [_NO_LOAD] * len(colors)),
+        )
+
+    # -------------------------------------------------
+    # Copy-on-write updates
+    # -------------------------------------------------
+    def replace(self, **changes) -> "MMUSnapshot":
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        fields["version"] = self.version + 1
+        fields["updated_at"] = time.time()
+        return MMUSnapshot(**fields)
+
+    def with_slot(
+        self,
+        index: int,
+        has_filament: Optional[bool] = None,
+        last_load_mm: Optional[float] = None,
+        **changes,
+    ) -> "MMUSnapshot":
+        if has_filament is not None:
+            present = bytearray(self.has_filament)
+            present[index] = int(has_filament)
+            changes["has_filament"] = bytes(present)
+        if last_load_mm is not None:
+            loads = array("d", self.last_load_mm)
+            loads[index] = last_load_mm
+            changes["last_load_mm"] = loads
+        return self.replace(**changes)
+
+    # -------------------------------------------------
+    # Reads
+    # -------------------------------------------------
+    @property
+    def slot_count(self) -> int:
+        return len(self.colors)
+
+    def has_filament_at(self, index: int) -> bool:
+        return bool(self.has_filament[index])
+
+    def last_load_at(self, index: int) -> Optional[float]:
+        mm = self.last_load_mm[index]
+        return None if isnan(mm) else mm
+
+    def slots(self) -> List[dict]:
+        return [
+            {
+                "index": i,
+                "color": self.colors[i],
+                "has_filament": bool(self.has_filament[i]),
+                "last_load_mm": self.last_load_at(i),
+            }
+            for i in range(len(self.colors))
+        ]
+
+    def to_dict(self) -> dict:
+        """Plain-data form (journal, event bus); same shape as MMUStatus."""
+        return {
+            "state": self.state.value,
+            "active_slot": self.active_slot,
+            "last_error": self.last_error,
+            "slots": self.slots(),
+            "simulation": self.simulation,
+            "updated_at": self.updated_at,
+        }
+
+    def to_model(self) -> MMUStatus:
+        return MMUStatus(
+            state=self.state,
+            active_slot=self.active_slot,
+            last_error=self.last_error,
+            slots=[Slot(**s) for s in self.slots()],
+            simulation=self.simulation,
+            updated_at=self.updated_at,
+        )
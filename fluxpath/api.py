@@ -1,13 +1,13 @@
 # /home/syko/FluxPath/fluxpath/api.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, HTTPException
 from .core.instances import instance_manager
 from .core.diagnostics import basic_diagnostics
 from . import __version__
 
-app = FastAPI(title="FluxPath Backend", version=__version__)
+router = APIRouter()
 
-@app.get("/fluxpath/version")
+@router.get("/fluxpath/version")
 def get_version():
     return {
         "result": "ok",
@@ -15,60 +15,256 @@ def get_version():
         "version": __version__,
     }
 
-@app.get("/fluxpath/instances")
+@router.get("/fluxpath/instances")
 def list_instances():
     return {"result": "ok", "instances": instance_manager.list_instances()}
 
-@app.post("/fluxpath/instances")
+@router.post("/fluxpath/instances")
 def create_instance(name: str = "default"):
     inst = instance_manager.create_instance(name)
     return {"result": "ok", "instance": inst}
 
-@app.get("/fluxpath/instances/{inst_id}")
+@router.get("/fluxpath/instances/{inst_id}")
 def get_instance(inst_id: str):
     inst = instance_manager.get_instance(inst_id)
     if not inst:
         raise HTTPException(status_code=404, detail="Instance not found")
     return {"result": "ok", "instance": inst}
 
-@app.post("/fluxpath/instances/{inst_id}/status")
+@router.post("/fluxpath/instances/{inst_id}/status")
 def set_instance_status(inst_id: str, status: str):
     inst = instance_manager.set_status(inst_id, status)
     if not inst:
         raise HTTPException(status_code=404, detail="Instance not found")
     return {"result": "ok", "instance": inst}
 
-@app.get("/fluxpath/diagnostics")
+@router.get("/fluxpath/diagnostics")
 def diagnostics():
     return {"result": "ok", "diagnostics": basic_diagnostics()}
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List
+from .core.color import COLOR_HEX_PATTERN
 from .core.mmu import mmu_manager
 
 class FilamentModel(BaseModel):
     tool: int
-    color_hex: str
+    color_hex: str = Field(pattern=COLOR_HEX_PATTERN)
     material: str
     name: str | None = None
 
 class ToolchangeRequest(BaseModel):
     sequence: List[int]
 
-@app.get("/fluxpath/capabilities")
+@router.get("/fluxpath/capabilities")
 def get_capabilities():
-    return {"result": "ok", "capabilities": mmu_manager.get_capabilities()}
+    # One route for both former backends: OrcaSlicer reads the top-level
+    # keys, the CLI and planners read "capabilities".
+    return {
+        "result": "ok",
+        "name": "FluxPath",
+        "version": __version__,
+        "mmu": True,
+        "ws": "/fluxpath/ws",
+        "capabilities": mmu_manager.get_capabilities(),
+    }
 
-@app.get("/fluxpath/filaments")
+@router.get("/fluxpath/filaments")
 def get_filaments():
     return {"result": "ok", "filaments": mmu_manager.get_filaments()}
 
-@app.post("/fluxpath/filaments")
+@router.post("/fluxpath/filaments")
 def set_filaments(filaments: List[FilamentModel]):
     stored = mmu_manager.set_filaments([f.model_dump() for f in filaments])
     return {"result": "ok", "filaments": stored}
 
-@app.post("/fluxpath/slicer/plan")
+@router.post("/fluxpath/slicer/plan")
 def slicer_plan(req: ToolchangeRequest):
     plan = mmu_manager.plan_toolchanges(req.sequence)
     return {"result": "ok", "plan": plan}
+
+from typing import Optional
+from .core.assignment import plan_assignments
+
+class JobModel(BaseModel):
+    id: str
+    filaments: List[FilamentModel]
+
+class PrinterLoadoutModel(BaseModel):
+    id: str
+    filaments: List[FilamentModel]
+    tools: Optional[int] = None
+
+class AssignRequest(BaseModel):
+    jobs: List[JobModel]
+    printers: Optional[List[PrinterLoadoutModel]] = None
+
+@router.post("/fluxpath/assign")
+def assign_jobs(req: AssignRequest):
+    printers = None
+    if req.printers is not None:
+        printers = [p.model_dump(exclude_none=True) for p in req.printers]
+    plan = plan_assignments([j.model_dump() for j in req.jobs], printers)
+    return {"result": "ok", "assignment": plan}
+
+from .core.slotmap import map_slots
+
+class SlotMapRequest(BaseModel):
+    requested: List[FilamentModel]
+    loaded: Optional[List[FilamentModel]] = None
+
+@router.post("/fluxpath/slicer/map")
+def slicer_map(req: SlotMapRequest):
+    loaded = None
+    if req.loaded is not None:
+        loaded = [f.model_dump() for f in req.loaded]
+    result = map_slots([f.model_dump() for f in req.requested], loaded)
+    return {"result": "ok", "map": result}
+
+from typing import Dict
+from .core.spools import spool_tracker
+
+class SpoolModel(BaseModel):
+    remaining_mm: Optional[float] = None
+    remaining_g: Optional[float] = None
+    material: Optional[str] = None
+    diameter: Optional[float] = None
+    density: Optional[float] = None
+
+class JobCheckRequest(BaseModel):
+    filename: str
+    tool_map: Optional[Dict[int, int]] = None
+    progress: float = 0.0
+
+@router.get("/fluxpath/spools")
+def get_spools():
+    return {"result": "ok", **spool_tracker.summary()}
+
+@router.post("/fluxpath/spools/{lane}")
+def set_spool(lane: int, spool: SpoolModel):
+    try:
+        stored = spool_tracker.set_spool(lane, **spool.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", "spool": stored}
+
+@router.post("/fluxpath/job/check")
+def check_job(req: JobCheckRequest):
+    try:
+        usage = spool_tracker.usage(req.filename)
+    except OSError:
+        raise HTTPException(status_code=404, detail=f"G-code file not found: {req.filename}")
+    return {"result": "ok", "prediction": spool_tracker.predict(usage, req.tool_map, req.progress)}
+
+# Failover, telemetry and profiling are imported by the first request
+# that needs them, not at startup.
+
+@router.get("/fluxpath/runout")
+def runout_table():
+    from .core.failover import runout_failover
+
+    return {"result": "ok", "runout": runout_failover.table()}
+
+@router.get("/fluxpath/telemetry/recordings")
+def telemetry_recordings(start: Optional[float] = None, end: Optional[float] = None):
+    from .core.telemetry import telemetry_recorder
+
+    return {"result": "ok", "recordings": telemetry_recorder.recordings(start, end)}
+
+@router.get("/fluxpath/telemetry/query")
+def telemetry_query(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    recording: Optional[str] = None,
+    kinds: Optional[str] = None,
+    lane: Optional[int] = None,
+    points: Optional[int] = None,
+):
+    from .core.telemetry import DEFAULT_POINTS, telemetry_recorder
+
+    if points is None:
+        points = DEFAULT_POINTS
+    try:
+        data = telemetry_recorder.query(
+            start, end, recording,
+            kinds=[k.strip() for k in kinds.split(",") if k.strip()] if kinds else None,
+            lane=lane,
+            points=max(3, min(points, 10000)),
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown recording {recording}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", **data}
+
+from fastapi import Response
+
+def _profiler():
+    from .core.profiling import profiler
+
+    return profiler
+
+class ProfileTargetRequest(BaseModel):
+    target: str
+    rate: float = 1.0
+
+@router.get("/fluxpath/profiling")
+def profiling_status(target: Optional[str] = None):
+    profiler = _profiler()
+    return {
+        "result": "ok",
+        "targets": profiler.targets(),
+        "available": profiler.available(),
+        "profiles": profiler.profiles(target),
+    }
+
+@router.post("/fluxpath/profiling")
+def profiling_set(req: ProfileTargetRequest):
+    try:
+        targets = _profiler().set(req.target, req.rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", "targets": targets}
+
+@router.delete("/fluxpath/profiling")
+def profiling_clear():
+    _profiler().clear()
+    return {"result": "ok", "targets": {}}
+
+@router.get("/fluxpath/profiling/{profile_id}")
+def profiling_summary(profile_id: int, top: int = 25, sort: str = "cumulative"):
+    try:
+        summary = _profiler().summary(profile_id, max(1, min(top, 500)), sort)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown profile {profile_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", "profile": summary}
+
+@router.get("/fluxpath/profiling/{profile_id}/pstats")
+def profiling_download(profile_id: int):
+    try:
+        data = _profiler().pstats(profile_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown profile {profile_id}")
+    return Response(data, media_type="application/octet-stream", headers={
+        "Content-Disposition": f'attachment; filename="fluxpath-{profile_id}.pstats"',
+    })
+
+from fp_core import logs
+
+@router.get("/fluxpath/logs")
+def recent_logs(
+    level: Optional[str] = None,
+    instance: Optional[int] = None,
+    command: Optional[str] = None,
+    since: Optional[float] = None,
+    q: Optional[str] = None,
+    limit: int = 200,
+):
+    try:
+        records = logs.recent(level=level, instance_id=instance, command_id=command, since=since,
+                              contains=q, limit=max(1, min(limit, 5000)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": "ok", "records": records, **logs.stats()}
@@ -0,0 +1,394 @@
+# /home/syko/FluxPath/fluxpath/app.py
+#
+# Single FluxPath backend: every router in one process and one event loop,
+# sharing the MMU controller, filament/plan state and the event bus. It
+# listens on several ports so clients of the former split backends (9876
+# dashboard/MMU/device WS, 9999 instances/planning) keep working.
+# With FLUXPATH_WORKERS > 1 this process stays the state owner and worker
+# processes share its listeners (see core/workers.py).
+
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, List, Tuple
+
+import uvicorn
+from fastapi import FastAPI
+
+from . import __version__
+from .core.codec import DEFLATE_SETTINGS
+from .core.control import control_server
+from .core.diagnostics import basic_diagnostics
+from .core.events import event_bus
+from .core.instances import instance_manager
+from .core.mmu import mmu_manager
+from .core import sdnotify
+from .core.spools import spool_tracker
+from .core.state import journal, printer_state, restore_printer_state
+from .core.status import status_aggregator
+from .core import workers
+
+from backend.mmu import routes as mmu_routes
+from fp_core.logs import log_context, new_command_id, recent as recent_logs, setup_logging
+
+log = logging.getLogger(__name__)
+
+# "host:port,host:port"; every listener serves the same app.
+DEFAULT_LISTEN = "0.0.0.0:9876,0.0.0.0:9999"
+
+# Build the MMU hot path (controller, transition table, status model)
+# and send WARMUP_ROUTES through the whole ASGI stack once during
+# startup, before systemd is told the service is ready: the first real
+# request would otherwise pay for route setup, lazy imports and the
+# threadpool coming up.
+WARMUP = os.environ.get("FLUXPATH_WARMUP", "1") != "0"
+WARMUP_ROUTES = ("/mmu/status", "/status/all", "/health")
+
+# Services nothing needs at ready are started (and their modules
+# imported) this long after READY=1, so the first requests after a
+# (re)start do not queue behind them. See start_background_services().
+BACKGROUND_DELAY = float(os.environ.get("FLUXPATH_BACKGROUND_DELAY", "1.0"))
+_background: List[Any] = []
+
+# Routes a worker answers itself from mirrored state; everything else is
+# forwarded to the owner. Only list routes that neither change state nor
+# read anything outside WORKER_MIRROR.
+WORKER_ROUTES = (
+    ("GET", "/"),
+    ("GET", "/health"),
+    ("GET", "/printer/info"),
+    ("GET", "/printer/status"),
+    ("GET", "/status/all"),
+    ("GET", "/status/stream"),
+    ("GET", "/fluxpath/version"),
+    ("GET", "/fluxpath/capabilities"),
+    ("GET", "/fluxpath/filaments"),
+    ("POST", "/fluxpath/slicer/plan"),
+    ("POST", "/fluxpath/slicer/map"),
+    ("POST", "/fluxpath/assign"),
+    ("POST", "/fluxpath/job/check"),
+    ("GET", "/mmu/transitions"),
+    ("GET", "/mmu/transitions/{from_lane}/{to_lane}"),
+    ("GET", "/fluxpath/telemetry/recordings"),
+    ("GET", "/fluxpath/telemetry/query"),
+)
+
+# Topic -> how a worker folds the owner's data into its own singletons.
+WORKER_MIRROR = {
+    "printer_state": printer_state.update,
+    "mmu_status": None,  # read through event_bus.latest
+    "filaments": mmu_manager.adopt,
+    "spools": spool_tracker.adopt,
+    "status_all": status_aggregator.adopt,
+}
+
+
+class CommandIdMiddleware:
+    """Gives every HTTP request a command ID (the client's X-Request-ID if
+    sent) that log records carry and the response echoes. The header is
+    added to the request too, so a worker forwards it to the owner."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-request-id")
+        if header is None:
+            header = new_command_id("http").encode()
+            scope = dict(scope, headers=scope["headers"] + [(b"x-request-id", header)])
+
+        async def send_with_id(msg):
+            if msg["type"] == "http.response.start":
+                msg = dict(msg, headers=list(msg.get("headers", [])) + [(b"x-request-id", header)])
+            await send(msg)
+
+        with log_context(command_id=header.decode("latin-1")):
+            await self.app(scope, receive, send_with_id)
+
+
+def create_app() -> FastAPI:
+    from . import api, dashboard
+    from .device import websocket_server
+
+    setup_logging(queue_console=True)
+    app = FastAPI(title="FluxPath Backend", version=__version__)
+    app.include_router(dashboard.router)
+    app.include_router(mmu_routes.router)
+    app.include_router(api.router)
+    app.include_router(websocket_server.router)
+
+    if workers.IS_WORKER:
+        return _worker_app(app)
+    app.add_middleware(CommandIdMiddleware)
+
+    @app.on_event("startup")
+    async def startup():
+        event_bus.bind()
+        # Warm restart: lane state comes back from the journal instead of
+        # requiring an unload + re-home of every lane.
+        restore_printer_state()
+        mmu_manager.set_journal(journal())
+        spool_tracker.set_journal(journal())
+        try:
+            if WARMUP:
+                log.info("FluxPath MMU warm-up (ms): %s", mmu_routes.warm_up())
+            mmu_routes.get_mmu().set_broadcaster(event_bus.publish)
+        except RuntimeError as e:
+            log.warning("FluxPath MMU not available: %s", e)
+        await control_server.start()
+        status_aggregator.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        while _background:
+            await _background.pop().stop()
+        await status_aggregator.stop()
+        await control_server.stop()
+        journal().close()
+
+    return app
+
+
+async def start_background_services(delay: float = 0.0) -> None:
+    """Klipper status publishing, deep health probes, telemetry recording
+    and LAN discovery. NotifyingServer starts them BACKGROUND_DELAY after
+    READY=1; other servers (tests, plain ``uvicorn fluxpath.app:app``)
+    have to call this themselves."""
+    await asyncio.sleep(delay)
+    from .core.health import health_monitor
+    from .core.klipper_status import klipper_status
+    from .core.telemetry import telemetry_recorder
+    from .device.discovery import discovery_service
+
+    klipper_status.start()
+    _background.append(klipper_status)
+    health_monitor.start()
+    _background.append(health_monitor)
+    try:
+        await telemetry_recorder.start()
+        _background.append(telemetry_recorder)
+    except OSError as e:
+        log.warning("FluxPath telemetry disabled: %s", e)
+    try:
+        await discovery_service.start()
+        _background.append(discovery_service)
+    except OSError as e:
+        # Port taken (e.g. a second backend on this host): serve without it.
+        log.warning("FluxPath discovery disabled: %s", e)
+
+
+def _worker_app(app: FastAPI) -> FastAPI:
+    """Worker process: no services, no journal; state comes from the owner."""
+    mirror = workers.StateMirror(WORKER_MIRROR)
+    app.add_middleware(workers.OwnerRouter, local_routes=WORKER_ROUTES)
+    app.add_middleware(CommandIdMiddleware)
+
+    @app.on_event("startup")
+    async def startup():
+        event_bus.bind()
+        # Accept nothing until the first snapshot has arrived.
+        await mirror.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await mirror.stop()
+
+    return app
+
+
+def _state_snapshot() -> dict:
+    """Current data of every WORKER_MIRROR topic, for workers (re)joining."""
+    snap = {
+        "printer_state": printer_state,
+        "filaments": mmu_manager.get_filaments(),
+        "spools": spool_tracker.summary(),
+        "status_all": status_aggregator.document(),
+    }
+    try:
+        snap["mmu_status"] = mmu_routes.get_mmu().snapshot().to_dict()
+    except RuntimeError:
+        pass
+    return snap
+
+
+# ---------------------------------------------------------
+# Local control socket (scripts/fluxpath_cli.py fast path)
+# ---------------------------------------------------------
+def _runout_table():
+    from .core.failover import runout_failover
+
+    return runout_failover.table()
+
+
+def _health_report(probes=None):
+    from .core.health import health_monitor
+
+    return health_monitor.report(probes)
+
+
+def _profiler():
+    from .core.profiling import profiler
+
+    return profiler
+
+
+def _mmu_command(fn):
+    def run(**params):
+        mmu = mmu_routes.get_mmu()
+        fn(mmu, **params)
+        snap = mmu.snapshot()
+        if snap.state == "error":
+            raise RuntimeError(snap.last_error)
+        return snap.to_dict()
+    return run
+
+
+control_server.register("version", lambda: {"backend": "FluxPath", "version": __version__})
+control_server.register("capabilities", mmu_manager.get_capabilities)
+control_server.register("diagnostics", basic_diagnostics)
+control_server.register("printer.status", lambda: {
+    "status": printer_state["status"],
+    "job": printer_state["job"],
+    "mmu": printer_state["mmu"],
+})
+control_server.register("mmu.status", lambda: mmu_routes.get_mmu().snapshot().to_dict())
+control_server.register("mmu.load", _mmu_command(lambda mmu, slot: mmu.load_slot(int(slot))))
+control_server.register("mmu.unload", _mmu_command(lambda mmu: mmu.simulate_unload()))
+control_server.register("mmu.tool", _mmu_command(lambda mmu, slot: mmu.simulate_toolchange(int(slot))))
+control_server.register("mmu.recover", _mmu_command(lambda mmu: mmu.simulate_recover()))
+control_server.register("instances.list", instance_manager.list_instances)
+control_server.register("instances.create", lambda name="default": instance_manager.create_instance(name))
+control_server.register("filaments", mmu_manager.get_filaments)
+control_server.register("status.all", status_aggregator.document)
+control_server.register("health.deep", _health_report)
+control_server.register("spools", spool_tracker.summary)
+control_server.register("runout", _runout_table)
+control_server.register("spools.set", lambda lane, **spool: spool_tracker.set_spool(int(lane), **spool))
+control_server.register("job.check", lambda filename, tool_map=None: spool_tracker.predict(
+    spool_tracker.usage(filename), {int(k): int(v) for k, v in (tool_map or {}).items()}))
+control_server.register("plan", lambda sequence: mmu_manager.plan_toolchanges([int(t) for t in sequence]))
+control_server.register("profile.set", lambda target, rate=1.0: _profiler().set(target, rate))
+control_server.register("profile.list", lambda target=None: _profiler().profiles(target))
+control_server.register("logs", lambda **filters: recent_logs(**filters))
+control_server.register("state.snapshot", _state_snapshot)
+
+
+# ---------------------------------------------------------
+# Listeners
+# ---------------------------------------------------------
+def parse_listeners(spec: str) -> List[Tuple[str, int]]:
+    listeners = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":")
+        listeners.append((host.strip("[]") or "0.0.0.0", int(port)))
+    return listeners
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def ws_protocol():
+    """uvicorn's websockets protocol with permessage-deflate tuned for
+    small, repetitive JSON status frames (see DEFLATE_SETTINGS)."""
+    from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+    from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+    class FluxPathWebSocketProtocol(WebSocketProtocol):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if self.available_extensions:
+                self.available_extensions = [ServerPerMessageDeflateFactory(**DEFLATE_SETTINGS)]
+
+    return FluxPathWebSocketProtocol
+
+
+async def _asgi_get(asgi_app, path: str) -> None:
+    """One in-process GET through the full middleware stack."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 0),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg):
+        pass
+
+    await asgi_app(scope, receive, send)
+
+
+class NotifyingServer(uvicorn.Server):
+    """Tells systemd (Type=notify) once every listener accepts connections,
+    i.e. after the startup handlers and the warm-up have run, then starts
+    the background services."""
+
+    background = None
+
+    async def startup(self, *args, **kwargs):
+        await super().startup(*args, **kwargs)
+        if not self.started or workers.IS_WORKER:
+            return
+        if WARMUP:
+            for path in WARMUP_ROUTES:
+                try:
+                    await _asgi_get(self.config.loaded_app, path)
+                except Exception:
+                    # e.g. no MMU config yet: warm what can be warmed.
+                    pass
+        sdnotify.ready("FluxPath backend ready")
+        self.background = asyncio.ensure_future(start_background_services(BACKGROUND_DELAY))
+
+    async def shutdown(self, *args, **kwargs):
+        if not workers.IS_WORKER:
+            sdnotify.stopping()
+        if self.background is not None:
+            # Services it already started are stopped by the app's
+            # shutdown handler.
+            self.background.cancel()
+        await super().shutdown(*args, **kwargs)
+
+
+def main(listen: str | None = None):
+    # One uvicorn server over several sockets: one lifespan, one loop,
+    # one copy of the state, however many ports are open.
+    server = NotifyingServer(uvicorn.Config(app, log_level="info", ws=ws_protocol()))
+    if workers.IS_WORKER:
+        server.run(sockets=workers.inherited_sockets())
+        return
+
+    listeners = parse_listeners(listen or os.environ.get("FLUXPATH_LISTEN", DEFAULT_LISTEN))
+    sockets = [_bind(h, p) for h, p in listeners]
+    if workers.WORKERS == 1:
+        server.run(sockets=sockets)
+        return
+
+    # Bind before starting workers so they inherit ready listeners; the
+    # private owner socket is where workers forward commands.
+    for sock in sockets:
+        sock.listen(2048)
+    pool = workers.WorkerPool(workers.WORKERS - 1, sockets)
+    pool.start()
+    try:
+        server.run(sockets=sockets + [workers.bind_owner_socket()])
+    finally:
+        pool.stop()
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# /home/syko/FluxPath/fluxpath/core/assignment.py
+
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional, Tuple
+
+from .matching import INFEASIBLE, solve_assignment
+from .mmu import Filament, ToolID, mmu_manager
+
+# A reload always costs more than any number of remaps: remapping a tool is a
+# G-code rewrite, a reload is an operator walking to the printer.
+RELOAD_COST = 1000.0
+REMAP_COST = 1.0
+
+
+@dataclass
+class PrinterLoadout:
+    id: str
+    filaments: List[Filament]
+    tools: int
+
+
+@dataclass
+class Job:
+    id: str
+    filaments: List[Filament]
+
+
+@dataclass
+class PairScore:
+    job_id: str
+    printer_id: str
+    matched: int
+    reloads: int
+    remap: Dict[ToolID, ToolID]
+    cost: float
+
+
+@dataclass
+class Assignment:
+    job_id: str
+    printer_id: Optional[str]
+    matched: int = 0
+    reloads: int = 0
+    remap: Dict[ToolID, ToolID] = field(default_factory=dict)
+
+
+def _key(f: Filament) -> Tuple[str, str]:
+    return f.color_hex.strip().lstrip("#").upper(), f.material.strip().upper()
+
+
+def _filament(raw: Dict) -> Filament:
+    return Filament(
+        tool=int(raw["tool"]),
+        color_hex=raw.get("color_hex", "#FFFFFF"),
+        material=raw.get("material", "PLA"),
+        name=raw.get("name"),
+    )
+
+
+def score_pair(job: Job, printer: PrinterLoadout) -> PairScore:
+    """Match a job's tools against a printer's loaded lanes.
+
+    Tools whose filament already sits in the same lane are kept as-is; the
+    rest are remapped onto any free lane holding the same filament. Whatever
+    is left over has to be reloaded by hand.
+    """
+    loaded = {f.tool: _key(f) for f in printer.filaments}
+    free = dict(loaded)
+    remap: Dict[ToolID, ToolID] = {}
+    pending: List[Filament] = []
+
+    for f in job.filaments:
+        if free.get(f.tool) == _key(f):
+            del free[f.tool]
+        else:
+            pending.append(f)
+
+    reloads = 0
+    for f in pending:
+        want = _key(f)
+        lane = next((t for t, k in sorted(free.items()) if k == want), None)
+        if lane is None:
+            reloads += 1
+            continue
+        del free[lane]
+        remap[f.tool] = lane
+
+    matched = len(job.filaments) - reloads
+    if len(job.filaments) > printer.tools:
+        cost = INFEASIBLE
+    else:
+        cost = reloads * RELOAD_COST + len(remap) * REMAP_COST
+
+    return PairScore(
+        job_id=job.id,
+        printer_id=printer.id,
+        matched=matched,
+        reloads=reloads,
+        remap=remap,
+        cost=cost,
+    )
+
+
+def assign_jobs(jobs: List[Job], printers: List[PrinterLoadout]) -> List[Assignment]:
+    """Assign at most one job per printer so total reloads are minimal.
+
+    Jobs left without a printer (more jobs than printers, or no printer with
+    enough lanes) come back with ``printer_id=None``.
+    """
+    scores = [[score_pair(j, p) for p in printers] for j in jobs]
+    cost = [[s.cost for s in row] for row in scores]
+
+    result: List[Assignment] = []
+    for j, p in solve_assignment(cost):
+        if p is None:
+            result.append(Assignment(job_id=jobs[j].id, printer_id=None))
+            continue
+        s = scores[j][p]
+        result.append(
+            Assignment(
+                job_id=s.job_id,
+                printer_id=s.printer_id,
+                matched=s.matched,
+                reloads=s.reloads,
+                remap=s.remap,
+            )
+        )
+    return result
+
+
+def plan_assignments(jobs: List[Dict], printers: List[Dict] | None = None) -> Dict:
+    default_tools = mmu_manager.get_capabilities()["tools"]
+    if printers is None:
+        printers = [{"id": "local", "filaments": mmu_manager.get_filaments()}]
+
+    job_objs = [
+        Job(id=str(j["id"]), filaments=[_filament(f) for f in j.get("filaments", [])])
+        for j in jobs
+    ]
+    printer_objs = [
+        PrinterLoadout(
+            id=str(p["id"]),
+            filaments=[_filament(f) for f in p.get("filaments", [])],
+            tools=int(p.get("tools", default_tools)),
+        )
+        for p in printers
+    ]
+
+    assignments = assign_jobs(job_objs, printer_objs)
+    return {
+        "assignments": [asdict(a) for a in assignments],
+        "total_reloads": sum(a.reloads for a in assignments if a.printer_id),
+        "unassigned": [a.job_id for a in assignments if a.printer_id is None],
+    }
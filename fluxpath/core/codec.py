@@ -0,0 +1,166 @@
+# /home/syko/FluxPath/fluxpath/core/codec.py
+#
+# WebSocket frame encodings. Clients choose one with a subprotocol
+# (Sec-WebSocket-Protocol: fluxpath.msgpack, fluxpath.cbor, fluxpath.json)
+# or ?encoding=msgpack|cbor|json; JSON text frames stay the default.
+# Binary encodings also replace well-known keys with their index in
+# KEY_TABLE, which is sent to the client as the first frame.
+# msgpack and cbor2 are optional: without them only JSON is offered.
+# Installed ones are imported by the first frame that uses them.
+
+import json
+from enum import Enum
+from importlib.util import find_spec
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+KEYS_VERSION = 1
+
+# Append-only: a key's position is its id on the wire.
+KEY_TABLE = (
+    # frame envelope
+    "type", "msg", "source", "status",
+    # MMU controller status
+    "mmu_status", "state", "active_slot", "last_error", "slots",
+    "simulation", "updated_at", "index", "color", "has_filament",
+    "last_load_mm",
+    # printer_state["mmu"]
+    "mmu", "enabled", "filaments", "slot", "material", "job",
+    # device endpoint
+    "name", "fw", "sn", "tools", "caps", "tool", "color_hex",
+    "purge_strategy", "min_purge_volume", "max_purge_volume",
+)
+KEY_IDS: Dict[str, int] = {k: i for i, k in enumerate(KEY_TABLE)}
+
+# permessage-deflate for JSON text clients. Status frames are small and
+# repeat the same keys, so a modest window with context takeover gets
+# most of the gain; level 3 keeps per-frame CPU low on a Pi.
+DEFLATE_SETTINGS = {
+    "server_max_window_bits": 12,
+    "client_max_window_bits": 12,
+    "compress_settings": {"level": 3, "memLevel": 5},
+}
+
+
+def compact(obj: Any) -> Any:
+    """Replace known dict keys with KEY_TABLE ids, recursively."""
+    if isinstance(obj, dict):
+        return {KEY_IDS.get(k, k): compact(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [compact(v) for v in obj]
+    if isinstance(obj, Enum):
+        return obj.value
+    return obj
+
+
+def expand(obj: Any) -> Any:
+    """Inverse of ``compact`` (for Python clients and tests)."""
+    if isinstance(obj, dict):
+        return {
+            (KEY_TABLE[k] if isinstance(k, int) and 0 <= k < len(KEY_TABLE) else k): expand(v)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [expand(v) for v in obj]
+    return obj
+
+
+class Codec:
+    def __init__(self, name: str, dumps: Callable[[Any], Any], binary: bool, keyed: bool) -> None:
+        self.name = name
+        self.subprotocol = f"fluxpath.{name}"
+        self.binary = binary
+        self.keyed = keyed
+        self._dumps = dumps
+
+    def encode(self, obj: Any) -> Any:
+        return self._dumps(compact(obj) if self.keyed else obj)
+
+    async def send_hello(self, websocket) -> None:
+        """First frame of a keyed connection: the key table, uncompacted."""
+        if self.keyed:
+            await websocket.send_bytes(self._dumps({
+                "type": "hello",
+                "encoding": self.name,
+                "keys_version": KEYS_VERSION,
+                "keys": list(KEY_TABLE),
+            }))
+
+    async def send(self, websocket, obj: Any, frame: Any = None) -> None:
+        """Send ``obj`` (or an already-encoded ``frame``) on a Starlette websocket."""
+        if frame is None:
+            frame = self.encode(obj)
+        if self.binary:
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+def _msgpack_dumps(obj: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(obj, default=str)
+
+
+def _cbor_dumps(obj: Any) -> bytes:
+    import cbor2
+
+    return cbor2.dumps(obj, default=lambda enc, v: enc.encode(str(v)))
+
+
+CODECS: Dict[str, Codec] = {"json": Codec("json", _json_dumps, binary=False, keyed=False)}
+if find_spec("msgpack") is not None:
+    CODECS["msgpack"] = Codec("msgpack", _msgpack_dumps, binary=True, keyed=True)
+if find_spec("cbor2") is not None:
+    CODECS["cbor"] = Codec("cbor", _cbor_dumps, binary=True, keyed=True)
+
+JSON = CODECS["json"]
+
+
+def negotiate(websocket) -> Tuple[Codec, Optional[str]]:
+    """Pick the codec for a connection.
+
+    Returns the codec and the subprotocol to pass to ``accept`` (None
+    when the client did not ask for one). ``?encoding=`` wins over the
+    subprotocol list; unknown or unavailable encodings fall back to JSON.
+    """
+    offered = [
+        p.strip()
+        for p in websocket.headers.get("sec-websocket-protocol", "").split(",")
+        if p.strip()
+    ]
+    wanted = websocket.query_params.get("encoding")
+    if wanted:
+        codec = CODECS.get(wanted.lower(), JSON)
+    else:
+        codec = next(
+            (c for p in offered for c in CODECS.values() if c.subprotocol == p),
+            JSON,
+        )
+    return codec, (codec.subprotocol if codec.subprotocol in offered else None)
+
+
+class FrameCache:
+    """Encodes a shared message once per codec, however many clients send it.
+
+    ``key`` identifies the message content (e.g. event bus versions);
+    ``build`` is only called when the key changes.
+    """
+
+    def __init__(self) -> None:
+        self._key: Hashable = object()
+        self._msg: Any = None
+        self._frames: Dict[str, Any] = {}
+
+    def get(self, key: Hashable, codec: Codec, build: Callable[[], Any]) -> Any:
+        if key != self._key:
+            self._key = key
+            self._msg = build()
+            self._frames = {}
+        frame = self._frames.get(codec.name)
+        if frame is None:
+            frame = self._frames[codec.name] = codec.encode(self._msg)
+        return frame
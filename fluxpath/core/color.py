@@ -0,0 +1,109 @@
+# /home/syko/FluxPath/fluxpath/core/color.py
+
+import math
+from typing import Tuple
+
+Lab = Tuple[float, float, float]
+
+# D65 reference white
+_XN, _YN, _ZN = 0.95047, 1.0, 1.08883
+
+# What hex_to_rgb accepts: RGB, RRGGBB or RRGGBBAA, "#" optional.
+COLOR_HEX_PATTERN = r"^#?([0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$"
+
+
+def hex_to_rgb(color_hex: str) -> Tuple[int, int, int]:
+    h = color_hex.strip().lstrip("#")
+    if len(h) == 3:
+        h = "".join(c * 2 for c in h)
+    if len(h) == 8:
+        # RRGGBBAA from Orca/Bambu filament presets; alpha is irrelevant here.
+        h = h[:6]
+    if len(h) != 6 or not all(c in "0123456789abcdefABCDEF" for c in h):
+        raise ValueError(f"Invalid color hex: {color_hex!r}")
+    return int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+
+
+def _srgb_to_linear(c: float) -> float:
+    c /= 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def _lab_f(t: float) -> float:
+    return t ** (1.0 / 3.0) if t > 216.0 / 24389.0 else (24389.0 / 27.0 * t + 16.0) / 116.0
+
+
+def hex_to_lab(color_hex: str) -> Lab:
+    r, g, b = (_srgb_to_linear(c) for c in hex_to_rgb(color_hex))
+    x = 0.4124564 * r + 0.3575761 * g + 0.1804375 * b
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = 0.0193339 * r + 0.1191920 * g + 0.9503041 * b
+    fx, fy, fz = _lab_f(x / _XN), _lab_f(y / _YN), _lab_f(z / _ZN)
+    return 116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)
+
+
+def ciede2000(lab1: Lab, lab2: Lab) -> float:
+    """CIEDE2000 color difference (kL = kC = kH = 1).
+
+    Roughly: < 1 is invisible, 1-2 needs a trained eye, > 10 is a different
+    color.
+    """
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+
+    c_bar = (math.hypot(a1, b1) + math.hypot(a2, b2)) / 2.0
+    c_bar7 = c_bar ** 7
+    g = 0.5 * (1.0 - math.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p, a2p = a1 * (1.0 + g), a2 * (1.0 + g)
+    c1p, c2p = math.hypot(a1p, b1), math.hypot(a2p, b2)
+    h1p = math.degrees(math.atan2(b1, a1p)) % 360.0 if c1p else 0.0
+    h2p = math.degrees(math.atan2(b2, a2p)) % 360.0 if c2p else 0.0
+
+    dLp = L2 - L1
+    dCp = c2p - c1p
+    if c1p * c2p == 0.0:
+        dhp = 0.0
+    elif abs(h2p - h1p) <= 180.0:
+        dhp = h2p - h1p
+    elif h2p - h1p > 180.0:
+        dhp = h2p - h1p - 360.0
+    else:
+        dhp = h2p - h1p + 360.0
+    dHp = 2.0 * math.sqrt(c1p * c2p) * math.sin(math.radians(dhp) / 2.0)
+
+    L_bar = (L1 + L2) / 2.0
+    c_bar_p = (c1p + c2p) / 2.0
+    if c1p * c2p == 0.0:
+        h_bar_p = h1p + h2p
+    elif abs(h1p - h2p) <= 180.0:
+        h_bar_p = (h1p + h2p) / 2.0
+    elif h1p + h2p < 360.0:
+        h_bar_p = (h1p + h2p + 360.0) / 2.0
+    else:
+        h_bar_p = (h1p + h2p - 360.0) / 2.0
+
+    t = (
+        1.0
+        - 0.17 * math.cos(math.radians(h_bar_p - 30.0))
+        + 0.24 * math.cos(math.radians(2.0 * h_bar_p))
+        + 0.32 * math.cos(math.radians(3.0 * h_bar_p + 6.0))
+        - 0.20 * math.cos(math.radians(4.0 * h_bar_p - 63.0))
+    )
+    d_theta = 30.0 * math.exp(-(((h_bar_p - 275.0) / 25.0) ** 2))
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2.0 * math.sqrt(c_bar_p7 / (c_bar_p7 + 25.0 ** 7))
+    s_l = 1.0 + (0.015 * (L_bar - 50.0) ** 2) / math.sqrt(20.0 + (L_bar - 50.0) ** 2)
+    s_c = 1.0 + 0.045 * c_bar_p
+    s_h = 1.0 + 0.015 * c_bar_p * t
+    r_t = -math.sin(math.radians(2.0 * d_theta)) * r_c
+
+    return math.sqrt(
+        (dLp / s_l) ** 2
+        + (dCp / s_c) ** 2
+        + (dHp / s_h) ** 2
+        + r_t * (dCp / s_c) * (dHp / s_h)
+    )
+
+
+def color_distance(hex1: str, hex2: str) -> float:
+    return ciede2000(hex_to_lab(hex1), hex_to_lab(hex2))
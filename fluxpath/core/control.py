@@ -0,0 +1,136 @@
+# /home/syko/FluxPath/fluxpath/core/control.py
+
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from fp_core.logs import log_context, new_command_id
+
+from .events import event_bus
+
+log = logging.getLogger(__name__)
+
+CONTROL_SOCKET = Path(
+    os.environ.get("FLUXPATH_CONTROL_SOCKET", Path.home() / "FluxPath" / "run" / "fluxpath.sock")
+)
+
+
+class ControlServer:
+    """Local JSON-lines RPC over a Unix domain socket.
+
+    Request:  ``{"id": 1, "method": "mmu.status", "params": {}}``
+    Response: ``{"id": 1, "ok": true, "data": {...}}`` or
+              ``{"id": 1, "ok": false, "error": "..."}``
+
+    ``watch`` keeps the connection open and streams
+    ``{"event": topic, "data": {...}}`` lines for the requested topics of
+    the shared event bus.
+    Blocking handlers run in the default executor so motion commands don't
+    stall the event loop.
+    """
+
+    def __init__(self, path: Path = CONTROL_SOCKET) -> None:
+        self.path = Path(path)
+        self._methods: Dict[str, Callable[..., Any]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def register(self, name: str, fn: Callable[..., Any]) -> None:
+        self._methods[name] = fn
+
+    def method(self, name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+            self.register(name, fn)
+            return fn
+        return deco
+
+    # -------------------------------------------------
+    # Server
+    # -------------------------------------------------
+    async def start(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self.path))
+        os.chmod(self.path, 0o660)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self.path.exists():
+            self.path.unlink()
+
+    async def _call(self, method: str, params: Dict) -> Any:
+        fn = self._methods.get(method)
+        if fn is None:
+            raise KeyError(f"Unknown method {method!r}")
+        if inspect.iscoroutinefunction(fn):
+            return await fn(**params)
+        # Executor threads don't inherit context vars; carry the command ID.
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: ctx.run(fn, **params))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                    method = req.get("method", "")
+                    params = req.get("params") or {}
+                except ValueError:
+                    await self._send(writer, {"id": None, "ok": False, "error": "invalid JSON"})
+                    continue
+
+                if method == "watch":
+                    await self._watch(req.get("id"), params, reader, writer)
+                    break
+
+                with log_context(command_id=req.get("command_id") or new_command_id("ctl")):
+                    try:
+                        data = await self._call(method, params)
+                        resp = {"id": req.get("id"), "ok": True, "data": data}
+                    except Exception as e:
+                        log.warning("control method %s failed: %s", method, e)
+                        resp = {"id": req.get("id"), "ok": False, "error": str(e) or type(e).__name__}
+                await self._send(writer, resp)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _watch(self, req_id: Any, params: Dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        topics = params.get("topics") or []
+        with event_bus.subscribe(topics) as sub:
+            # Initial state so watchers don't wait for the first change.
+            initial = params.get("initial")
+            if initial:
+                try:
+                    data = await self._call(initial, {})
+                    await self._send(writer, {"id": req_id, "event": topics[0] if topics else initial, "data": data})
+                except Exception as e:
+                    await self._send(writer, {"id": req_id, "ok": False, "error": str(e)})
+            closed = asyncio.ensure_future(reader.read())
+            while True:
+                get = asyncio.ensure_future(sub.get())
+                done, _ = await asyncio.wait({get, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    get.cancel()
+                    break
+                await self._send(writer, dict(get.result(), id=req_id))
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, msg: Dict) -> None:
+        writer.write(json.dumps(msg, separators=(",", ":"), default=str).encode() + b"\n")
+        await writer.drain()
+
+
+control_server = ControlServer()
@@ -0,0 +1,94 @@
+# /home/syko/FluxPath/fluxpath/core/events.py
+
+import asyncio
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", topics: Iterable[str], maxsize: int) -> None:
+        self._bus = bus
+        self.topics = list(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def _offer(self, msg: Dict) -> None:
+        if self.queue.full():
+            # Slow consumer: drop the oldest update, keep the newest.
+            self.queue.get_nowait()
+        self.queue.put_nowait(msg)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Next ``{"event", "data"}`` message, or None after ``timeout``."""
+        if timeout is None:
+            return await self.queue.get()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self._bus._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class EventBus:
+    """In-process pub/sub shared by every API surface.
+
+    ``publish`` is safe to call from worker threads (the MMU controller
+    publishes from request threads); delivery always happens on the event
+    loop the bus was bound to. The last message per topic is kept so new
+    subscribers and pollers can read current state without waiting.
+    """
+
+    def __init__(self) -> None:
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._latest: Dict[str, Any] = {}
+        self._versions: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+
+    def latest(self, topic: str, default: Any = None) -> Any:
+        return self._latest.get(topic, default)
+
+    def version(self, topic: str) -> int:
+        """Number of publishes on ``topic``; a cheap cache key for its content."""
+        return self._versions.get(topic, 0)
+
+    def publish(self, topic: str, data: Any) -> None:
+        self._latest[topic] = data
+        self._versions[topic] = self._versions.get(topic, 0) + 1
+        loop = self._loop
+        if loop is None or not self._subs.get(topic):
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(topic, data)
+        else:
+            loop.call_soon_threadsafe(self._fanout, topic, data)
+
+    def _fanout(self, topic: str, data: Any) -> None:
+        msg = {"event": topic, "data": data}
+        for sub in list(self._subs.get(topic, ())):
+            sub._offer(msg)
+
+    def subscribe(self, topics: Iterable[str], maxsize: int = 16) -> Subscription:
+        sub = Subscription(self, topics, maxsize)
+        for t in sub.topics:
+            self._subs.setdefault(t, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub: Subscription) -> None:
+        for t in sub.topics:
+            self._subs.get(t, set()).discard(sub)
+
+
+event_bus = EventBus()
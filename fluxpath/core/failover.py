@@ -0,0 +1,143 @@
+# /home/syko/FluxPath/fluxpath/core/failover.py
+#
+# Runout failover. For every lane the backend picks a substitute: another
+# loaded lane with exactly the same material and a color within
+# RUNOUT_MAX_DELTA_E (CIEDE2000), preferring the closest color and then
+# the fuller spool. The table is pushed into MMU_VARS.runout_backup so
+# MMU_RUNOUT can switch lanes inside Klipper the moment the sensor fires,
+# without a round trip to the backend; it only PAUSEs when a lane has no
+# substitute. Klipper reports run-out lanes (MMU_VARS.empty) and the
+# remapped tools (MMU_VARS.tool_map) back through the Moonraker probe.
+
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from .color import color_distance, hex_to_rgb
+from .mmu import ToolID, mmu_manager
+from .slotmap import VISIBLE_DELTA_E, material_match
+from .spools import spool_tracker
+
+RUNOUT_MAX_DELTA_E = float(os.environ.get("FLUXPATH_RUNOUT_MAX_DELTA_E", VISIBLE_DELTA_E))
+
+log = logging.getLogger(__name__)
+
+# (lane, color) pairs already reported as unreadable.
+_bad_colors: Set[Tuple[ToolID, str]] = set()
+
+
+def _color_ok(f: Dict) -> bool:
+    try:
+        hex_to_rgb(f["color_hex"])
+    except (ValueError, AttributeError):
+        key = (int(f["tool"]), str(f["color_hex"]))
+        if key not in _bad_colors:
+            _bad_colors.add(key)
+            log.warning("FluxPath failover: lane %s has unreadable color %r; no substitute for or with it", *key)
+        return False
+    return True
+
+
+@dataclass
+class Substitute:
+    lane: ToolID
+    backup: Optional[ToolID]
+    delta_e: Optional[float] = None
+    reason: Optional[str] = None
+
+
+def runout_backups(
+    filaments: List[Dict],
+    empty: frozenset = frozenset(),
+    remaining: Optional[Dict[ToolID, float]] = None,
+    max_delta_e: float = RUNOUT_MAX_DELTA_E,
+) -> List[Substitute]:
+    """Best substitute lane for each loaded lane (tool numbers)."""
+    remaining = remaining or {}
+    out: List[Substitute] = []
+    readable = [f for f in filaments if _color_ok(f)]
+    for f in filaments:
+        lane = int(f["tool"])
+        if f not in readable:
+            out.append(Substitute(lane, None, reason=f"unreadable color {f['color_hex']!r}"))
+            continue
+        best = None
+        for g in readable:
+            other = int(g["tool"])
+            if other == lane or other in empty or remaining.get(other) == 0:
+                continue
+            if material_match(f["material"], g["material"]) != "exact":
+                continue
+            de = color_distance(f["color_hex"], g["color_hex"])
+            if de > max_delta_e:
+                continue
+            key = (round(de, 1), -remaining.get(other, 0.0))
+            if best is None or key < best[0]:
+                best = (key, other, de)
+        if best is None:
+            out.append(Substitute(lane, None, reason=f"no {f['material']} lane within dE {max_delta_e:g}"))
+        else:
+            out.append(Substitute(lane, best[1], round(best[2], 2)))
+    return sorted(out, key=lambda s: s.lane)
+
+
+class RunoutFailover:
+    """Keeps Klipper's runout_backup table in step with the loaded lanes."""
+
+    def __init__(self) -> None:
+        self._table: List[Substitute] = []
+        self._empty: frozenset = frozenset()
+        self._tool_map: Optional[List[int]] = None
+
+    def table(self) -> Dict:
+        self.compute()
+        return {
+            "max_delta_e": RUNOUT_MAX_DELTA_E,
+            "backups": [asdict(s) for s in self._table],
+            "empty": sorted(self._empty),
+            "tool_map": self._tool_map,
+        }
+
+    def compute(self) -> List[Substitute]:
+        remaining = {s["lane"]: s["remaining_mm"] for s in spool_tracker.spools()}
+        self._table = runout_backups(mmu_manager.get_filaments(), self._empty, remaining)
+        return self._table
+
+    def sync(self, mmu_vars: Optional[Dict], printing: bool) -> Optional[str]:
+        """Fold in Klipper's view (``gcode_macro MMU_VARS``) and return the
+        G-code that brings it up to date, or None.
+
+        A remap only lasts for the job that needed it; once the printer is
+        idle again the tool map is reset.
+        """
+        if not mmu_vars or "runout_backup" not in mmu_vars:
+            return None  # Klipper down or macros without failover support
+
+        # Klipper lanes are 1-based; the backend uses tool numbers.
+        empty = frozenset(i for i, e in enumerate(mmu_vars.get("empty") or []) if e)
+        for lane in empty - self._empty:
+            spool_tracker.mark_empty(lane)
+        self._empty = empty
+
+        tool_map = mmu_vars.get("tool_map")
+        if tool_map and tool_map != self._tool_map:
+            self._tool_map = list(tool_map)
+            spool_tracker.set_tool_map({t: int(l) - 1 for t, l in enumerate(tool_map)})
+
+        if tool_map and not printing and list(tool_map) != list(range(1, len(tool_map) + 1)):
+            return "MMU_RESET_TOOL_MAP"
+
+        lanes = len(mmu_vars["runout_backup"])
+        wanted = [0] * lanes
+        for s in self.compute():
+            if s.backup is not None and s.lane < lanes and s.backup < lanes:
+                wanted[s.lane] = s.backup + 1
+        if list(mmu_vars["runout_backup"]) == wanted:
+            return None
+        return "SET_GCODE_VARIABLE MACRO=MMU_VARS VARIABLE=runout_backup VALUE=[{0}]".format(
+            ",".join(str(b) for b in wanted)
+        )
+
+
+runout_failover = RunoutFailover()
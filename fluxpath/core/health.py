@@ -0,0 +1,279 @@
+# /home/syko/FluxPath/fluxpath/core/health.py
+#
+# Deep health checks behind GET /health/deep. Every probe runs in the
+# background on its own interval (blocking probes in the executor, with a
+# timeout) and its last result is cached; the route and the control
+# socket only read the cache, so a monitor polling every second costs
+# nothing but a dict build. A cached result older than its TTL is
+# reported as stale -- the probe itself is hung or the loop is starved.
+#
+# Probes are pluggable: ``health_monitor.register(name, fn, ...)`` with a
+# function returning {"ok": bool, ...} (sync or async). Critical probes
+# turn the overall status to "fail" (HTTP 503); the rest to "degraded".
+
+import asyncio
+import inspect
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .events import event_bus
+from .journal import STATE_DIR
+from .status import PROBE_TIMEOUT, probe_moonraker, status_aggregator
+
+MIN_FREE_MB = float(os.environ.get("FLUXPATH_HEALTH_MIN_FREE_MB", "500"))
+LOOP_LAG_WARN = float(os.environ.get("FLUXPATH_HEALTH_LOOP_LAG", "0.25"))
+SENSOR_MAX_AGE = float(os.environ.get("FLUXPATH_HEALTH_SENSOR_MAX_AGE", "60"))
+LAG_SAMPLE = 0.5
+LAG_WINDOW = 20
+
+MOVING_STATES = ("loading", "unloading", "toolchange")
+
+
+@dataclass
+class Probe:
+    name: str
+    fn: Callable[[], Any]
+    interval: float
+    ttl: float
+    timeout: float
+    critical: bool = True
+    result: Dict[str, Any] = field(default_factory=lambda: {"ok": None, "error": "not probed yet"})
+    checked_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+
+    def report(self, now: float) -> Dict[str, Any]:
+        age = None if self.checked_at is None else round(now - self.checked_at, 3)
+        return dict(
+            self.result,
+            critical=self.critical,
+            checked_at=self.checked_at,
+            age_s=age,
+            stale=age is None or age > self.ttl,
+            duration_ms=self.duration_ms,
+        )
+
+
+class HealthMonitor:
+    """Runs registered probes in the background and serves cached results."""
+
+    def __init__(self) -> None:
+        self._probes: Dict[str, Probe] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, name: str, fn: Callable[[], Any], interval: float = 10.0, ttl: Optional[float] = None,
+                 timeout: float = PROBE_TIMEOUT * 2, critical: bool = True) -> None:
+        """Add or replace a probe. ``ttl`` defaults to three intervals."""
+        self._probes[name] = Probe(name, fn, interval, ttl if ttl is not None else interval * 3 + timeout,
+                                   timeout, critical)
+
+    def probes(self) -> List[str]:
+        return list(self._probes)
+
+    async def check(self, probe: Probe) -> None:
+        started = time.monotonic()
+        try:
+            if inspect.iscoroutinefunction(probe.fn):
+                result = await asyncio.wait_for(probe.fn(), probe.timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await asyncio.wait_for(loop.run_in_executor(None, probe.fn), probe.timeout)
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"timed out after {probe.timeout:g}s"}
+        except Exception as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        probe.result = result
+        probe.checked_at = time.time()
+        probe.duration_ms = round((time.monotonic() - started) * 1000, 1)
+
+    async def _run(self, probe: Probe) -> None:
+        while True:
+            started = time.monotonic()
+            await self.check(probe)
+            await asyncio.sleep(max(0.0, probe.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._run(p)) for p in self._probes.values()]
+        self._tasks.append(asyncio.ensure_future(loop_lag.run()))
+        self._tasks.append(asyncio.ensure_future(sensor_watch.run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def report(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        now = time.time()
+        probes = {n: p.report(now) for n, p in self._probes.items() if names is None or n in names}
+        status = "ok"
+        for r in probes.values():
+            if r["ok"] is False or r["stale"]:
+                if r["critical"] and r["ok"] is False:
+                    status = "fail"
+                    break
+                status = "degraded"
+        return {"status": status, "checked_at": now, "probes": probes}
+
+
+# ---------------------------------------------------------
+# Samplers feeding the loop-lag and sensor probes
+# ---------------------------------------------------------
+class LoopLag:
+    """How late the event loop wakes from a short sleep (recent window)."""
+
+    def __init__(self) -> None:
+        self.samples: List[float] = []
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_SAMPLE)
+            self.samples = (self.samples + [time.monotonic() - started - LAG_SAMPLE])[-LAG_WINDOW:]
+
+    def probe(self) -> Dict[str, Any]:
+        if not self.samples:
+            return {"ok": None, "error": "no samples yet"}
+        worst = max(self.samples)
+        return {"ok": worst < LOOP_LAG_WARN, "lag_ms": round(self.samples[-1] * 1000, 1),
+                "max_lag_ms": round(worst * 1000, 1), "limit_ms": LOOP_LAG_WARN * 1000}
+
+
+class SensorWatch:
+    """Last sensor report per lane, taken from ``mmu_event`` edges."""
+
+    def __init__(self) -> None:
+        self.seen: Dict[int, float] = {}
+
+    async def run(self) -> None:
+        with event_bus.subscribe(["mmu_event"], maxsize=64) as sub:
+            while True:
+                msg = await sub.get()
+                if msg is not None and msg["data"].get("kind") == "sensor":
+                    self.seen[msg["data"]["slot"]] = msg["data"]["t"]
+
+    def probe(self) -> Dict[str, Any]:
+        """Fails when a lane has been moving for SENSOR_MAX_AGE without a
+        single sensor report -- the sensor feed from Klipper is dead."""
+        now = time.time()
+        ages = {str(slot): round(now - t, 1) for slot, t in sorted(self.seen.items())}
+        mmu = event_bus.latest("mmu_status")
+        if mmu is None:
+            return {"ok": None, "last_report_s": ages, "error": "no MMU status yet"}
+        moving_since = mmu.get("updated_at") or now
+        last = max(self.seen.values(), default=0.0)
+        stuck = (mmu["state"] in MOVING_STATES and not mmu.get("simulation")
+                 and last < moving_since and now - moving_since > SENSOR_MAX_AGE)
+        result = {"ok": not stuck, "mmu_state": mmu["state"], "last_report_s": ages}
+        if stuck:
+            result["error"] = f"no sensor report for {now - moving_since:.0f}s while {mmu['state']}"
+        return result
+
+
+loop_lag = LoopLag()
+sensor_watch = SensorWatch()
+
+
+# ---------------------------------------------------------
+# Built-in probes
+# ---------------------------------------------------------
+def _printer_info() -> Dict[str, Any]:
+    # The status aggregator polls /printer/info every few seconds already;
+    # only ask Moonraker ourselves when its result is not recent.
+    cached, age = status_aggregator.external("printer")
+    if age is not None and age <= status_aggregator.interval * 2:
+        return cached
+    return probe_moonraker()
+
+
+def probe_moonraker_reachable() -> Dict[str, Any]:
+    r = _printer_info()
+    return {"ok": True} if r["ok"] else {"ok": False, "error": r.get("error")}
+
+
+def probe_klipper_ready() -> Dict[str, Any]:
+    r = _printer_info()
+    if not r["ok"]:
+        return {"ok": False, "error": "moonraker unreachable"}
+    info = r["info"]
+    state = info.get("state")
+    result = {"ok": state == "ready", "state": state}
+    if state != "ready":
+        result["error"] = (info.get("state_message") or "").strip() or f"klipper {state}"
+    return result
+
+
+def probe_mmu() -> Dict[str, Any]:
+    from backend.mmu import routes as mmu_routes
+
+    try:
+        snap = mmu_routes.get_mmu().snapshot()
+    except RuntimeError as e:
+        return {"ok": False, "error": str(e)}
+    result = {"ok": snap.state.value != "error", "state": snap.state.value, "simulation": snap.simulation}
+    if snap.last_error:
+        result["error"] = snap.last_error
+    return result
+
+
+def _existing(path: Path) -> Path:
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return path
+
+
+def probe_disk() -> Dict[str, Any]:
+    paths = {"state": STATE_DIR, "home": Path.home()}
+    override = os.environ.get("FLUXPATH_TELEMETRY_DIR")
+    if override:
+        paths["telemetry"] = Path(override)
+    volumes: Dict[str, Dict[str, Any]] = {}
+    ok = True
+    for label, path in paths.items():
+        usage = shutil.disk_usage(_existing(path))
+        free_mb = usage.free / 1e6
+        ok = ok and free_mb >= MIN_FREE_MB
+        volumes[label] = {"path": str(path), "free_mb": round(free_mb), "used_pct": round(100 * usage.used / usage.total, 1)}
+    return {"ok": ok, "min_free_mb": MIN_FREE_MB, "volumes": volumes}
+
+
+def probe_instance_services() -> Dict[str, Any]:
+    from fp_core.instances import load_instances
+
+    units = []
+    for inst in load_instances():
+        units.append(inst.service_name)
+        if inst.moonraker_service:
+            units.append(inst.moonraker_service)
+    if not units:
+        return {"ok": True, "services": {}}
+    if shutil.which("systemctl") is None:
+        return {"ok": None, "error": "systemctl not available"}
+    # One call for every unit; is-active prints one state per line.
+    out = subprocess.run(["systemctl", "is-active", *units], capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    states = dict(zip(units, out.stdout.split()))
+    down = [u for u in units if states.get(u) != "active"]
+    result = {"ok": not down, "services": states}
+    if down:
+        result["error"] = "inactive: " + ", ".join(down)
+    return result
+
+
+health_monitor = HealthMonitor()
+health_monitor.register("moonraker", probe_moonraker_reachable, interval=5.0)
+health_monitor.register("klipper", probe_klipper_ready, interval=5.0)
+health_monitor.register("mmu", probe_mmu, interval=5.0)
+health_monitor.register("sensors", sensor_watch.probe, interval=5.0, critical=False)
+health_monitor.register("event_loop", loop_lag.probe, interval=5.0, critical=False)
+health_monitor.register("disk", probe_disk, interval=60.0, critical=False)
+health_monitor.register("instances", probe_instance_services, interval=30.0, critical=False)
@@ -5,6 +5,8 @@ from typing import Dict, List
 import uuid
 import threading
 
+from .events import event_bus
+
 @dataclass
 class Instance:
     id: str
@@ -25,7 +27,9 @@ class InstanceManager:
             inst_id = str(uuid.uuid4())
             inst = Instance(id=inst_id, name=name, status="idle")
             self._instances[inst_id] = inst
-            return asdict(inst)
+            created = asdict(inst)
+        event_bus.publish("instances", self.list_instances())
+        return created
 
     def get_instance(self, inst_id: str) -> Dict | None:
         with self._lock:
@@ -38,6 +42,8 @@ class InstanceManager:
             if not inst:
                 return None
             inst.status = status
-            return asdict(inst)
+            updated = asdict(inst)
+        event_bus.publish("instances", self.list_instances())
+        return updated
 
 instance_manager = InstanceManager()
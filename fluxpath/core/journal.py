@@ -0,0 +1,202 @@
+# /home/syko/FluxPath/fluxpath/core/journal.py
+
+import json
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+STATE_DIR = Path(os.environ.get("FLUXPATH_STATE_DIR", Path.home() / "FluxPath" / "state"))
+
+# How long a record may sit in the page cache before it is fsynced. Records
+# written inside one window share a single fsync.
+FSYNC_INTERVAL = 0.05
+# Journal records between compact snapshots.
+SNAPSHOT_EVERY = 500
+
+
+class StateJournal:
+    """Append-only, crash-safe key/value state log.
+
+    Every ``record(key, value)`` appends one JSON line ``{seq, key, value,
+    crc}`` and replaces the in-memory value for ``key``. A background
+    thread batches fsyncs; every ``SNAPSHOT_EVERY`` records the full state
+    is written to a snapshot (tmp + fsync + rename) and the journal is
+    truncated. On open, the snapshot is loaded and the journal tail is
+    replayed up to the first torn or corrupt line.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: Path = STATE_DIR,
+        fsync_interval: float = FSYNC_INTERVAL,
+        snapshot_every: int = SNAPSHOT_EVERY,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.journal_path = self.directory / f"{name}.journal"
+        self.snapshot_path = self.directory / f"{name}.snapshot.json"
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()
+        self._state: Dict[str, Any] = {}
+        self._seq = 0
+        self._since_snapshot = 0
+        self._dirty = False
+        self._closed = False
+        self._wake = threading.Event()
+
+        self._replay()
+        self._fh = open(self.journal_path, "ab", buffering=0)
+        self._syncer = threading.Thread(target=self._sync_loop, name=f"journal-{name}", daemon=True)
+        self._syncer.start()
+
+    # -------------------------------------------------
+    # Replay
+    # -------------------------------------------------
+    def _replay(self) -> None:
+        snap_seq = 0
+        if self.snapshot_path.exists():
+            try:
+                snap = json.loads(self.snapshot_path.read_text())
+                self._state = snap.get("state", {})
+                snap_seq = int(snap.get("seq", 0))
+            except (ValueError, OSError):
+                self._state = {}
+        self._seq = snap_seq
+
+        if not self.journal_path.exists():
+            return
+
+        good_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                rec = self._decode(line)
+                if rec is None:
+                    break
+                good_bytes += len(line)
+                if rec["seq"] <= snap_seq:
+                    continue
+                self._state[rec["key"]] = rec["value"]
+                self._seq = rec["seq"]
+                self._since_snapshot += 1
+
+        # Drop a torn tail so new records don't land after garbage.
+        if good_bytes != self.journal_path.stat().st_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good_bytes)
+
+    @staticmethod
+    def _encode(seq: int, key: str, value: Any) -> bytes:
+        body = json.dumps({"seq": seq, "key": key, "value": value}, separators=(",", ":"), sort_keys=True)
+        return f"{zlib.crc32(body.encode()):08x} {body}\n".encode()
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[Dict]:
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            crc, body = line[:-1].split(b" ", 1)
+            if int(crc, 16) != zlib.crc32(body):
+                return None
+            return json.loads(body)
+        except ValueError:
+            return None
+
+    # -------------------------------------------------
+    # Writes
+    # -------------------------------------------------
+    @property
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._state)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._state.get(key, default)
+
+    def record(self, key: str, value: Any) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._seq += 1
+            self._state[key] = value
+            self._fh.write(self._encode(self._seq, key, value))
+            self._dirty = True
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every:
+                self._snapshot_locked()
+        self._wake.set()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._fsync_locked()
+
+    def snapshot(self) -> None:
+        with self._lock:
+            self._snapshot_locked()
+
+    def _fsync_locked(self) -> None:
+        if self._dirty and not self._closed:
+            os.fsync(self._fh.fileno())
+            self._dirty = False
+
+    def _snapshot_locked(self) -> None:
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"seq": self._seq, "state": self._state}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        _fsync_dir(self.directory)
+        # Everything up to _seq is in the snapshot; start a fresh journal.
+        self._fh.truncate(0)
+        self._fh.seek(0)
+        self._dirty = False
+        self._since_snapshot = 0
+
+    def _sync_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            # Let concurrent writers pile into the same fsync.
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                self._fsync_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            if self._since_snapshot:
+                self._snapshot_locked()
+            self._closed = True
+            self._fh.close()
+        self._wake.set()
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_journals: Dict[str, StateJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def state_journal(name: str) -> StateJournal:
+    with _journals_lock:
+        journal = _journals.get(name)
+        if journal is None:
+            journal = _journals[name] = StateJournal(name)
+        return journal
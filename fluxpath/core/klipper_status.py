@@ -0,0 +1,145 @@
+# /home/syko/FluxPath/fluxpath/core/klipper_status.py
+#
+# Pushes MMU state into Klipper as the variables of [gcode_macro
+# _FLUXPATH_MMU] (mmu/mmu_ui.cfg). Mainsail and Fluidd subscribe to every
+# printer object over the Moonraker websocket they already hold open, so
+# the MMU panels (ui/*_mmu_panel.json) get each change with the rest of
+# the printer status and no browser tab polls the backend. Only changed
+# variables are sent, one SET_GCODE_VARIABLE script in flight at a time
+# and always built from the newest state. Klipper resets macro variables
+# on restart; the status probe reads ``backend`` back every few seconds
+# (topic "klipper_mmu"), and when it is not what was sent last everything
+# is sent again.
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from .events import event_bus
+from .status import run_gcode
+
+log = logging.getLogger(__name__)
+
+MACRO = "_FLUXPATH_MMU"
+ENABLED = os.environ.get("FLUXPATH_KLIPPER_STATUS", "1") != "0"
+
+# A SET_GCODE_VARIABLE waits for Klipper's G-code queue, which a running
+# toolchange macro holds for its whole duration.
+SEND_TIMEOUT = 30.0
+
+# Klipper cuts a G-code line at the first # ; or * and splits the rest
+# with shlex; VALUE is single-quoted, so a ' would end it early.
+_ESCAPES = {"#": "\\u0023", ";": "\\u003b", "*": "\\u002a", "'": "\\u0027"}
+
+
+def klipper_literal(value: Any) -> str:
+    """``value`` as a Python literal (Klipper runs ast.literal_eval on
+    VALUE) that passes Klipper's G-code parser unchanged."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        text = json.dumps(value)
+        for ch, esc in _ESCAPES.items():
+            text = text.replace(ch, esc)
+        return text
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(klipper_literal(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ",".join(klipper_literal(str(k)) + ":" + klipper_literal(v) for k, v in value.items()) + "}"
+    raise TypeError(f"cannot send {type(value).__name__} to Klipper")
+
+
+def set_variables(variables: Dict[str, Any], macro: str = MACRO) -> str:
+    return "\n".join(
+        "SET_GCODE_VARIABLE MACRO={0} VARIABLE={1} VALUE='{2}'".format(macro, name, klipper_literal(value))
+        for name, value in variables.items()
+    )
+
+
+def mmu_variables() -> Dict[str, Any]:
+    """The macro's variables for the current MMU snapshot."""
+    from backend.mmu import routes as mmu_routes
+
+    try:
+        snap = mmu_routes.get_mmu().snapshot()
+    except RuntimeError as e:
+        return {"backend": "online", "state": "error", "last_error": str(e)}
+    return {
+        "backend": "online",
+        "state": snap.state.value,
+        "active_slot": snap.active_slot,
+        "last_error": snap.last_error,
+        "slots": snap.slots(),
+    }
+
+
+class KlipperStatusPublisher:
+    """Keeps ``gcode_macro _FLUXPATH_MMU`` in step with the MMU controller."""
+
+    def __init__(self) -> None:
+        self._sent: Dict[str, Any] = {}
+        self._ready = False
+        self._missing = False
+        self._failing = False
+        self._task: Optional[asyncio.Task] = None
+
+    def changes(self, wanted: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in wanted.items() if k not in self._sent or self._sent[k] != v}
+
+    def _send(self, variables: Dict[str, Any], timeout: float = SEND_TIMEOUT) -> bool:
+        if not run_gcode(set_variables(variables), timeout=timeout):
+            if not self._failing:
+                log.warning("FluxPath could not update gcode_macro %s in Klipper; retrying", MACRO)
+            self._failing = True
+            return False
+        if self._failing:
+            log.info("FluxPath gcode_macro %s updates resumed", MACRO)
+        self._failing = False
+        self._sent.update(variables)
+        return True
+
+    def observe(self, macro: Optional[Dict[str, Any]]) -> None:
+        """Fold in Klipper's copy of the macro (None: Klipper unreachable)."""
+        missing = macro is not None and "backend" not in macro
+        if missing and not self._missing:
+            log.warning("FluxPath: Klipper has no gcode_macro %s (include mmu/mmu_ui.cfg); "
+                        "MMU state is not published", MACRO)
+        self._missing = missing
+        self._ready = macro is not None and not missing
+        if self._ready and macro["backend"] != self._sent.get("backend"):
+            self._sent.clear()  # Klipper restarted with the config defaults
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.observe(event_bus.latest("klipper_mmu"))
+        with event_bus.subscribe(["mmu_status", "klipper_mmu"]) as sub:
+            while True:
+                if self._ready:
+                    changed = self.changes(await loop.run_in_executor(None, mmu_variables))
+                    if changed:
+                        await loop.run_in_executor(None, self._send, changed)
+                msg = await sub.get()
+                if msg["event"] == "klipper_mmu":
+                    self.observe(msg["data"])
+
+    def start(self) -> None:
+        if ENABLED and self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._ready:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._send, {"backend": "offline"}, 2.0)
+
+
+klipper_status = KlipperStatusPublisher()
@@ -0,0 +1,84 @@
+# /home/syko/FluxPath/fluxpath/core/matching.py
+
+from typing import List, Optional, Tuple
+
+# Cost used by callers to mark a pairing as impossible. Anything at or above
+# this value is treated as "no match" in the solved assignment.
+INFEASIBLE = 1e9
+
+
+def solve_assignment(cost: List[List[float]]) -> List[Tuple[int, Optional[int]]]:
+    """Min-cost rectangular assignment (Hungarian / Jonker-Volgenant style).
+
+    Returns one ``(row, col)`` pair per row. ``col`` is ``None`` when the row
+    could not be matched, either because there are more rows than columns or
+    because every remaining column is ``INFEASIBLE`` for it.
+    """
+    rows = len(cost)
+    if rows == 0:
+        return []
+    cols = len(cost[0])
+    if cols == 0:
+        return [(r, None) for r in range(rows)]
+
+    transposed = rows > cols
+    if transposed:
+        cost = [list(col) for col in zip(*cost)]
+        rows, cols = cols, rows
+
+    # Potentials-based shortest augmenting path, O(rows^2 * cols).
+    # Index 0 is a virtual column used as the augmentation root.
+    inf = float("inf")
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (cols + 1)
+    match_col = [0] * (cols + 1)
+    way = [0] * (cols + 1)
+
+    for r in range(1, rows + 1):
+        match_col[0] = r
+        c0 = 0
+        minv = [inf] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[c0] = True
+            r0 = match_col[c0]
+            row = cost[r0 - 1]
+            delta = inf
+            c1 = 0
+            ur0 = u[r0]
+            for c in range(1, cols + 1):
+                if used[c]:
+                    continue
+                cur = row[c - 1] - ur0 - v[c]
+                if cur < minv[c]:
+                    minv[c] = cur
+                    way[c] = c0
+                if minv[c] < delta:
+                    delta = minv[c]
+                    c1 = c
+            for c in range(cols + 1):
+                if used[c]:
+                    u[match_col[c]] += delta
+                    v[c] -= delta
+                else:
+                    minv[c] -= delta
+            c0 = c1
+            if match_col[c0] == 0:
+                break
+        while c0:
+            c1 = way[c0]
+            match_col[c0] = match_col[c1]
+            c0 = c1
+
+    pairs: List[Tuple[int, int]] = []
+    for c in range(1, cols + 1):
+        r = match_col[c]
+        if r and cost[r - 1][c - 1] < INFEASIBLE:
+            pairs.append((r - 1, c - 1))
+
+    if transposed:
+        pairs = [(c, r) for r, c in pairs]
+        rows = cols
+
+    by_row = {r: c for r, c in pairs}
+    return [(r, by_row.get(r)) for r in range(rows)]
@@ -1,6 +1,8 @@
 from dataclasses import dataclass, asdict
 from typing import Dict, List, Literal
 
+from .events import event_bus
+
 ToolID = int
 
 @dataclass
@@ -32,11 +34,26 @@ class MMUManager:
             min_purge_volume=80.0,
             max_purge_volume=300.0,
         )
+        self._journal = None
+
+    def set_journal(self, journal) -> None:
+        """Restore filaments from ``journal`` and persist future changes."""
+        saved = journal.get("filaments")
+        if saved:
+            self._load_filaments(saved)
+        self._journal = journal
 
     def get_capabilities(self) -> Dict:
         return asdict(self._caps)
 
     def set_filaments(self, filaments: List[Dict]) -> List[Dict]:
+        stored = self._load_filaments(filaments)
+        if self._journal is not None:
+            self._journal.record("filaments", stored)
+        event_bus.publish("filaments", stored)
+        return stored
+
+    def _load_filaments(self, filaments: List[Dict]) -> List[Dict]:
         self._filaments.clear()
         for f in filaments:
             tool = int(f["tool"])
@@ -48,6 +65,10 @@ class MMUManager:
             )
         return [asdict(f) for f in self._filaments.values()]
 
+    def adopt(self, filaments: List[Dict]) -> None:
+        """Take over the owner process's filaments (multi-worker mode)."""
+        self._load_filaments(filaments)
+
     def get_filaments(self) -> List[Dict]:
         return [asdict(f) for f in self._filaments.values()]
 
@@ -0,0 +1,1162 @@
+# /home/syko/FluxPath/fluxpath/core/moonraker_sim.py
+#
+# Moonraker/Klipper stand-in for end-to-end tests without a printer. It
+# serves the parts of Moonraker's HTTP and JSON-RPC websocket API that
+# FluxPath and its scripts use (printer/info, objects list/query/subscribe
+# with notify_status_update, gcode script, print start/pause/cancel) on
+# top of a small Klipper: it parses the repo's own MMU config
+# (mmu/mmu_main.cfg and its includes), renders the gcode_macro templates
+# with Jinja2 the way Klipper does, and executes the result against a
+# filament model, so MMU_TOOL_CHANGE, T0..Tn, MMU_RUNOUT and friends run
+# the real macros. The post-cutter and pregate filament sensors follow the
+# active lane's tip position and spool.
+#
+# Latency (global, jitter, per method), random request failures, dropped
+# notifications, dead or misplaced sensors, runouts, Klipper shutdowns
+# and websocket disconnects can be set on the command line or at runtime
+# through /sim/*. Motion and dwell time is scaled by --time-scale.
+#
+#   python -m fluxpath.core.moonraker_sim serve --port 7125 --time-scale 0.01
+#   FLUXPATH_MOONRAKER_URL=http://127.0.0.1:7125 python server.py
+#   python -m fluxpath.core.moonraker_sim bench --url http://127.0.0.1:7125
+#
+# Needs jinja2 (pip install fluxpath[sim]).
+
+import argparse
+import ast
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import re
+import shlex
+import socket
+import sys
+import time
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+try:
+    import jinja2
+except ImportError:  # optional dependency
+    jinja2 = None
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+MMU_CONFIG = REPO_ROOT / "mmu" / "mmu_main.cfg"
+GCODE_DIR = Path(os.environ.get("FLUXPATH_GCODE_DIR", Path.home() / "printer_data" / "gcodes"))
+
+FILAMENT_SENSOR = "filament_switch_sensor filament_sensor"
+PREGATE_SENSOR = "filament_switch_sensor pregate"
+MMU_VARS = "gcode_macro MMU_VARS"
+
+_WORD_RE = re.compile(r"([A-Z])([-+]?[0-9]*\.?[0-9]+)")
+_JOB_LINE_RE = re.compile(r"^(T\d+|MMU_\w+)\b", re.IGNORECASE)
+
+
+class SimError(Exception):
+    """A Moonraker-style error: HTTP status code plus message."""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class GCodeError(SimError):
+    def __init__(self, message: str) -> None:
+        super().__init__(400, message)
+
+
+@dataclass
+class SimConfig:
+    config: Path = MMU_CONFIG
+    gcode_dir: Path = GCODE_DIR
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    method_latency_ms: Dict[str, float] = field(default_factory=dict)
+    fault_rate: float = 0.0
+    drop_rate: float = 0.0
+    time_scale: float = 1.0
+    status_interval: float = 0.25
+    print_seconds: float = 60.0
+    restart_seconds: float = 1.0
+    # lane -> mm the real sensor sits past its nominal position
+    sensor_offset_mm: Dict[int, float] = field(default_factory=dict)
+    dead_sensors: Set[int] = field(default_factory=set)
+
+    def update(self, changes: Dict[str, Any]) -> None:
+        for key, value in changes.items():
+            if key in ("config", "gcode_dir") or not hasattr(self, key):
+                raise SimError(400, f"Unknown or read-only setting {key!r}")
+            if key == "sensor_offset_mm":
+                value = {int(k): float(v) for k, v in value.items()}
+            elif key == "dead_sensors":
+                value = {int(v) for v in value}
+            elif key == "method_latency_ms":
+                value = {str(k): float(v) for k, v in value.items()}
+            else:
+                value = float(value)
+            setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        doc = asdict(self)
+        doc.update(config=str(self.config), gcode_dir=str(self.gcode_dir), dead_sensors=sorted(self.dead_sensors))
+        return doc
+
+
+# ---------------------------------------------------------
+# Klipper config
+# ---------------------------------------------------------
+def _strip_comment(line: str) -> str:
+    # Klipper's inline comment prefixes, outside double quotes.
+    quoted = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            quoted = not quoted
+        elif ch in "#;" and not quoted:
+            return line[:i]
+    return line
+
+
+def read_config(path: Path, sections: Optional[Dict[str, Dict[str, str]]] = None) -> Dict[str, Dict[str, str]]:
+    """Sections of a Klipper config with [include] followed; later
+    definitions of an option override earlier ones, as in Klipper."""
+    sections = {} if sections is None else sections
+    section = None
+    key = None
+    for raw in path.read_text(encoding="utf-8").splitlines():
+        if not raw.strip() or raw.lstrip().startswith(("#", ";")):
+            if key is not None and raw.strip() == "":
+                section[key] += "\n"
+            continue
+        if raw[0] in " \t":
+            if key is not None:
+                section[key] += "\n" + _strip_comment(raw).rstrip()
+            continue
+        line = _strip_comment(raw).strip()
+        key = None
+        if line.startswith("[") and line.endswith("]"):
+            name = line[1:-1].strip()
+            if name.startswith("include "):
+                for inc in sorted(path.parent.glob(name[len("include "):].strip())):
+                    read_config(inc, sections)
+                section = None
+            else:
+                section = sections.setdefault(name, {})
+            continue
+        if section is not None:
+            match = re.match(r"([^:=]+)[:=]\s*(.*)$", line)
+            if match is None:
+                continue
+            key = match.group(1).strip().lower()
+            section[key] = match.group(2).strip()
+    return sections
+
+
+def parse_literal(text: str) -> Any:
+    try:
+        return ast.literal_eval(text.strip())
+    except (ValueError, SyntaxError):
+        raise GCodeError(f"Unable to parse '{text.strip()}' as a literal")
+
+
+def parse_command(line: str):
+    """(COMMAND, params) for one G-code line; params keys are upper case."""
+    line = _strip_comment(line).strip()
+    if not line:
+        return None, {}
+    cmd, _, rest = line.partition(" ")
+    cmd = cmd.upper()
+    if re.fullmatch(r"[GMT]\d+(\.\d+)?", cmd):
+        params = {k: v for k, v in _WORD_RE.findall(rest.upper())}
+    else:
+        # As Klipper: shlex words (quotes group and are removed), each KEY=VALUE.
+        try:
+            words = [w.split("=", 1) for w in shlex.split(rest)]
+            params = {k.upper(): v for k, v in words}
+        except ValueError:
+            raise GCodeError(f"Malformed command '{line}'")
+    return cmd, params
+
+
+class Macro:
+    def __init__(self, name: str, options: Dict[str, str], env) -> None:
+        self.name = name
+        self.description = options.get("description", "")
+        self.variables = {k[len("variable_"):]: parse_literal(v) for k, v in options.items()
+                          if k.startswith("variable_")}
+        try:
+            self.template = env.from_string(options.get("gcode", "").strip("\n"))
+        except jinja2.TemplateSyntaxError as e:
+            raise ValueError(f"gcode_macro {name}: {e}")
+
+
+# ---------------------------------------------------------
+# Simulated printer
+# ---------------------------------------------------------
+class SimPrinter:
+    """Klipper's object model, macro engine and a filament model."""
+
+    def __init__(self, cfg: SimConfig) -> None:
+        if jinja2 is None:
+            raise RuntimeError("the Moonraker stand-in needs jinja2 (pip install jinja2)")
+        self.cfg = cfg
+        # Klipper's template syntax: {% %} blocks, {expr} expressions.
+        self.env = jinja2.Environment("{%", "%}", "{", "}")
+        self.macros: Dict[str, Macro] = {}
+        for name, options in read_config(cfg.config).items():
+            if name.startswith("gcode_macro "):
+                macro = Macro(name.split(None, 1)[1], options, self.env)
+                self.macros[macro.name.upper()] = macro
+        self.lock = asyncio.Lock()
+        self.listeners: List[Callable[[Dict[str, Dict[str, Any]], float], None]] = []
+        self.responders: List[Callable[[str], None]] = []
+        self.gcode_store: List[Dict[str, Any]] = []
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._job: Optional[asyncio.Task] = None
+        self._resume = asyncio.Event()
+        self._resume.set()
+        self.reset()
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+    def reset(self, state: str = "ready") -> None:
+        self.objects: Dict[str, Dict[str, Any]] = {
+            "webhooks": {"state": state, "state_message": "Printer is ready" if state == "ready" else ""},
+            "print_stats": {"state": "standby", "filename": "", "print_duration": 0.0, "filament_used": 0.0,
+                            "message": ""},
+            "virtual_sdcard": {"progress": 0.0, "is_active": False, "file_position": 0, "file_path": None},
+            "pause_resume": {"is_paused": False},
+            "toolhead": {"homed_axes": "", "position": [0.0, 0.0, 0.0, 0.0], "extruder": "extruder"},
+            "extruder": {"temperature": 22.0, "target": 0.0, "can_extrude": False},
+            "heater_bed": {"temperature": 22.0, "target": 0.0},
+            "gcode_move": {"absolute_coordinates": True, "absolute_extrude": True, "speed": 1500.0},
+            FILAMENT_SENSOR: {"filament_detected": False, "enabled": True},
+            PREGATE_SENSOR: {"filament_detected": True, "enabled": True},
+        }
+        for macro in self.macros.values():
+            self.objects["gcode_macro " + macro.name] = copy.deepcopy(macro.variables)
+        v = self.objects.get(MMU_VARS, {})
+        lanes = int(v.get("mmu_lanes", 0))
+        parked = v.get("parked") or [0.0] * lanes
+        # Tip of each lane, mm past the cutter (negative: behind it).
+        self.tip: Dict[int, float] = {lane: -float(parked[lane - 1]) for lane in range(1, lanes + 1)}
+        # loaded_lane -1 means "unknown"; the toolchange macro then unloads
+        # the active lane, so start with that one at the nozzle.
+        loaded = int(v.get("loaded_lane", 0))
+        if loaded < 0:
+            loaded = int(v.get("active_lane", 0))
+        if loaded in self.tip:
+            self.tip[loaded] = self._nozzle_pos()
+        self.runout: Set[int] = set()
+        self.e_pos = 0.0
+        self._dirty = {name: dict(status) for name, status in self.objects.items()}
+        self._update_sensors()
+
+    def set(self, obj: str, **values: Any) -> None:
+        status = self.objects.setdefault(obj, {})
+        for key, value in values.items():
+            if status.get(key) != value:
+                status[key] = value
+                self._dirty.setdefault(obj, {})[key] = copy.deepcopy(value)
+
+    def query(self, objects: Dict[str, Optional[List[str]]]) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for name, attrs in objects.items():
+            status = self.objects.get(name)
+            if status is None:
+                continue
+            out[name] = {k: copy.deepcopy(v) for k, v in status.items() if not attrs or k in attrs}
+        return out
+
+    def flush(self) -> None:
+        """Hand accumulated changes to the listeners (notify_status_update)."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        now = time.monotonic()
+        for fn in list(self.listeners):
+            fn(dirty, now)
+
+    @property
+    def state(self) -> str:
+        return self.objects["webhooks"]["state"]
+
+    def set_state(self, state: str, message: str = "") -> None:
+        self.set("webhooks", state=state, state_message=message)
+
+    # ------------------------------------------------------------------
+    # Filament model
+    # ------------------------------------------------------------------
+    def _vars(self) -> Dict[str, Any]:
+        return self.objects.get(MMU_VARS, {})
+
+    def _sensor_pos(self, lane: int) -> float:
+        # A calibrated sensor trips halfway through the slow approach.
+        v = self._vars()
+        nominal = float(v.get("cutter_to_filament_sensor", 0)) - float(v.get("sensor_approach_margin", 0)) / 2
+        return nominal + self.cfg.sensor_offset_mm.get(lane, 0.0)
+
+    def _nozzle_pos(self) -> float:
+        v = self._vars()
+        return float(v.get("cutter_to_filament_sensor", 0)) + float(v.get("filament_sensor_to_extruder", 0))
+
+    def _update_sensors(self) -> None:
+        detected = any(tip >= self._sensor_pos(lane) for lane, tip in self.tip.items()
+                       if lane not in self.cfg.dead_sensors)
+        self.set(FILAMENT_SENSOR, filament_detected=detected)
+        active = int(self._vars().get("active_lane", 1))
+        self.set(PREGATE_SENSOR, filament_detected=active not in self.runout)
+
+    async def _move_e(self, distance: float, feed: float) -> None:
+        active = int(self._vars().get("active_lane", 0))
+        if active in self.tip:
+            # Filament pushed past the nozzle is extruded, not stored.
+            self.tip[active] = min(self.tip[active] + distance, self._nozzle_pos())
+        self.e_pos += distance
+        await self._sleep(abs(distance) / max(feed / 60.0, 1e-6))
+        self._update_sensors()
+
+    async def _sleep(self, seconds: float) -> None:
+        if seconds > 0 and self.cfg.time_scale > 0:
+            await asyncio.sleep(seconds * self.cfg.time_scale)
+
+    # ------------------------------------------------------------------
+    # G-code
+    # ------------------------------------------------------------------
+    def respond(self, line: str) -> None:
+        self.gcode_store = (self.gcode_store + [{"message": line, "time": time.time(), "type": "response"}])[-1000:]
+        for fn in list(self.responders):
+            fn(line)
+
+    async def run_script(self, script: str) -> None:
+        if self.state == "shutdown":
+            raise GCodeError("Printer is shutdown")
+        if self.state != "ready":
+            raise SimError(503, "Klippy Host not connected")
+        async with self.lock:
+            await self._run_lines(script, depth=0)
+
+    async def _run_lines(self, script: str, depth: int) -> None:
+        for line in script.splitlines():
+            cmd, params = parse_command(line)
+            if cmd is None:
+                continue
+            if self.state != "ready":
+                raise GCodeError("Printer is not ready")
+            await self._dispatch(cmd, params, line.strip(), depth)
+
+    async def _dispatch(self, cmd: str, params: Dict[str, str], raw: str, depth: int) -> None:
+        macro = self.macros.get(cmd)
+        if macro is not None:
+            if depth > 50:
+                raise GCodeError(f"Macro {macro.name} called recursively")
+            await self._run_lines(self.render(macro, params, raw), depth + 1)
+            return
+        handler = getattr(self, "_cmd_" + cmd, None)
+        if handler is None:
+            self.respond(f'// Unknown command:"{cmd}"')
+            return
+        await handler(params)
+
+    def render(self, macro: Macro, params: Dict[str, str], raw: str = "") -> str:
+        context = dict(copy.deepcopy(self.objects["gcode_macro " + macro.name]))
+        context.update(
+            printer=copy.deepcopy(self.objects),
+            params=params,
+            rawparams=raw.partition(" ")[2],
+            action_respond_info=lambda msg: self.respond("// " + msg) or "",
+            action_raise_error=self._raise_error,
+        )
+        try:
+            return macro.template.render(context)
+        except GCodeError:
+            raise
+        except Exception as e:
+            raise GCodeError(f"Error evaluating 'gcode_macro {macro.name}:gcode': {type(e).__name__}: {e}")
+
+    @staticmethod
+    def _raise_error(msg: str) -> str:
+        raise GCodeError(msg)
+
+    # Built-in commands (the subset the MMU macros and slicers use).
+    async def _cmd_G1(self, p: Dict[str, str]) -> None:
+        move = self.objects["gcode_move"]
+        if "F" in p:
+            self.set("gcode_move", speed=float(p["F"]))
+        if "E" in p:
+            e = float(p["E"])
+            distance = e - self.e_pos if move["absolute_extrude"] else e
+            await self._move_e(distance, self.objects["gcode_move"]["speed"])
+
+    _cmd_G0 = _cmd_G1
+
+    async def _cmd_G4(self, p: Dict[str, str]) -> None:
+        await self._sleep(float(p.get("P", 0)) / 1000.0)
+
+    async def _cmd_G28(self, p: Dict[str, str]) -> None:
+        await self._sleep(2.0)
+        self.set("toolhead", homed_axes="xyz")
+
+    async def _cmd_G90(self, p: Dict[str, str]) -> None:
+        self.set("gcode_move", absolute_coordinates=True, absolute_extrude=True)
+
+    async def _cmd_G91(self, p: Dict[str, str]) -> None:
+        self.set("gcode_move", absolute_coordinates=False, absolute_extrude=False)
+
+    async def _cmd_G92(self, p: Dict[str, str]) -> None:
+        if "E" in p:
+            self.e_pos = float(p["E"])
+
+    async def _cmd_M82(self, p: Dict[str, str]) -> None:
+        self.set("gcode_move", absolute_extrude=True)
+
+    async def _cmd_M83(self, p: Dict[str, str]) -> None:
+        self.set("gcode_move", absolute_extrude=False)
+
+    async def _cmd_M104(self, p: Dict[str, str]) -> None:
+        self.set("extruder", target=float(p.get("S", 0)))
+
+    async def _cmd_M109(self, p: Dict[str, str]) -> None:
+        target = float(p.get("S", 0))
+        await self._sleep(5.0)
+        self.set("extruder", target=target, temperature=target, can_extrude=target >= 170)
+
+    async def _cmd_M140(self, p: Dict[str, str]) -> None:
+        self.set("heater_bed", target=float(p.get("S", 0)))
+
+    async def _cmd_M190(self, p: Dict[str, str]) -> None:
+        target = float(p.get("S", 0))
+        await self._sleep(5.0)
+        self.set("heater_bed", target=target, temperature=target)
+
+    async def _cmd_M400(self, p: Dict[str, str]) -> None:
+        pass  # moves complete before the next command here
+
+    async def _cmd_M112(self, p: Dict[str, str]) -> None:
+        self.emergency_stop()
+
+    async def _cmd_SET_STEPPER_ENABLE(self, p: Dict[str, str]) -> None:
+        pass
+
+    async def _cmd_SET_SERVO(self, p: Dict[str, str]) -> None:
+        await self._sleep(0.05)
+        v = self._vars()
+        if p.get("SERVO") == v.get("cutter_servo") and float(p.get("ANGLE", -1)) == float(v.get("cutter_angle_cut", -2)):
+            # The cutter drops whatever is past it.
+            active = int(v.get("active_lane", 0))
+            if active in self.tip:
+                self.tip[active] = min(self.tip[active], 0.0)
+            self._update_sensors()
+
+    async def _cmd_RESPOND(self, p: Dict[str, str]) -> None:
+        msg = p.get("MSG", "")
+        kind = p.get("TYPE", "").lower()
+        if kind == "error":
+            self.respond("!! " + msg)
+        elif kind == "command":
+            self.respond("// " + msg)
+        else:
+            self.respond(f"{p.get('PREFIX', 'echo:')} {msg}")
+
+    async def _cmd_SET_GCODE_VARIABLE(self, p: Dict[str, str]) -> None:
+        name = "gcode_macro " + p.get("MACRO", "").upper()
+        key = p.get("VARIABLE", "").lower()
+        macro = self.macros.get(p.get("MACRO", "").upper())
+        if macro is None or key not in self.objects[name]:
+            raise GCodeError(f"Unknown gcode_macro variable '{key}'")
+        self.set(name, **{key: parse_literal(p.get("VALUE", ""))})
+        if name == MMU_VARS and key == "active_lane":
+            self._update_sensors()
+
+    async def _cmd_SET_FILAMENT_SENSOR(self, p: Dict[str, str]) -> None:
+        name = "filament_switch_sensor " + p.get("SENSOR", "")
+        if name not in self.objects:
+            raise GCodeError(f"Unknown filament sensor {p.get('SENSOR')}")
+        self.set(name, enabled=bool(int(p.get("ENABLE", 1))))
+
+    async def _cmd_QUERY_FILAMENT_SENSOR(self, p: Dict[str, str]) -> None:
+        name = "filament_switch_sensor " + p.get("SENSOR", "")
+        if name not in self.objects:
+            raise GCodeError(f"Unknown filament sensor {p.get('SENSOR')}")
+        detected = self.objects[name]["filament_detected"]
+        self.respond(f"// Filament Sensor {p['SENSOR']}: filament {'detected' if detected else 'not detected'}")
+
+    async def _cmd_PAUSE(self, p: Dict[str, str]) -> None:
+        if self.objects["print_stats"]["state"] == "printing":
+            self._resume.clear()
+            self.set("print_stats", state="paused")
+            self.set("pause_resume", is_paused=True)
+
+    async def _cmd_RESUME(self, p: Dict[str, str]) -> None:
+        if self.objects["print_stats"]["state"] == "paused":
+            self.set("print_stats", state="printing")
+            self.set("pause_resume", is_paused=False)
+            self._resume.set()
+
+    async def _cmd_CANCEL_PRINT(self, p: Dict[str, str]) -> None:
+        if self._job is not None and self._job is not asyncio.current_task():
+            self._job.cancel()
+        self._finish_job("cancelled")
+
+    async def _cmd_SDCARD_PRINT_FILE(self, p: Dict[str, str]) -> None:
+        self.start_print(p.get("FILENAME", ""))
+
+    async def _cmd_STATUS(self, p: Dict[str, str]) -> None:
+        self.respond("// Klipper state: " + self.state.capitalize())
+
+    # ------------------------------------------------------------------
+    # Print jobs
+    # ------------------------------------------------------------------
+    def start_print(self, filename: str) -> None:
+        if self.objects["print_stats"]["state"] in ("printing", "paused"):
+            raise SimError(400, "Printer is busy")
+        path = self.cfg.gcode_dir / filename
+        self.set("print_stats", state="printing", filename=filename, print_duration=0.0, message="")
+        self.set("virtual_sdcard", progress=0.0, is_active=True, file_position=0, file_path=str(path))
+        self._resume.set()
+        self._job = asyncio.ensure_future(self._run_job(path))
+
+    async def _run_job(self, path: Path) -> None:
+        # Only toolchange lines are executed; the rest of the file is
+        # "printed" by advancing the progress over print_seconds.
+        steps: List[tuple] = []
+        size = 1
+        if path.is_file():
+            data = path.read_bytes()
+            size = max(len(data), 1)
+            pos = 0
+            for raw in data.splitlines(keepends=True):
+                line = _strip_comment(raw.decode("utf-8", "replace")).strip()
+                pos += len(raw)
+                if _JOB_LINE_RE.match(line):
+                    steps.append((pos, line))
+        steps.append((size, None))
+        per_byte = self.cfg.print_seconds / size
+        printed = 0.0
+        at = 0
+        for pos, line in steps:
+            # Advance in status_interval ticks so progress moves smoothly;
+            # time spent paused does not count.
+            while at < pos:
+                await self._resume.wait()
+                tick = min(self.cfg.status_interval, (pos - at) * per_byte)
+                await asyncio.sleep(tick)
+                printed += tick
+                at = pos if tick >= (pos - at) * per_byte else at + int(tick / per_byte)
+                self.set("virtual_sdcard", progress=round(at / size, 4), file_position=at)
+                self.set("print_stats", print_duration=round(printed, 2))
+            await self._resume.wait()
+            if line is not None:
+                try:
+                    await self.run_script(line)
+                except SimError as e:
+                    self.set("print_stats", message=str(e))
+                    self._finish_job("error")
+                    return
+                if self.objects["print_stats"]["state"] not in ("printing", "paused"):
+                    return
+        self._finish_job("complete")
+
+    def _finish_job(self, state: str) -> None:
+        if self.objects["print_stats"]["state"] not in ("printing", "paused"):
+            return
+        self._resume.set()
+        self.set("print_stats", state=state)
+        self.set("virtual_sdcard", is_active=False)
+        self.set("pause_resume", is_paused=False)
+        self._job = None
+
+    # ------------------------------------------------------------------
+    # Faults
+    # ------------------------------------------------------------------
+    async def spool_runout(self, lane: int, empty: bool = True) -> None:
+        """Spool of ``lane`` runs out (or is refilled). On the active lane
+        during a print, the pregate's runout_gcode (MMU_RUNOUT) runs."""
+        if empty:
+            self.runout.add(lane)
+        else:
+            self.runout.discard(lane)
+        self._update_sensors()
+        active = int(self._vars().get("active_lane", 0))
+        if empty and lane == active and self.objects["print_stats"]["state"] == "printing" and "MMU_RUNOUT" in self.macros:
+            await self.run_script("MMU_RUNOUT")
+
+    def emergency_stop(self) -> None:
+        if self._job is not None:
+            self._job.cancel()
+        self._finish_job("error")
+        self.set_state("shutdown", "Shutdown due to M112 command")
+
+    async def restart(self) -> None:
+        self.set_state("startup", "Printer is restarting")
+        self.flush()
+        await asyncio.sleep(self.cfg.restart_seconds)
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+        self.reset()
+
+
+# ---------------------------------------------------------
+# Moonraker API
+# ---------------------------------------------------------
+def _objects_arg(params: Dict[str, Any]) -> Dict[str, Optional[List[str]]]:
+    objects = params.get("objects") or {}
+    return {name: list(attrs) if attrs else None for name, attrs in objects.items()}
+
+
+class MoonrakerSim:
+    """Moonraker's method table over one SimPrinter, plus fault injection."""
+
+    def __init__(self, printer: SimPrinter) -> None:
+        self.printer = printer
+        self.cfg = printer.cfg
+        self.connections: Dict[int, Dict[str, Any]] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._ids = itertools.count(1)
+        self._flusher: Optional[asyncio.Task] = None
+        printer.listeners.append(self._notify_status)
+        printer.responders.append(lambda line: self._broadcast("notify_gcode_response", [line]))
+        self.methods: Dict[str, Callable[..., Any]] = {
+            "server.info": self.server_info,
+            "server.connection.identify": self.identify,
+            "server.gcode_store": self.gcode_store,
+            "printer.info": self.printer_info,
+            "printer.objects.list": self.objects_list,
+            "printer.objects.query": self.objects_query,
+            "printer.objects.subscribe": self.objects_subscribe,
+            "printer.gcode.script": self.gcode_script,
+            "printer.print.start": self.print_start,
+            "printer.print.pause": lambda **_: self._script("PAUSE"),
+            "printer.print.resume": lambda **_: self._script("RESUME"),
+            "printer.print.cancel": lambda **_: self._script("CANCEL_PRINT"),
+            "printer.emergency_stop": self.emergency_stop,
+            "printer.restart": self.restart,
+            "printer.firmware_restart": self.restart,
+        }
+
+    def start(self) -> None:
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+
+    async def _flush_loop(self) -> None:
+        # Klipper batches subscription updates; so does the stand-in.
+        while True:
+            await asyncio.sleep(self.cfg.status_interval)
+            self.printer.flush()
+
+    async def call(self, method: str, params: Dict[str, Any], conn_id: Optional[int] = None) -> Any:
+        fn = self.methods.get(method)
+        if fn is None:
+            raise SimError(404, f"Method not found: {method}")
+        counter = self.stats.setdefault(method, {"calls": 0, "errors": 0, "faults": 0})
+        counter["calls"] += 1
+        delay = self.cfg.method_latency_ms.get(method, self.cfg.latency_ms) + random.uniform(0, self.cfg.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        if self.cfg.fault_rate and random.random() < self.cfg.fault_rate:
+            counter["faults"] += 1
+            raise SimError(503, "Injected fault")
+        try:
+            if method == "printer.objects.subscribe":
+                params = dict(params, connection_id=params.get("connection_id", conn_id))
+            result = fn(**params)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        except TypeError as e:
+            counter["errors"] += 1
+            raise SimError(400, f"Invalid params for {method}: {e}")
+        except SimError:
+            counter["errors"] += 1
+            raise
+
+    # Methods --------------------------------------------------------------
+    def server_info(self) -> Dict[str, Any]:
+        return {
+            "klippy_connected": self.printer.state != "disconnected",
+            "klippy_state": self.printer.state,
+            "components": ["klippy_connection", "websockets", "fluxpath_sim"],
+            "failed_components": [],
+            "warnings": [],
+            "websocket_count": len(self.connections),
+            "moonraker_version": "fluxpath-sim",
+            "api_version": [1, 4, 0],
+        }
+
+    def identify(self, **_) -> Dict[str, Any]:
+        return {"connection_id": None}
+
+    def gcode_store(self, count: int = 100) -> Dict[str, Any]:
+        return {"gcode_store": self.printer.gcode_store[-int(count):]}
+
+    def printer_info(self) -> Dict[str, Any]:
+        webhooks = self.printer.objects["webhooks"]
+        return {
+            "state": webhooks["state"],
+            "state_message": webhooks["state_message"],
+            "hostname": socket.gethostname(),
+            "software_version": "fluxpath-sim",
+            "cpu_info": "simulated",
+            "klipper_path": str(REPO_ROOT),
+            "python_path": sys.executable,
+            "log_file": "",
+            "config_file": str(self.cfg.config),
+        }
+
+    def objects_list(self) -> Dict[str, Any]:
+        return {"objects": sorted(self.printer.objects)}
+
+    def objects_query(self, objects: Dict[str, Any]) -> Dict[str, Any]:
+        return {"eventtime": time.monotonic(), "status": self.printer.query(_objects_arg({"objects": objects}))}
+
+    def objects_subscribe(self, objects: Dict[str, Any], connection_id: Optional[int] = None) -> Dict[str, Any]:
+        conn = self.connections.get(connection_id)
+        if conn is None:
+            raise SimError(400, "objects/subscribe needs a websocket connection_id")
+        conn["subscription"] = _objects_arg({"objects": objects})
+        return self.objects_query(objects)
+
+    async def gcode_script(self, script: str) -> str:
+        await self.printer.run_script(script)
+        return "ok"
+
+    async def _script(self, script: str) -> str:
+        await self.printer.run_script(script)
+        return "ok"
+
+    def print_start(self, filename: str) -> str:
+        if self.printer.state != "ready":
+            raise SimError(503, "Klippy Host not connected")
+        self.printer.start_print(filename)
+        return "ok"
+
+    def emergency_stop(self) -> str:
+        self.printer.emergency_stop()
+        self._broadcast("notify_klippy_shutdown", [])
+        return "ok"
+
+    def restart(self) -> str:
+        async def cycle():
+            self._broadcast("notify_klippy_disconnected", [])
+            await self.printer.restart()
+            self._broadcast("notify_klippy_ready", [])
+        asyncio.ensure_future(cycle())
+        return "ok"
+
+    # Websocket connections ---------------------------------------------
+    def attach(self, send: Callable[[Dict[str, Any]], None]) -> int:
+        conn_id = next(self._ids)
+        self.connections[conn_id] = {"send": send, "subscription": {}}
+        return conn_id
+
+    def detach(self, conn_id: int) -> None:
+        self.connections.pop(conn_id, None)
+
+    def _emit(self, conn: Dict[str, Any], method: str, params: List[Any]) -> None:
+        if self.cfg.drop_rate and random.random() < self.cfg.drop_rate:
+            return
+        conn["send"]({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def _broadcast(self, method: str, params: List[Any]) -> None:
+        for conn in list(self.connections.values()):
+            self._emit(conn, method, params)
+
+    def _notify_status(self, dirty: Dict[str, Dict[str, Any]], eventtime: float) -> None:
+        for conn in list(self.connections.values()):
+            diff = {}
+            for name, attrs in conn["subscription"].items():
+                changed = dirty.get(name)
+                if changed:
+                    part = {k: v for k, v in changed.items() if attrs is None or k in attrs}
+                    if part:
+                        diff[name] = part
+            if diff:
+                self._emit(conn, "notify_status_update", [diff, eventtime])
+
+
+# Queued on a connection to make the server close it (/sim/disconnect).
+CLOSE = object()
+
+
+def _error(e: SimError) -> Dict[str, Any]:
+    return {"error": {"code": e.code, "message": str(e)}}
+
+
+def create_app(sim: MoonrakerSim):
+    """Moonraker's HTTP routes, the /websocket JSON-RPC endpoint and the
+    /sim control routes as one FastAPI app."""
+    from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="FluxPath Moonraker stand-in")
+
+    @app.on_event("startup")
+    async def startup():
+        sim.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await sim.stop()
+
+    async def http_call(method: str, params: Dict[str, Any]) -> JSONResponse:
+        try:
+            return JSONResponse({"result": await sim.call(method, params)})
+        except SimError as e:
+            return JSONResponse(_error(e), status_code=e.code)
+
+    def query_objects(request: Request) -> Dict[str, Any]:
+        # ?print_stats=state,filename&toolhead  ->  {name: [attrs] | None}
+        return {name: [a for a in value.split(",") if a] or None
+                for name, value in request.query_params.items() if name != "connection_id"}
+
+    @app.get("/server/info")
+    async def server_info():
+        return await http_call("server.info", {})
+
+    @app.get("/server/gcode_store")
+    async def gcode_store(count: int = 100):
+        return await http_call("server.gcode_store", {"count": count})
+
+    @app.get("/printer/info")
+    async def printer_info():
+        return await http_call("printer.info", {})
+
+    @app.get("/printer/objects/list")
+    async def objects_list():
+        return await http_call("printer.objects.list", {})
+
+    @app.api_route("/printer/objects/query", methods=["GET", "POST"])
+    async def objects_query(request: Request):
+        if request.method == "POST":
+            body = await request.json()
+            return await http_call("printer.objects.query", {"objects": body.get("objects", {})})
+        return await http_call("printer.objects.query", {"objects": query_objects(request)})
+
+    @app.post("/printer/objects/subscribe")
+    async def objects_subscribe(request: Request, connection_id: int):
+        return await http_call("printer.objects.subscribe",
+                               {"objects": query_objects(request), "connection_id": connection_id})
+
+    @app.post("/printer/gcode/script")
+    async def gcode_script(request: Request, script: Optional[str] = None):
+        if script is None:
+            script = (await request.json()).get("script", "")
+        return await http_call("printer.gcode.script", {"script": script})
+
+    @app.post("/printer/print/start")
+    async def print_start(request: Request, filename: Optional[str] = None):
+        if filename is None:
+            filename = (await request.json()).get("filename", "")
+        return await http_call("printer.print.start", {"filename": filename})
+
+    def no_params(method: str):
+        async def route():
+            return await http_call(method, {})
+        return route
+
+    for action in ("print/pause", "print/resume", "print/cancel", "emergency_stop", "restart", "firmware_restart"):
+        app.add_api_route(f"/printer/{action}", no_params("printer." + action.replace("/", ".")), methods=["POST"])
+
+    @app.websocket("/websocket")
+    async def websocket(ws: WebSocket):
+        await ws.accept()
+        out: asyncio.Queue = asyncio.Queue()
+        conn_id = sim.attach(out.put_nowait)
+
+        async def writer():
+            while True:
+                msg = await out.get()
+                if msg is CLOSE:
+                    await ws.close(code=1001)
+                    return
+                await ws.send_text(json.dumps(msg))
+
+        async def handle(req: Dict[str, Any]):
+            try:
+                result = await sim.call(req.get("method", ""), req.get("params") or {}, conn_id)
+                if req.get("method") == "server.connection.identify":
+                    result = {"connection_id": conn_id}
+                out.put_nowait({"jsonrpc": "2.0", "result": result, "id": req.get("id")})
+            except SimError as e:
+                out.put_nowait({"jsonrpc": "2.0", "id": req.get("id"), **_error(e)})
+
+        send_task = asyncio.ensure_future(writer())
+        pending: Set[asyncio.Task] = set()
+        try:
+            while True:
+                try:
+                    req = json.loads(await ws.receive_text())
+                except ValueError:
+                    out.put_nowait({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+                    continue
+                # Requests run concurrently, as in Moonraker: a long gcode
+                # script does not hold up queries on the same socket.
+                task = asyncio.ensure_future(handle(req))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sim.detach(conn_id)
+            send_task.cancel()
+            for task in pending:
+                task.cancel()
+
+    # Simulation control ----------------------------------------------------
+    @app.get("/sim/state")
+    def sim_state():
+        p = sim.printer
+        return {"result": {"objects": p.objects, "tips": p.tip, "runout": sorted(p.runout),
+                           "config": sim.cfg.to_dict(), "stats": sim.stats}}
+
+    @app.get("/sim/stats")
+    def sim_stats():
+        return {"result": sim.stats}
+
+    @app.post("/sim/faults")
+    async def sim_faults(request: Request):
+        try:
+            sim.cfg.update(await request.json())
+            sim.printer._update_sensors()
+        except (SimError, TypeError, ValueError) as e:
+            return JSONResponse(_error(e if isinstance(e, SimError) else SimError(400, str(e))), status_code=400)
+        return {"result": sim.cfg.to_dict()}
+
+    @app.post("/sim/runout/{lane}")
+    async def sim_runout(lane: int, empty: bool = True):
+        try:
+            await sim.printer.spool_runout(lane, empty)
+        except SimError as e:
+            return JSONResponse(_error(e), status_code=e.code)
+        return {"result": "ok"}
+
+    @app.post("/sim/klippy/{state}")
+    def sim_klippy(state: str, message: str = ""):
+        sim.printer.set_state(state, message)
+        if state in ("shutdown", "error"):
+            sim._broadcast("notify_klippy_shutdown", [])
+        elif state == "ready":
+            sim._broadcast("notify_klippy_ready", [])
+        return {"result": "ok"}
+
+    @app.post("/sim/disconnect")
+    def sim_disconnect():
+        # Close every websocket from the server side.
+        count = len(sim.connections)
+        for conn in list(sim.connections.values()):
+            conn["send"](CLOSE)
+        return {"result": {"closed": count}}
+
+    @app.post("/sim/reset")
+    def sim_reset():
+        sim.printer.reset()
+        sim.stats.clear()
+        return {"result": "ok"}
+
+    return app
+
+
+# ---------------------------------------------------------
+# Round-trip benchmark (against the stand-in or a real Moonraker)
+# ---------------------------------------------------------
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(q * (len(values) - 1))))] * 1000, 2)
+
+
+def _timing(values: List[float]) -> Dict[str, Any]:
+    return {"n": len(values), "p50_ms": _percentile(values, 0.5), "p95_ms": _percentile(values, 0.95),
+            "max_ms": _percentile(values, 1.0)}
+
+
+def _http(url: str, data: Optional[Dict[str, Any]] = None, timeout: float = 30.0) -> Dict[str, Any]:
+    req = urllib.request.Request(url, data=json.dumps(data).encode() if data is not None else None,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        return json.loads(r.read())
+
+
+async def bench(url: str, count: int, tools: List[int]) -> Dict[str, Any]:
+    """HTTP and websocket round trips, then toolchanges: time for the
+    script to return and for notify_status_update to report the new lane."""
+    import websockets
+
+    loop = asyncio.get_running_loop()
+    http_rtt: List[float] = []
+    errors: List[str] = []
+    failed = {"http": 0, "ws": 0}
+    for _ in range(count):
+        t0 = time.perf_counter()
+        try:
+            await loop.run_in_executor(None, _http, url + "/printer/info")
+        except OSError:
+            failed["http"] += 1
+            continue
+        http_rtt.append(time.perf_counter() - t0)
+
+    ws_url = re.sub(r"^http", "ws", url) + "/websocket"
+    ids = itertools.count(1)
+    waiting: Dict[int, asyncio.Future] = {}
+    updates: asyncio.Queue = asyncio.Queue()
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        async def reader():
+            async for raw in ws:
+                msg = json.loads(raw)
+                if "id" in msg and msg["id"] in waiting:
+                    waiting.pop(msg["id"]).set_result(msg)
+                elif msg.get("method") == "notify_status_update":
+                    updates.put_nowait((time.perf_counter(), msg["params"][0]))
+
+        async def rpc(method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+            req_id = next(ids)
+            fut = loop.create_future()
+            waiting[req_id] = fut
+            await ws.send(json.dumps({"jsonrpc": "2.0", "method": method, "params": params or {}, "id": req_id}))
+            msg = await fut
+            if "error" in msg:
+                raise SimError(msg["error"].get("code", 500), msg["error"].get("message", ""))
+            return msg["result"]
+
+        read_task = asyncio.ensure_future(reader())
+        try:
+            ws_rtt = []
+            for _ in range(count):
+                t0 = time.perf_counter()
+                try:
+                    await rpc("printer.objects.query", {"objects": {"webhooks": None}})
+                except SimError:
+                    failed["ws"] += 1
+                    continue
+                ws_rtt.append(time.perf_counter() - t0)
+
+            await rpc("printer.objects.subscribe", {"objects": {MMU_VARS: ["loaded_lane", "tool_map"]}})
+            script_s: List[float] = []
+            notify_s: List[float] = []
+            for tool in tools:
+                while not updates.empty():
+                    updates.get_nowait()
+                try:
+                    status = await rpc("printer.objects.query", {"objects": {MMU_VARS: ["tool_map", "loaded_lane"]}})
+                    v = status["status"].get(MMU_VARS, {})
+                    lane = (v.get("tool_map") or [])[tool] if tool < len(v.get("tool_map") or []) else None
+                    t0 = time.perf_counter()
+                    await rpc("printer.gcode.script", {"script": f"T{tool}"})
+                except SimError as e:
+                    errors.append(f"T{tool}: {e}")
+                    continue
+                script_s.append(time.perf_counter() - t0)
+                if lane is None or lane == v.get("loaded_lane"):
+                    continue
+                try:
+                    while True:
+                        t1, diff = await asyncio.wait_for(updates.get(), 5.0)
+                        if diff.get(MMU_VARS, {}).get("loaded_lane") == lane:
+                            notify_s.append(t1 - t0)
+                            break
+                except asyncio.TimeoutError:
+                    errors.append(f"T{tool}: no loaded_lane={lane} update within 5 s")
+        finally:
+            read_task.cancel()
+    return {
+        "url": url,
+        "http_printer_info": _timing(http_rtt),
+        "ws_objects_query": _timing(ws_rtt),
+        "toolchange_script": _timing(script_s),
+        "toolchange_notify": _timing(notify_s),
+        "failed_requests": failed,
+        "errors": errors,
+    }
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def _pairs(items: List[str], cast=float) -> Dict[str, Any]:
+    out = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        out[key.strip()] = cast(value)
+    return out
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="python -m fluxpath.core.moonraker_sim",
+                                description="Moonraker/Klipper stand-in and round-trip benchmark")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="run the stand-in")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=7125)
+    s.add_argument("--config", type=Path, default=MMU_CONFIG, help="Klipper config with the MMU macros")
+    s.add_argument("--gcode-dir", type=Path, default=GCODE_DIR)
+    s.add_argument("--latency-ms", type=float, default=0.0, help="added to every request")
+    s.add_argument("--jitter-ms", type=float, default=0.0, help="uniform random extra latency")
+    s.add_argument("--method-latency", action="append", default=[], metavar="METHOD=MS",
+                   help="latency for one method, e.g. printer.gcode.script=150")
+    s.add_argument("--fault-rate", type=float, default=0.0, help="fraction of requests failing with 503")
+    s.add_argument("--drop-rate", type=float, default=0.0, help="fraction of websocket notifications dropped")
+    s.add_argument("--time-scale", type=float, default=1.0, help="motion/dwell time factor (0 = instant)")
+    s.add_argument("--status-interval", type=float, default=0.25, help="notify_status_update batching, s")
+    s.add_argument("--print-seconds", type=float, default=60.0, help="wall-clock duration of a simulated print")
+    s.add_argument("--sensor-offset", action="append", default=[], metavar="LANE=MM",
+                   help="real sensor position past nominal for a lane")
+    s.add_argument("--dead-sensor", action="append", type=int, default=[], metavar="LANE",
+                   help="the filament sensor never sees this lane")
+
+    b = sub.add_parser("bench", help="measure round trips and toolchanges")
+    b.add_argument("--url", default="http://127.0.0.1:7125")
+    b.add_argument("-n", "--count", type=int, default=100, help="round trips per transport")
+    b.add_argument("--tools", default="0,1,2,3,0", help="toolchange sequence")
+    b.add_argument("--json", action="store_true")
+
+    args = p.parse_args(argv)
+    if args.cmd == "bench":
+        tools = [int(t) for t in args.tools.split(",") if t.strip()]
+        report = asyncio.run(bench(args.url.rstrip("/"), args.count, tools))
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            for name in ("http_printer_info", "ws_objects_query", "toolchange_script", "toolchange_notify"):
+                t = report[name]
+                print(f"{name:<20} n={t['n']:<4} p50={t['p50_ms']} ms  p95={t['p95_ms']} ms  max={t['max_ms']} ms")
+            print("failed requests: http={http} ws={ws}".format(**report["failed_requests"]))
+            for e in report["errors"]:
+                print(f"error: {e}")
+        return 1 if report["errors"] else 0
+
+    import uvicorn
+
+    cfg = SimConfig(
+        config=args.config, gcode_dir=args.gcode_dir, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        method_latency_ms=_pairs(args.method_latency), fault_rate=args.fault_rate, drop_rate=args.drop_rate,
+        time_scale=args.time_scale, status_interval=args.status_interval, print_seconds=args.print_seconds,
+        sensor_offset_mm={int(k): v for k, v in _pairs(args.sensor_offset).items()},
+        dead_sensors=set(args.dead_sensor),
+    )
+
+    async def serve():
+        sim = MoonrakerSim(SimPrinter(cfg))
+        server = uvicorn.Server(uvicorn.Config(create_app(sim), host=args.host, port=args.port, log_level="warning"))
+        await server.serve()
+
+    asyncio.run(serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# /home/syko/FluxPath/fluxpath/core/profiling.py
+#
+# On-demand profiling of single routes and MMU commands. Enabling a target
+# swaps its callable for a wrapper that profiles a sampled fraction of
+# calls with cProfile, in the thread that actually runs the call (sync
+# routes run in the threadpool, MMU moves in their caller's thread);
+# disabling it puts the original back, so a target that is not being
+# profiled costs nothing at all. The last RING_SIZE profiles are kept in
+# memory with wall and CPU time and served as marshalled pstats files
+# (``python -m pstats``, snakeviz) or as a top-N summary.
+#
+# Targets: "<METHOD> <route path>" as declared, e.g. "POST /mmu/tool/{slot}",
+# or one of COMMAND_TARGETS, e.g. "mmu.load_slot".
+#
+# This module, and cProfile, pstats and marshal with it, is imported on
+# first use: most processes never profile anything.
+
+import functools
+import inspect
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import cProfile
+
+RING_SIZE = int(os.environ.get("FLUXPATH_PROFILE_RING", "32"))
+
+
+def _mmu():
+    from backend.mmu import routes as mmu_routes
+
+    return mmu_routes.get_mmu()
+
+
+def _planner():
+    from .mmu import mmu_manager
+
+    return mmu_manager
+
+
+# target -> (owner object factory, method name)
+COMMAND_TARGETS: Dict[str, Tuple[Callable[[], Any], str]] = {
+    "mmu.load_slot": (_mmu, "load_slot"),
+    "mmu.simulate_load_slot": (_mmu, "simulate_load_slot"),
+    "mmu.simulate_toolchange": (_mmu, "simulate_toolchange"),
+    "mmu.simulate_unload": (_mmu, "simulate_unload"),
+    "mmu.simulate_recover": (_mmu, "simulate_recover"),
+    "plan.toolchanges": (_planner, "plan_toolchanges"),
+}
+
+
+def _api_routes(routes: Iterable[Any]) -> Iterator[Any]:
+    """The HTTP routes requests are dispatched to, with ``path``,
+    ``methods`` and the ``dependant`` whose ``call`` runs the endpoint.
+
+    Older FastAPI (0.115) copies included routers' APIRoutes into
+    ``app.routes``; newer releases (0.143) keep one entry per included
+    router and serve each route through a per-inclusion context with its
+    own dependant, so the wrapper has to go on that one. WebSocket routes
+    have a dependant but no methods and are left out.
+    """
+    from fastapi.routing import APIRoute
+
+    for route in routes:
+        candidates = getattr(route, "effective_candidates", None)
+        if candidates is not None:
+            yield from _api_routes(candidates())
+        elif isinstance(getattr(route, "original_route", route), APIRoute):
+            yield route
+
+
+class Profile:
+    __slots__ = ("id", "target", "started_at", "wall_s", "cpu_s", "error", "stats")
+
+    def __init__(self, id: int, target: str, started_at: float, wall_s: float, cpu_s: Optional[float],
+                 error: Optional[str], stats: bytes) -> None:
+        self.id = id
+        self.target = target
+        self.started_at = started_at
+        self.wall_s = wall_s
+        self.cpu_s = cpu_s
+        self.error = error
+        self.stats = stats
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "target": self.target,
+            "started_at": self.started_at,
+            "wall_s": round(self.wall_s, 6),
+            # CPU of the profiled thread; None for async routes, which share
+            # the loop thread with everything else.
+            "cpu_s": None if self.cpu_s is None else round(self.cpu_s, 6),
+            "error": self.error,
+        }
+
+
+class _Loaded:
+    """Marshalled stats in the shape ``pstats.Stats`` accepts a profiler."""
+
+    def __init__(self, data: bytes) -> None:
+        import marshal
+
+        self.stats = marshal.loads(data)
+
+    def create_stats(self) -> None:
+        pass
+
+
+class Profiler:
+    """Enabled targets, their sampling rates and the ring of results."""
+
+    def __init__(self, ring_size: int = RING_SIZE) -> None:
+        self.ring: Deque[Profile] = deque(maxlen=ring_size)
+        self._rates: Dict[str, float] = {}
+        self._restore: Dict[str, Callable[[], None]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._app = None
+
+    def bind(self, app) -> None:
+        """The FastAPI app whose routes can be profiled."""
+        self._app = app
+
+    def _routes(self) -> Iterator[Any]:
+        if self._app is None:
+            # This module is imported on first use, when the served app
+            # already exists; bind() picks a different one.
+            from ..app import app
+
+            self._app = app
+        return _api_routes(self._app.routes)
+
+    def available(self) -> List[str]:
+        routes = []
+        for route in self._routes():
+            routes += [f"{m} {route.path}" for m in sorted(route.methods)]
+        return routes + list(COMMAND_TARGETS)
+
+    def targets(self) -> Dict[str, float]:
+        return dict(self._rates)
+
+    # ------------------------------------------------------------------
+    # Enabling and disabling
+    # ------------------------------------------------------------------
+    def set(self, target: str, rate: float = 1.0) -> Dict[str, float]:
+        """Profile ``rate`` (0..1] of calls to ``target``; 0 disables it."""
+        rate = float(rate)
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("rate must be between 0 and 1")
+        with self._lock:
+            if rate == 0.0:
+                self._disable(target)
+            elif target in self._rates:
+                self._rates[target] = rate
+            else:
+                self._restore[target] = self._install(target)
+                self._rates[target] = rate
+        return self.targets()
+
+    def clear(self) -> None:
+        """Disable every target and drop the stored profiles."""
+        with self._lock:
+            for target in list(self._rates):
+                self._disable(target)
+            self.ring.clear()
+
+    def _disable(self, target: str) -> None:
+        restore = self._restore.pop(target, None)
+        self._rates.pop(target, None)
+        if restore is not None:
+            restore()
+
+    def _install(self, target: str) -> Callable[[], None]:
+        if target in COMMAND_TARGETS:
+            factory, name = COMMAND_TARGETS[target]
+            try:
+                obj = factory()
+            except RuntimeError as e:
+                raise ValueError(f"{target}: {e}")
+            # Shadow the bound method on this instance; deleting the
+            # attribute brings the class method back.
+            setattr(obj, name, self._wrap(target, getattr(obj, name)))
+            return lambda: obj.__dict__.pop(name, None)
+
+        method, _, path = target.partition(" ")
+        for route in self._routes():
+            if route.path == path and method.upper() in route.methods:
+                dependant = route.dependant
+                original = dependant.call
+                dependant.call = self._wrap(target, original)
+                return lambda: setattr(dependant, "call", original)
+        raise ValueError(f"Unknown profiling target {target!r}")
+
+    def _wrap(self, target: str, fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def profiled_async(*args, **kwargs):
+                prof = self._begin(target)
+                if prof is None:
+                    return await fn(*args, **kwargs)
+                started, wall = time.time(), time.perf_counter()
+                error = None
+                prof.enable()
+                try:
+                    return await fn(*args, **kwargs)
+                except BaseException as e:
+                    error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    prof.disable()
+                    self._end(target, prof, started, time.perf_counter() - wall, None, error)
+
+            return profiled_async
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            prof = self._begin(target)
+            if prof is None:
+                return fn(*args, **kwargs)
+            started, wall, cpu = time.time(), time.perf_counter(), time.thread_time()
+            error = None
+            prof.enable()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                prof.disable()
+                self._end(target, prof, started, time.perf_counter() - wall, time.thread_time() - cpu, error)
+
+        return profiled
+
+    # ------------------------------------------------------------------
+    # Capture
+    # ------------------------------------------------------------------
+    def _begin(self, target: str) -> Optional["cProfile.Profile"]:
+        rate = self._rates.get(target, 0.0)
+        # One profiler per thread: a profiled route calling a profiled MMU
+        # command is recorded once, under the route.
+        if getattr(self._local, "active", False) or random.random() >= rate:
+            return None
+        import cProfile
+
+        self._local.active = True
+        return cProfile.Profile()
+
+    def _end(self, target: str, prof: "cProfile.Profile", started: float, wall: float, cpu: Optional[float],
+             error: Optional[str]) -> None:
+        import marshal
+
+        self._local.active = False
+        prof.create_stats()
+        self.ring.append(Profile(next(self._ids), target, started, wall, cpu, error, marshal.dumps(prof.stats)))
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+    def profiles(self, target: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [p.meta() for p in list(self.ring) if target is None or p.target == target]
+
+    def get(self, profile_id: int) -> Profile:
+        for p in list(self.ring):
+            if p.id == profile_id:
+                return p
+        raise KeyError(profile_id)
+
+    def pstats(self, profile_id: int) -> bytes:
+        """The profile in the format ``pstats.Stats(path)`` loads."""
+        return self.get(profile_id).stats
+
+    def summary(self, profile_id: int, top: int = 25, sort: str = "cumulative") -> Dict[str, Any]:
+        import io
+        import pstats
+
+        p = self.get(profile_id)
+        stats = pstats.Stats(_Loaded(p.stats), stream=io.StringIO())
+        try:
+            stats.sort_stats(sort)
+        except KeyError:
+            raise ValueError(f"Unknown sort key {sort!r}")
+        rows = []
+        for func in stats.fcn_list[:top]:
+            cc, nc, tt, ct, _ = stats.stats[func]
+            rows.append({
+                "function": pstats.func_std_string(func),
+                "calls": nc,
+                "primitive_calls": cc,
+                "tottime_s": round(tt, 6),
+                "cumtime_s": round(ct, 6),
+            })
+        return dict(p.meta(), total_calls=stats.total_calls, functions=rows)
+
+
+profiler = Profiler()
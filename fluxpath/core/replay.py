@@ -0,0 +1,353 @@
+# /home/syko/FluxPath/fluxpath/core/replay.py
+#
+# Toolchange replay harness. A workload -- the toolchanges of a telemetry
+# recording (telemetry.py), the T commands of a G-code file, or a literal
+# tool sequence -- is driven through a real MMUController on a simulated
+# driver at accelerated speed, and through the purge and lane-transition
+# planners. Recorded sensor distances are fed back to the driver, so a
+# change to the load logic meets the same early/late triggers the printer
+# saw. No printer, Moonraker or backend process is needed.
+#
+# Gated metrics are modeled from distances and feed rates and do not
+# depend on how busy the machine running the replay is; wall-clock time
+# is reported but never compared. Against a stored baseline every metric
+# may grow by its threshold (relative, plus an absolute slack) and the
+# run exits 1 if any grows further:
+#
+#   python -m fluxpath.core.replay --gcode part.gcode --write-baseline base.json
+#   python -m fluxpath.core.replay --gcode part.gcode --baseline base.json
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fp_core.macros import CONFIG_PATH, LaneGeometry, load_lane_geometry
+from fp_core.transitions import NO_LANE, plan_transition
+
+from .mmu import MMUManager
+from .spools import tool_number
+from .telemetry import KIND_IDS, Recording, telemetry_recorder
+
+DEFAULT_SPEEDUP = 1000.0
+
+# metric -> (relative growth allowed, absolute slack)
+THRESHOLDS: Dict[str, Tuple[float, float]] = {
+    "toolchange_p50_s": (0.05, 0.05),
+    "toolchange_p95_s": (0.05, 0.05),
+    "toolchange_max_s": (0.10, 0.05),
+    "modeled_total_s": (0.05, 0.5),
+    "slow_mm_total": (0.10, 1.0),
+    "transition_mm_total": (0.02, 1.0),
+    "purge_volume": (0.0, 0.0),
+    "errors": (0.0, 0.0),
+}
+
+
+@dataclass
+class Workload:
+    source: str
+    # Controller slots (0-based) in toolchange order.
+    sequence: List[int]
+    # Park -> sensor distances seen on the printer, per slot, in load order.
+    sensor_mm: Dict[int, List[float]] = field(default_factory=dict)
+    # Toolchange durations as recorded, for reference only.
+    recorded_s: List[float] = field(default_factory=list)
+
+
+def gcode_workload(path: Path) -> Workload:
+    """Tool sequence from the T commands of a G-code file."""
+    sequence: List[int] = []
+    with open(path, "rb") as f:
+        for line in f:
+            tool = tool_number(line)
+            if tool is not None:
+                sequence.append(tool)
+    return Workload(str(path), sequence)
+
+
+def recording_workload(recording: str, root: Optional[Path] = None) -> Workload:
+    """Toolchanges and load distances from a telemetry recording (an id
+    under the telemetry dir, or a recording directory)."""
+    directory = Path(recording)
+    if not directory.is_dir():
+        directory = (root or telemetry_recorder.root) / recording
+    if not (directory / "index.bin").exists():
+        raise FileNotFoundError(f"no telemetry recording at {directory}")
+
+    rec = Recording(directory)
+    labels = rec.labels()
+    kinds = {KIND_IDS[k]: k for k in ("phase", "phase_failed", "load_mm")}
+    toolchanges: List[Tuple[int, float]] = []
+    loads: List[int] = []
+    workload = Workload(rec.id, [])
+    for _t, k, lane, value, lb in rec.rows(0, 2 ** 62, kinds):
+        kind = kinds[k]
+        label = labels[lb] if lb < len(labels) else ""
+        if kind == "load_mm":
+            workload.sensor_mm.setdefault(lane, []).append(value)
+        elif lane < 0:
+            continue
+        elif label.split(":", 1)[0] == "toolchange":
+            toolchanges.append((lane, value))
+        elif label.split(":", 1)[0] == "load":
+            loads.append(lane)
+    if toolchanges:
+        workload.sequence = [lane for lane, _ in toolchanges]
+        workload.recorded_s = [d for _, d in toolchanges]
+    else:
+        # Sessions with manual loads only
+        workload.sequence = loads
+    return workload
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _step_s(mm: float, f: int) -> float:
+    return mm / (f / 60.0) if f else 0.0
+
+
+def default_config(geom: LaneGeometry):
+    from backend.mmu.model import MMUConfig
+
+    return MMUConfig(
+        drive_motors=geom.lanes,
+        motor_pins=[],
+        sensor_pins=[],
+        colors=[],
+        cutter_present=True,
+        cutter_pin=None,
+        feed_distance_mm=geom.lane_table()[0]["park_to_sensor"],
+        retract_distance_mm=geom.parking_to_cutter[0],
+    )
+
+
+def run_replay(workload: Workload, config, geom: LaneGeometry, speedup: float = DEFAULT_SPEEDUP) -> Dict:
+    """Drive ``workload`` through an MMUController and the planners and
+    return the metrics."""
+    from backend.mmu.controller import MMUController
+    from backend.mmu.loader import SimulatedDriver
+
+    class ReplayDriver(SimulatedDriver):
+        """Fires the sensor at the distance the printer measured for this
+        slot's next load instead of the calibrated one."""
+
+        def __init__(self, time_scale: float) -> None:
+            super().__init__(time_scale)
+            self.slot = 0
+            self.used: Dict[int, int] = {}
+
+        def reset(self, sensor_at_mm, on_sensor):
+            seen = workload.sensor_mm.get(self.slot)
+            if seen:
+                n = self.used.get(self.slot, 0)
+                self.used[self.slot] = n + 1
+                sensor_at_mm = seen[n % len(seen)]
+            super().reset(sensor_at_mm, on_sensor)
+
+    driver = ReplayDriver(1.0 / speedup)
+    controller = MMUController(config, driver)
+    controller.sim_speedup = speedup
+    events: List[Dict] = []
+    controller.set_broadcaster(lambda topic, data: events.append(data) if topic == "mmu_event" else None)
+
+    parked = list(geom.parking_to_cutter)
+    loaded = NO_LANE
+    changes: List[int] = []
+    modeled: List[float] = []
+    transition_mm = 0.0
+    slow_mm = 0.0
+    skipped = errors = recoveries = early = 0
+    started = time.monotonic()
+
+    for slot in workload.sequence:
+        lane = slot + 1
+        if lane == loaded:
+            skipped += 1
+            continue
+        before = len(events)
+        driver.slot = slot
+        controller.simulate_toolchange(slot)
+        changes.append(slot)
+
+        # Sensor-guided part as the controller actually moved it.
+        load_s = 0.0
+        failed = False
+        for e in events[before:]:
+            if e.get("kind") != "phase":
+                continue
+            if not e.get("ok", True):
+                failed = failed or e["phase"] == "toolchange"
+            elif e["phase"] == "load":
+                fast, slow = e.get("fast_mm", 0.0), e.get("slow_mm", 0.0)
+                slow_mm += slow
+                early += bool(e.get("triggered_early"))
+                load_s += fast / config.load_fast_speed_mm_s + slow / config.load_slow_speed_mm_s
+
+        # Everything else from the planner: unload, cut, extruder feed, push.
+        plan_s = 0.0
+        if 1 <= lane <= geom.lanes:
+            t = plan_transition(geom, loaded, lane, parked)
+            transition_mm += t.retract_mm + t.feed_mm
+            guided = True
+            for step in t.steps:
+                if step.op == "wait_sensor":
+                    guided = False
+                elif step.op == "retract" or (step.op in ("feed", "push") and not guided):
+                    plan_s += _step_s(step.mm, step.f)
+            if loaded != NO_LANE and t.from_parked_mm is not None:
+                parked[loaded - 1] = t.from_parked_mm
+            parked[lane - 1] = 0.0
+
+        if failed:
+            errors += 1
+            controller.simulate_recover()
+            recoveries += 1
+            loaded = NO_LANE
+        else:
+            loaded = lane
+            modeled.append(round(load_s + plan_s, 4))
+
+    wall_s = time.monotonic() - started
+    plan = MMUManager().plan_toolchanges(changes)
+    metrics = {
+        "toolchanges": len(changes),
+        "skipped": skipped,
+        "errors": errors,
+        "recoveries": recoveries,
+        "triggered_early": early,
+        "toolchange_p50_s": round(_percentile(modeled, 0.50), 3),
+        "toolchange_p95_s": round(_percentile(modeled, 0.95), 3),
+        "toolchange_max_s": round(max(modeled, default=0.0), 3),
+        "modeled_total_s": round(sum(modeled), 3),
+        "slow_mm_total": round(slow_mm, 2),
+        "transition_mm_total": round(transition_mm, 2),
+        "purge_volume": plan["estimated_purge_volume"],
+    }
+    report = {
+        "source": workload.source,
+        "lanes": geom.lanes,
+        "speedup": speedup,
+        "metrics": metrics,
+        "warnings": plan["warnings"],
+        "wall_s": round(wall_s, 3),
+    }
+    if workload.recorded_s:
+        report["recorded"] = {
+            "toolchange_p50_s": round(_percentile(workload.recorded_s, 0.50), 3),
+            "toolchange_p95_s": round(_percentile(workload.recorded_s, 0.95), 3),
+        }
+    return report
+
+
+def compare(metrics: Dict, baseline: Dict, thresholds: Dict[str, Tuple[float, float]] = THRESHOLDS) -> List[Dict]:
+    """One row per gated metric; ``regression`` is set where ``metrics``
+    exceeds the baseline by more than its threshold."""
+    rows = []
+    for name, (rel, slack) in thresholds.items():
+        if name not in baseline or name not in metrics:
+            continue
+        base, cur = baseline[name], metrics[name]
+        limit = base * (1 + rel) + slack
+        rows.append({
+            "metric": name,
+            "baseline": base,
+            "current": cur,
+            "limit": round(limit, 4),
+            "regression": cur > limit + 1e-9,
+        })
+    return rows
+
+
+def _thresholds(baseline: Dict, overrides: Sequence[str]) -> Dict[str, Tuple[float, float]]:
+    out = dict(THRESHOLDS)
+    for name, value in baseline.get("thresholds", {}).items():
+        out[name] = tuple(value)
+    for item in overrides:
+        name, _, value = item.partition("=")
+        if name not in out:
+            raise SystemExit(f"unknown metric {name!r}; one of {', '.join(out)}")
+        rel, _, slack = value.partition(",")
+        out[name] = (float(rel), float(slack or out[name][1]))
+    return out
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="fluxpath-replay", description="Replay toolchanges and check for regressions")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--recording", help="telemetry recording id or directory")
+    src.add_argument("--gcode", type=Path, help="G-code file to take the tool sequence from")
+    src.add_argument("--sequence", help="comma-separated tool numbers, e.g. 0,1,2,1")
+    p.add_argument("--telemetry-dir", type=Path, default=None, help="telemetry root for --recording ids")
+    p.add_argument("--config", type=Path, default=CONFIG_PATH, help="fluxpath_config.json (defaults used if missing)")
+    p.add_argument("--lanes", type=int, default=None, help="override lane count from config")
+    p.add_argument("--speedup", type=float, default=DEFAULT_SPEEDUP, help="simulation speed factor")
+    p.add_argument("--baseline", type=Path, help="baseline JSON to compare against")
+    p.add_argument("--write-baseline", type=Path, help="store this run as a baseline")
+    p.add_argument("--threshold", action="append", default=[], metavar="METRIC=REL[,ABS]",
+                   help="override a regression threshold")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = p.parse_args(argv)
+
+    if args.recording:
+        workload = recording_workload(args.recording, args.telemetry_dir)
+    elif args.gcode:
+        workload = gcode_workload(args.gcode)
+    else:
+        workload = Workload("sequence", [int(t) for t in args.sequence.split(",") if t.strip()])
+
+    geom = load_lane_geometry(args.config, args.lanes)
+    if args.config.exists() and args.lanes is None:
+        from backend.mmu.routes import load_config
+
+        config = load_config(args.config)
+    else:
+        config = default_config(geom)
+
+    report = run_replay(workload, config, geom, args.speedup)
+    status = 0
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        rows = compare(report["metrics"], baseline["metrics"], _thresholds(baseline, args.threshold))
+        report["baseline"] = str(args.baseline)
+        report["comparison"] = rows
+        if any(r["regression"] for r in rows):
+            status = 1
+    if args.write_baseline:
+        args.write_baseline.write_text(json.dumps({
+            "source": report["source"],
+            "created_at": time.time(),
+            "metrics": report["metrics"],
+            "thresholds": {k: list(v) for k, v in THRESHOLDS.items()},
+        }, indent=2) + "\n")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return status
+
+    m = report["metrics"]
+    print(f"{report['source']}: {m['toolchanges']} toolchanges ({m['skipped']} skipped), "
+          f"{m['errors']} errors, replayed in {report['wall_s']:.2f} s at {report['speedup']:g}x")
+    for name, value in m.items():
+        print(f"  {name:<22} {value}")
+    if "recorded" in report:
+        r = report["recorded"]
+        print(f"  recorded p50/p95       {r['toolchange_p50_s']} / {r['toolchange_p95_s']} s")
+    for w in report["warnings"]:
+        print(f"  warning: {w}")
+    for r in report.get("comparison", []):
+        mark = "REGRESSION" if r["regression"] else "ok"
+        print(f"  {mark:<10} {r['metric']:<22} {r['baseline']} -> {r['current']} (limit {r['limit']})")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
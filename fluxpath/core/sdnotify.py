@@ -0,0 +1,39 @@
+# /home/syko/FluxPath/fluxpath/core/sdnotify.py
+#
+# systemd's notify protocol (Type=notify) without python-systemd: one
+# datagram per state change to $NOTIFY_SOCKET. Outside systemd, or under
+# Type=simple, NOTIFY_SOCKET is unset and every call is a no-op.
+
+import os
+import socket
+
+ENV = "NOTIFY_SOCKET"
+
+
+def notify(**fields) -> bool:
+    """``notify(READY=1, STATUS="...")``; True if the message was sent."""
+    path = os.environ.get(ENV)
+    if not path:
+        return False
+    if path.startswith("@"):
+        path = "\0" + path[1:]  # abstract namespace
+    message = "\n".join(f"{k}={v}" for k, v in fields.items()).encode()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(path)
+            sock.sendall(message)
+    except OSError:
+        return False
+    return True
+
+
+def ready(status: str = "") -> bool:
+    return notify(READY=1, STATUS=status) if status else notify(READY=1)
+
+
+def stopping() -> bool:
+    return notify(STOPPING=1)
+
+
+def status(text: str) -> bool:
+    return notify(STATUS=text)
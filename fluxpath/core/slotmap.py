@@ -0,0 +1,119 @@
+# /home/syko/FluxPath/fluxpath/core/slotmap.py
+
+import re
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from .color import color_distance
+from .matching import INFEASIBLE, solve_assignment
+from .mmu import ToolID, mmu_manager
+
+# Penalty (in CIEDE2000 units) for running a tool on a lane whose material is
+# a different variant of the same family, e.g. PLA requested, PLA+ loaded.
+MATERIAL_FAMILY_PENALTY = 15.0
+
+# Above this distance a substitution is clearly visible on the print.
+VISIBLE_DELTA_E = 10.0
+
+_T_COMMAND = re.compile(r"^(\s*)T(\d+)\b", re.MULTILINE)
+
+
+@dataclass
+class ToolMapping:
+    tool: ToolID
+    lane: Optional[ToolID]
+    delta_e: Optional[float]
+    material_match: str  # "exact", "family" or "none"
+
+
+def _material_family(material: str) -> str:
+    m = material.strip().upper()
+    return re.split(r"[\s+\-_]", m, maxsplit=1)[0] if m else m
+
+
+def material_match(requested: str, loaded: str) -> str:
+    if requested.strip().upper() == loaded.strip().upper():
+        return "exact"
+    if _material_family(requested) == _material_family(loaded):
+        return "family"
+    return "none"
+
+
+def _pair_cost(requested: Dict, loaded: Dict) -> float:
+    match = material_match(requested["material"], loaded["material"])
+    if match == "none":
+        return INFEASIBLE
+    cost = color_distance(requested["color_hex"], loaded["color_hex"])
+    if match == "family":
+        cost += MATERIAL_FAMILY_PENALTY
+    return cost
+
+
+def rewrite_tool_commands(gcode: str, rewrite: Dict[ToolID, ToolID]) -> str:
+    """Apply a tool remap to every ``Tn`` command in one pass, so swaps
+    (T0->T1, T1->T0) don't clobber each other."""
+    if not rewrite:
+        return gcode
+
+    def _sub(m: "re.Match[str]") -> str:
+        tool = int(m.group(2))
+        return f"{m.group(1)}T{rewrite.get(tool, tool)}"
+
+    return _T_COMMAND.sub(_sub, gcode)
+
+
+def map_slots(requested: List[Dict], loaded: List[Dict] | None = None) -> Dict:
+    """Find the tool -> lane mapping with the smallest total color distance
+    among materially compatible lanes."""
+    if loaded is None:
+        loaded = mmu_manager.get_filaments()
+
+    cost = [[_pair_cost(r, l) for l in loaded] for r in requested]
+    mappings: List[ToolMapping] = []
+    warnings: List[str] = []
+
+    for ri, li in solve_assignment(cost):
+        req = requested[ri]
+        if li is None:
+            mappings.append(
+                ToolMapping(tool=int(req["tool"]), lane=None, delta_e=None, material_match="none")
+            )
+            warnings.append(
+                f"T{req['tool']}: no loaded lane with compatible material {req['material']}"
+            )
+            continue
+        lane = loaded[li]
+        de = color_distance(req["color_hex"], lane["color_hex"])
+        mappings.append(
+            ToolMapping(
+                tool=int(req["tool"]),
+                lane=int(lane["tool"]),
+                delta_e=round(de, 2),
+                material_match=material_match(req["material"], lane["material"]),
+            )
+        )
+        if de > VISIBLE_DELTA_E:
+            warnings.append(
+                f"T{req['tool']} -> lane {lane['tool']}: visible color difference (dE {de:.1f})"
+            )
+
+    mapped = [m for m in mappings if m.lane is not None]
+    if mappings:
+        # 1.0 = every tool on an identical color of the same material;
+        # unmapped tools count as 0.
+        per_tool = [
+            max(0.0, 1.0 - (m.delta_e or 0.0) / 100.0) * (0.9 if m.material_match == "family" else 1.0)
+            for m in mapped
+        ]
+        score = round(sum(per_tool) / len(mappings), 4)
+    else:
+        score = 1.0
+
+    rewrite = {m.tool: m.lane for m in mapped if m.tool != m.lane}
+    return {
+        "mapping": [asdict(m) for m in mappings],
+        "score": score,
+        "complete": len(mapped) == len(mappings),
+        "rewrite": [{"from": f"T{t}", "to": f"T{l}"} for t, l in sorted(rewrite.items())],
+        "warnings": warnings,
+    }
@@ -0,0 +1,519 @@
+# /home/syko/FluxPath/fluxpath/core/spools.py
+#
+# Per-lane filament accounting. Each lane (tool number, like
+# Filament.tool) holds a spool with a remaining length; weight is
+# converted with the spool's diameter and material density. A G-code
+# scan gives each tool's net extrusion plus cumulative checkpoints over
+# the file, so a job can be checked at start ("will lane 2 run out, and
+# at what point?") and consumption can be booked from live print progress
+# (Moonraker's virtual_sdcard.progress is the same file-position fraction).
+
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .events import event_bus
+from .mmu import ToolID
+
+GCODE_DIR = Path(os.environ.get("FLUXPATH_GCODE_DIR", Path.home() / "printer_data" / "gcodes"))
+
+# "warn": report at job start. "block": also pause the print.
+RUNOUT_POLICY = os.environ.get("FLUXPATH_RUNOUT_POLICY", "warn")
+
+DEFAULT_DIAMETER = 1.75
+DEFAULT_DENSITY = 1.24
+# g/cm^3 by material family.
+DENSITY = {
+    "PLA": 1.24, "PETG": 1.27, "ABS": 1.04, "ASA": 1.07,
+    "TPU": 1.21, "PA": 1.14, "PC": 1.20, "PVA": 1.23, "HIPS": 1.04,
+}
+
+# A lane is flagged when less than this would be left at the end of the job.
+RUNOUT_RESERVE_MM = 500.0
+
+# Cumulative-extrusion checkpoints recorded per scanned file.
+CHECKPOINTS = 200
+
+# Progress is booked (journaled and published) once a lane has used this
+# much more, or the job moved this far, since the last booking; the
+# Moonraker probe reports progress every few seconds.
+BOOK_STEP_MM = 5.0
+BOOK_STEP_PROGRESS = 0.01
+
+_MOVES = (b"0", b"1", b"2", b"3")
+_E_WORD = re.compile(rb"\bE(-?\d*\.?\d+)")
+_TIME_COMMENTS = (
+    re.compile(rb"^;\s*estimated printing time(?: \(normal mode\))?\s*=\s*(.+)$"),
+    re.compile(rb"^;TIME:(\d+)"),
+)
+
+
+def density_for(material: Optional[str]) -> float:
+    family = re.split(r"[\s+\-_]", (material or "").strip().upper(), maxsplit=1)[0]
+    return DENSITY.get(family, DEFAULT_DENSITY)
+
+
+def mm_to_g(mm: float, diameter: float = DEFAULT_DIAMETER, density: float = DEFAULT_DENSITY) -> float:
+    return mm * math.pi * (diameter / 2) ** 2 * density / 1000.0
+
+
+def g_to_mm(grams: float, diameter: float = DEFAULT_DIAMETER, density: float = DEFAULT_DENSITY) -> float:
+    return grams * 1000.0 / (math.pi * (diameter / 2) ** 2 * density)
+
+
+def _parse_duration(text: bytes) -> Optional[float]:
+    text = text.strip()
+    if text.isdigit():
+        return float(text)
+    total = 0.0
+    for value, unit in re.findall(rb"(\d+)\s*([dhms])", text):
+        total += int(value) * {b"d": 86400, b"h": 3600, b"m": 60, b"s": 1}[unit]
+    return total or None
+
+
+# ---------------------------------------------------------
+# G-code scan
+# ---------------------------------------------------------
+def tool_number(line: bytes) -> Optional[ToolID]:
+    """The tool a ``Tn`` line selects; None for any other line (a bare
+    ``T``, ``T-1``, ``TIMELAPSE``, ...)."""
+    line = line.lstrip()
+    if line[:1] != b"T":
+        return None
+    parts = line[1:].split(None, 1)
+    num = parts[0] if parts else b""
+    return int(num) if num.isdigit() else None
+
+
+@dataclass
+class GcodeUsage:
+    """Net extrusion per tool for one G-code file."""
+
+    path: str
+    size: int
+    mtime: float
+    per_tool: Dict[ToolID, float] = field(default_factory=dict)
+    # (file fraction, {tool: cumulative mm}) in file order.
+    checkpoints: List[Tuple[float, Dict[ToolID, float]]] = field(default_factory=list)
+    estimated_time_s: Optional[float] = None
+
+    def used_at(self, progress: float) -> Dict[ToolID, float]:
+        """Cumulative extrusion per tool at a file-position fraction."""
+        if progress >= 1.0:
+            return dict(self.per_tool)
+        if progress <= 0.0:
+            return {}
+        i = bisect_right([c[0] for c in self.checkpoints], progress)
+        lo_f, lo = self.checkpoints[i - 1] if i else (0.0, {})
+        hi_f, hi = self.checkpoints[i] if i < len(self.checkpoints) else (1.0, self.per_tool)
+        t = (progress - lo_f) / (hi_f - lo_f) if hi_f > lo_f else 1.0
+        return {
+            tool: lo.get(tool, 0.0) + (hi.get(tool, 0.0) - lo.get(tool, 0.0)) * t
+            for tool in set(lo) | set(hi)
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "path": self.path,
+            "per_tool_mm": {t: round(mm, 1) for t, mm in sorted(self.per_tool.items())},
+            "estimated_time_s": self.estimated_time_s,
+        }
+
+
+def scan_gcode(path: Path, checkpoints: int = CHECKPOINTS) -> GcodeUsage:
+    """Sum net E per tool, honouring M82/M83, G92 E resets and T changes.
+
+    Moves before the first T command count for tool 0. Retractions are
+    subtracted, so a retract/unretract pair costs nothing.
+    """
+    path = Path(path)
+    st = path.stat()
+    usage = GcodeUsage(str(path), st.st_size, st.st_mtime)
+    per_tool = usage.per_tool
+    step = max(1, st.st_size // max(1, checkpoints))
+    next_mark = step
+    tool, relative, last_e, offset = 0, False, 0.0, 0
+
+    with open(path, "rb") as f:
+        for line in f:
+            offset += len(line)
+            line = line.lstrip()
+            c = line[:1]
+            if c == b"G":
+                # G0-G3 only (not G10, G28, ...)
+                if line[1:2] in _MOVES and not line[2:3].isdigit():
+                    semi = line.find(b";")
+                    m = _E_WORD.search(line if semi < 0 else line[:semi])
+                    if m:
+                        e = float(m.group(1))
+                        delta = e if relative else e - last_e
+                        last_e = e
+                        per_tool[tool] = per_tool.get(tool, 0.0) + delta
+                elif line.startswith(b"G92"):
+                    m = _E_WORD.search(line)
+                    if m:
+                        last_e = float(m.group(1))
+            elif c == b"T":
+                num = tool_number(line)
+                if num is not None:
+                    tool = num
+            elif c == b"M":
+                if line.startswith(b"M83"):
+                    relative = True
+                elif line.startswith(b"M82"):
+                    relative = False
+            elif c == b";" and usage.estimated_time_s is None:
+                for pattern in _TIME_COMMENTS:
+                    m = pattern.match(line.rstrip())
+                    if m:
+                        usage.estimated_time_s = _parse_duration(m.group(1))
+                        break
+            if offset >= next_mark:
+                usage.checkpoints.append((offset / st.st_size, dict(per_tool)))
+                next_mark += step
+    return usage
+
+
+class _UsageCache:
+    """Scans each file once per (size, mtime)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._items: Dict[str, GcodeUsage] = {}
+
+    def get(self, path: Path) -> GcodeUsage:
+        path = Path(path)
+        st = path.stat()
+        with self._lock:
+            cached = self._items.get(str(path))
+        if cached and (cached.size, cached.mtime) == (st.st_size, st.st_mtime):
+            return cached
+        usage = scan_gcode(path)
+        with self._lock:
+            self._items[str(path)] = usage
+        return usage
+
+
+def resolve_gcode(filename: str) -> Path:
+    path = Path(filename)
+    return path if path.is_absolute() else GCODE_DIR / path
+
+
+# ---------------------------------------------------------
+# Spools
+# ---------------------------------------------------------
+@dataclass
+class Spool:
+    lane: ToolID
+    remaining_mm: float
+    material: Optional[str] = None
+    diameter: float = DEFAULT_DIAMETER
+    density: float = DEFAULT_DENSITY
+    consumed_mm: float = 0.0  # since the spool was (re)entered
+    updated_at: float = 0.0
+
+    def to_dict(self) -> Dict:
+        d = asdict(self)
+        d["remaining_mm"] = round(self.remaining_mm, 1)
+        d["consumed_mm"] = round(self.consumed_mm, 1)
+        d["remaining_g"] = round(mm_to_g(self.remaining_mm, self.diameter, self.density), 1)
+        return d
+
+
+class SpoolTracker:
+    """Remaining filament per lane and consumption of the running job."""
+
+    def __init__(self, reserve_mm: float = RUNOUT_RESERVE_MM) -> None:
+        self.reserve_mm = reserve_mm
+        self._lock = threading.Lock()
+        self._spools: Dict[ToolID, Spool] = {}
+        self._job: Optional[Dict] = None
+        self._usage = _UsageCache()
+        self._journal = None
+
+    def set_journal(self, journal) -> None:
+        saved = journal.get("spools")
+        if saved:
+            self._load_spools(saved.get("spools", []))
+            self._job = saved.get("job")
+        self._journal = journal
+
+    def _load_spools(self, spools: List[Dict]) -> None:
+        with self._lock:
+            self._spools = {
+                int(s["lane"]): Spool(**{k: s[k] for k in Spool.__dataclass_fields__ if k in s})
+                for s in spools
+            }
+
+    def adopt(self, summary: Dict) -> None:
+        """Take over the owner process's spools (multi-worker mode) so
+        job checks can run here."""
+        self._load_spools(summary.get("spools", []))
+
+    # -------------------------------------------------
+    # Spools
+    # -------------------------------------------------
+    def spools(self) -> List[Dict]:
+        with self._lock:
+            return [s.to_dict() for _, s in sorted(self._spools.items())]
+
+    def set_spool(
+        self,
+        lane: ToolID,
+        remaining_mm: Optional[float] = None,
+        remaining_g: Optional[float] = None,
+        material: Optional[str] = None,
+        diameter: Optional[float] = None,
+        density: Optional[float] = None,
+    ) -> Dict:
+        with self._lock:
+            prev = self._spools.get(lane)
+            material = material if material is not None else (prev.material if prev else None)
+            diameter = diameter or (prev.diameter if prev else DEFAULT_DIAMETER)
+            density = density or (prev.density if prev and prev.material == material else density_for(material))
+            if remaining_mm is None and remaining_g is not None:
+                remaining_mm = g_to_mm(remaining_g, diameter, density)
+            if remaining_mm is None:
+                if prev is None:
+                    raise ValueError("remaining_mm or remaining_g is required for a new spool")
+                remaining_mm = prev.remaining_mm
+            spool = self._spools[lane] = Spool(
+                lane=lane,
+                remaining_mm=float(remaining_mm),
+                material=material,
+                diameter=float(diameter),
+                density=float(density),
+                updated_at=time.time(),
+            )
+        self._changed()
+        return spool.to_dict()
+
+    def consume(self, lane: ToolID, mm: float) -> None:
+        with self._lock:
+            self._consume(lane, mm)
+        self._changed()
+
+    def mark_empty(self, lane: ToolID) -> None:
+        """The lane's sensor reported a runout: whatever was entered, it's 0."""
+        with self._lock:
+            spool = self._spools.get(lane)
+            if spool is None or spool.remaining_mm == 0:
+                return
+            spool.remaining_mm = 0.0
+            spool.updated_at = time.time()
+        self._changed()
+
+    def _consume(self, lane: ToolID, mm: float) -> None:
+        spool = self._spools.get(lane)
+        if spool is None or mm == 0:
+            return
+        spool.remaining_mm = max(0.0, spool.remaining_mm - mm)
+        spool.consumed_mm += mm
+        spool.updated_at = time.time()
+
+    # -------------------------------------------------
+    # Prediction
+    # -------------------------------------------------
+    def usage(self, filename: str) -> GcodeUsage:
+        return self._usage.get(resolve_gcode(filename))
+
+    def predict(
+        self,
+        usage: GcodeUsage,
+        tool_map: Optional[Dict[ToolID, ToolID]] = None,
+        progress: float = 0.0,
+    ) -> Dict:
+        """Will every lane last from ``progress`` to the end of the job?
+
+        ``tool_map`` sends G-code tools to lanes (identity by default).
+        For a lane that runs short, ``runout_progress`` is the file
+        fraction where it empties and ``runout_in_s`` an estimate from the
+        slicer's print time, when the file carries one.
+        """
+        tool_map = tool_map or {}
+
+        def by_lane(per_tool: Dict[ToolID, float]) -> Dict[ToolID, float]:
+            out: Dict[ToolID, float] = {}
+            for tool, mm in per_tool.items():
+                lane = tool_map.get(tool, tool)
+                out[lane] = out.get(lane, 0.0) + mm
+            return out
+
+        done = by_lane(usage.used_at(progress))
+        total = by_lane(usage.per_tool)
+        lanes, warnings = [], []
+        ok = True
+        with self._lock:
+            spools = {k: Spool(**asdict(v)) for k, v in self._spools.items()}
+
+        for lane, lane_total in sorted(total.items()):
+            needed = max(0.0, lane_total - done.get(lane, 0.0))
+            if needed <= 0:
+                continue
+            spool = spools.get(lane)
+            entry = {"lane": lane, "needed_mm": round(needed, 1), "remaining_mm": None, "status": "unknown"}
+            if spool is None:
+                warnings.append(f"Lane {lane}: no spool length entered, cannot check {needed / 1000:.1f} m")
+                lanes.append(entry)
+                continue
+            entry["remaining_mm"] = round(spool.remaining_mm, 1)
+            entry["needed_g"] = round(mm_to_g(needed, spool.diameter, spool.density), 1)
+            left = spool.remaining_mm - needed
+            entry["left_mm"] = round(left, 1)
+            if left >= self.reserve_mm:
+                entry["status"] = "ok"
+            elif left >= 0:
+                entry["status"] = "low"
+                warnings.append(f"Lane {lane}: only {left:.0f} mm would be left at the end")
+            else:
+                ok = False
+                entry["status"] = "runout"
+                at = self._runout_point(usage, by_lane, lane, done.get(lane, 0.0) + spool.remaining_mm, progress)
+                entry["runout_progress"] = round(at, 4)
+                if usage.estimated_time_s:
+                    entry["runout_in_s"] = round((at - progress) * usage.estimated_time_s)
+                warnings.append(
+                    f"Lane {lane}: needs {needed / 1000:.2f} m, {spool.remaining_mm / 1000:.2f} m left; "
+                    f"runs out at {at * 100:.0f}% of the file"
+                )
+            lanes.append(entry)
+
+        return {
+            "ok": ok,
+            "progress": progress,
+            "file": usage.summary(),
+            "lanes": lanes,
+            "warnings": warnings,
+        }
+
+    @staticmethod
+    def _runout_point(usage: GcodeUsage, by_lane, lane: ToolID, empty_at_mm: float, progress: float) -> float:
+        prev_f, prev_mm = progress, by_lane(usage.used_at(progress)).get(lane, 0.0)
+        for frac, cumulative in usage.checkpoints + [(1.0, usage.per_tool)]:
+            if frac <= progress:
+                continue
+            mm = by_lane(cumulative).get(lane, 0.0)
+            if mm >= empty_at_mm:
+                span = mm - prev_mm
+                return prev_f + (frac - prev_f) * ((empty_at_mm - prev_mm) / span if span > 0 else 0.0)
+            prev_f, prev_mm = frac, mm
+        return 1.0
+
+    # -------------------------------------------------
+    # Running job
+    # -------------------------------------------------
+    def job(self) -> Optional[Dict]:
+        return self._job
+
+    def start_job(self, filename: str, tool_map: Optional[Dict[ToolID, ToolID]] = None) -> Dict:
+        usage = self.usage(filename)
+        prediction = self.predict(usage, tool_map)
+        with self._lock:
+            self._job = {
+                "filename": filename,
+                "tool_map": {int(k): int(v) for k, v in (tool_map or {}).items()},
+                "progress": 0.0,
+                "booked": {},
+                "started_at": time.time(),
+                "prediction": prediction,
+            }
+        self._changed()
+        event_bus.publish("job", {"state": "started", "filename": filename, "ok": prediction["ok"]})
+        return prediction
+
+    def set_tool_map(self, tool_map: Dict[ToolID, ToolID]) -> None:
+        """Tools were remapped mid-job (runout failover); book further
+        consumption against the new lanes."""
+        with self._lock:
+            if self._job is not None:
+                self._job["tool_map"] = {int(t): int(l) for t, l in tool_map.items()}
+
+    def update_progress(self, progress: float) -> None:
+        """Book consumption from the job's start up to ``progress``."""
+        job = self._job
+        if job is None:
+            return
+        try:
+            usage = self.usage(job["filename"])
+        except OSError:
+            return
+        progress = min(1.0, max(progress, job["progress"]))
+        step = 0.1 if progress >= 1.0 else BOOK_STEP_MM
+        tool_map = {int(k): v for k, v in job["tool_map"].items()}
+        with self._lock:
+            booked = {int(k): v for k, v in job["booked"].items()}
+            changed = False
+            for tool, mm in usage.used_at(progress).items():
+                delta = mm - booked.get(tool, 0.0)
+                if abs(delta) >= step:
+                    self._consume(tool_map.get(tool, tool), delta)
+                    booked[tool] = mm
+                    changed = True
+            if not changed and progress - job["progress"] < BOOK_STEP_PROGRESS and progress < 1.0:
+                return
+            job["booked"] = booked
+            job["progress"] = progress
+        self._changed()
+
+    def finish_job(self, completed: bool) -> None:
+        if self._job is None:
+            return
+        if completed:
+            self.update_progress(1.0)
+        with self._lock:
+            filename = self._job["filename"]
+            self._job = None
+        self._changed()
+        event_bus.publish("job", {"state": "complete" if completed else "ended", "filename": filename})
+
+    def observe(self, print_stats: Dict, virtual_sdcard: Dict) -> Optional[Dict]:
+        """Follow Moonraker's print state. Returns the start-of-job
+        prediction when a new job is seen, else None."""
+        state = print_stats.get("state")
+        filename = print_stats.get("filename") or ""
+        job = self._job
+        if job is not None and (job["filename"] != filename or state in ("complete", "cancelled", "error", "standby")):
+            self.finish_job(completed=state == "complete" and job["filename"] == filename)
+            job = None
+        if state not in ("printing", "paused") or not filename:
+            return None
+        if job is None:
+            try:
+                prediction = self.start_job(filename)
+            except OSError:
+                return None
+            self.update_progress(float(virtual_sdcard.get("progress") or 0.0))
+            return prediction
+        self.update_progress(float(virtual_sdcard.get("progress") or 0.0))
+        return None
+
+    def summary(self) -> Dict:
+        job = self._job
+        return {
+            "spools": self.spools(),
+            "job": None if job is None else {
+                "filename": job["filename"],
+                "progress": job["progress"],
+                "ok": job["prediction"]["ok"],
+                "warnings": job["prediction"]["warnings"],
+            },
+        }
+
+    def _changed(self) -> None:
+        with self._lock:
+            data = {
+                "spools": [asdict(s) for s in self._spools.values()],
+                "job": self._job,
+            }
+        if self._journal is not None:
+            self._journal.record("spools", data)
+        event_bus.publish("spools", self.summary())
+
+
+spool_tracker = SpoolTracker()
@@ -0,0 +1,189 @@
+# /home/syko/FluxPath/fluxpath/core/startup.py
+#
+# Startup and memory budget check for the backend. Each run starts a
+# private backend (`python -m fluxpath.server`) on a free loopback port
+# with its own control socket, log, telemetry and state directories (the
+# state is a copy of the real one, so the journal restore is part of the
+# measurement) and records:
+#
+#   ready_s        spawn -> READY=1 on $NOTIFY_SOCKET, as systemd sees it
+#   first_mmu_ms   first GET /mmu/status after ready
+#   warm_mmu_ms    the same request again
+#   rss_mb         resident memory after --settle seconds (steady state)
+#   peak_rss_mb    high-water mark over the same period
+#   stop_s         SIGTERM -> exit
+#
+# The median of --runs runs is compared against BUDGETS (override with
+# --budget METRIC=LIMIT); the command exits 1 if any metric is over:
+#
+#   python -m fluxpath.core.startup --runs 3
+#   python -m fluxpath.core.startup --env FLUXPATH_WARMUP=0 --budget first_mmu_ms=500
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .journal import STATE_DIR
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Sized for a Pi 3 / Zero 2 sharing the host with Klipper and Moonraker.
+BUDGETS: Dict[str, float] = {
+    "ready_s": 8.0,
+    "first_mmu_ms": 100.0,
+    "rss_mb": 75.0,
+    "peak_rss_mb": 90.0,
+    "stop_s": 5.0,
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _proc_status(pid: int) -> Dict[str, str]:
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return fields
+
+
+def _kb_to_mb(value: str) -> float:
+    return round(int(value.split()[0]) / 1024, 1)
+
+
+def _get_ms(url: str, timeout: float = 10.0) -> float:
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        r.read()
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def measure(settle: float = 5.0, timeout: float = 60.0, env: Optional[Dict[str, str]] = None) -> Dict[str, float]:
+    """One cold start of a private backend; see the module comment."""
+    with tempfile.TemporaryDirectory(prefix="fluxpath-startup-") as tmp:
+        tmp = Path(tmp)
+        state = tmp / "state"
+        if STATE_DIR.is_dir():
+            shutil.copytree(STATE_DIR, state)
+        notify = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        notify.bind(str(tmp / "notify.sock"))
+        port = _free_port()
+        child_env = dict(
+            os.environ,
+            NOTIFY_SOCKET=str(tmp / "notify.sock"),
+            FLUXPATH_LISTEN=f"127.0.0.1:{port}",
+            FLUXPATH_WORKERS="1",
+            FLUXPATH_CONTROL_SOCKET=str(tmp / "fluxpath.sock"),
+            FLUXPATH_STATE_DIR=str(state),
+            FLUXPATH_TELEMETRY_DIR=str(tmp / "telemetry"),
+            FLUXPATH_LOG_DIR=str(tmp / "logs"),
+            **(env or {}),
+        )
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "fluxpath.server"], cwd=REPO_ROOT, env=child_env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            notify.settimeout(0.2)
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError("backend exited ({0}): {1}".format(
+                        proc.returncode, proc.stderr.read().decode(errors="replace")[-2000:]))
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"no READY=1 within {timeout:g}s")
+                try:
+                    msg = notify.recv(4096).decode()
+                except socket.timeout:
+                    continue
+                if "READY=1" in msg.split("\n"):
+                    break
+            result = {"ready_s": round(time.perf_counter() - started, 3)}
+
+            base = f"http://127.0.0.1:{port}"
+            result["first_mmu_ms"] = _get_ms(base + "/mmu/status")
+            result["warm_mmu_ms"] = _get_ms(base + "/mmu/status")
+
+            time.sleep(settle)
+            status = _proc_status(proc.pid)
+            result["rss_mb"] = _kb_to_mb(status["VmRSS"])
+            result["peak_rss_mb"] = _kb_to_mb(status["VmHWM"])
+            result["threads"] = int(status["Threads"])
+
+            stopping = time.perf_counter()
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout)
+            result["stop_s"] = round(time.perf_counter() - stopping, 3)
+            return result
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            notify.close()
+
+
+def check(runs: List[Dict[str, float]], budgets: Dict[str, float]) -> List[Dict]:
+    rows = []
+    for metric in runs[0]:
+        median = statistics.median(r[metric] for r in runs)
+        limit = budgets.get(metric)
+        rows.append({"metric": metric, "median": median, "runs": [r[metric] for r in runs],
+                     "budget": limit, "over": limit is not None and median > limit})
+    return rows
+
+
+def _pairs(items: List[str]) -> Dict[str, str]:
+    out = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"expected KEY=VALUE, got {item!r}")
+        out[key.strip()] = value
+    return out
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="fluxpath-startup", description="Check backend startup time and memory budgets")
+    p.add_argument("--runs", type=int, default=3, help="cold starts to take the median of")
+    p.add_argument("--settle", type=float, default=5.0, help="seconds after ready before reading RSS")
+    p.add_argument("--timeout", type=float, default=60.0, help="give up on a start after this long")
+    p.add_argument("--budget", action="append", default=[], metavar="METRIC=LIMIT", help="override a budget")
+    p.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                   help="extra environment for the backend, e.g. MALLOC_ARENA_MAX=2")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = p.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    budgets.update({k: float(v) for k, v in _pairs(args.budget).items()})
+    env = _pairs(args.env)
+    runs = [measure(args.settle, args.timeout, env) for _ in range(args.runs)]
+    rows = check(runs, budgets)
+    status = 1 if any(r["over"] for r in rows) else 0
+
+    if args.json:
+        print(json.dumps({"runs": runs, "budgets": budgets, "check": rows, "ok": status == 0}, indent=2))
+        return status
+    for r in rows:
+        limit = "" if r["budget"] is None else f"budget {r['budget']:g}"
+        flag = "  OVER" if r["over"] else ""
+        print(f"  {r['metric']:<14} {r['median']:>9g}   {limit:<14} {' '.join(f'{v:g}' for v in r['runs'])}{flag}")
+    print("OK" if status == 0 else "over budget")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
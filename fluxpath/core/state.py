@@ -0,0 +1,45 @@
+# /home/syko/FluxPath/fluxpath/core/state.py
+
+from .events import event_bus
+from .journal import state_journal
+
+# Journal shared by every router in the process.
+JOURNAL_NAME = "fluxpath"
+
+# ---------------------------------------------------------
+# Virtual printer + MMU state (replace with real MMU later)
+# ---------------------------------------------------------
+printer_state = {
+    "name": "FluxPath Virtual Printer",
+    "model": "FluxPath-MMU",
+    "firmware": "1.0.0",
+    "status": "idle",
+    "job": None,
+    "mmu": {
+        "enabled": True,
+        "slots": 4,
+        "active_slot": 1,
+        "filaments": [
+            {"slot": 1, "color": "red", "material": "PLA"},
+            {"slot": 2, "color": "blue", "material": "PLA"},
+            {"slot": 3, "color": "green", "material": "PLA"},
+            {"slot": 4, "color": "yellow", "material": "PLA"},
+        ],
+    },
+}
+
+
+def journal():
+    return state_journal(JOURNAL_NAME)
+
+
+def update_printer_state(**changes):
+    printer_state.update(changes)
+    journal().record("printer_state", printer_state)
+    event_bus.publish("printer_state", printer_state)
+
+
+def restore_printer_state():
+    saved = journal().get("printer_state")
+    if saved:
+        printer_state.update(saved)
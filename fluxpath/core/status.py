@@ -0,0 +1,228 @@
+# /home/syko/FluxPath/fluxpath/core/status.py
+#
+# One aggregate status document (backend health, Moonraker, MMU, sensors,
+# motors, webcam) so monitors make one request -- or hold one stream --
+# instead of six requests per refresh. External probes run on a timer;
+# printer and MMU changes rebuild the document immediately from the event
+# bus. "status_all" is published only when the content actually changed.
+# The Moonraker probe also follows the running print so spool consumption
+# is booked from live progress (see spools.py).
+
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional, Tuple
+
+from .. import __version__
+from .events import event_bus
+from .spools import RUNOUT_POLICY, spool_tracker
+from .state import printer_state, update_printer_state
+
+log = logging.getLogger(__name__)
+
+MOONRAKER_URL = os.environ.get("FLUXPATH_MOONRAKER_URL", "http://127.0.0.1:7125")
+WEBCAM_URL = os.environ.get("FLUXPATH_WEBCAM_URL", "http://127.0.0.1:8080/?action=snapshot")
+
+PROBE_INTERVAL = 3.0
+PROBE_TIMEOUT = 2.0
+
+
+def probe_moonraker(base_url: str = MOONRAKER_URL, timeout: float = PROBE_TIMEOUT) -> Dict[str, Any]:
+    try:
+        with urllib.request.urlopen(base_url + "/printer/info", timeout=timeout) as r:
+            data = json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return {"ok": False, "error": f"HTTP {e.code}"}
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e) or type(e).__name__}
+    return {"ok": True, "info": data.get("result", data)}
+
+
+def probe_print(base_url: str = MOONRAKER_URL, timeout: float = PROBE_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """print_stats, virtual_sdcard, the MMU failover variables and the
+    published MMU state (klipper_status.py) from Moonraker, or None if
+    unreachable."""
+    url = base_url + (
+        "/printer/objects/query?print_stats=state,filename&virtual_sdcard=progress"
+        "&gcode_macro%20MMU_VARS=runout_backup,empty,tool_map"
+        "&gcode_macro%20_FLUXPATH_MMU=backend"
+    )
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            return json.loads(r.read())["result"]["status"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def run_gcode(script: str, base_url: str = MOONRAKER_URL, timeout: float = PROBE_TIMEOUT) -> bool:
+    req = urllib.request.Request(
+        base_url + "/printer/gcode/script",
+        data=json.dumps({"script": script}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _follow_print(status: Optional[Dict[str, Any]]) -> None:
+    """Book spool consumption, check a newly started job for runouts and
+    keep Klipper's runout failover table current."""
+    from .failover import runout_failover
+
+    if status is None:
+        return
+    print_stats = status.get("print_stats") or {}
+    prediction = spool_tracker.observe(print_stats, status.get("virtual_sdcard") or {})
+    if prediction is not None and not prediction["ok"]:
+        msg = "; ".join(prediction["warnings"]).replace('"', "'")
+        script = 'RESPOND TYPE=error MSG="FluxPath: {0}"'.format(msg)
+        if RUNOUT_POLICY == "block":
+            script += "\nPAUSE"
+        run_gcode(script)
+    printing = print_stats.get("state") in ("printing", "paused")
+    _follow_printer_state(print_stats, printing)
+    script = runout_failover.sync(status.get("gcode_macro MMU_VARS"), printing)
+    if script:
+        run_gcode(script)
+
+
+def _follow_printer_state(print_stats: Dict[str, Any], printing: bool) -> None:
+    """Journal and publish printer_state when Klipper's print state or
+    file changes (Klipper's "standby" is the backend's "idle")."""
+    state = print_stats.get("state")
+    if not state:
+        return
+    status = "idle" if state == "standby" else state
+    job = (print_stats.get("filename") or None) if printing else None
+    if (printer_state["status"], printer_state["job"]) != (status, job):
+        update_printer_state(status=status, job=job)
+
+
+def probe_webcam(url: str = WEBCAM_URL, timeout: float = PROBE_TIMEOUT) -> Dict[str, Any]:
+    # Only the status line matters; the snapshot body is never read.
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            code = r.status
+    except urllib.error.HTTPError as e:
+        code = e.code
+    except OSError as e:
+        return {"ok": False, "http_code": None, "error": str(e) or type(e).__name__}
+    return {"ok": 200 <= code < 400, "http_code": code}
+
+
+def _mmu_sections() -> Dict[str, Any]:
+    from backend.mmu import routes as mmu_routes
+
+    try:
+        mmu = mmu_routes.get_mmu()
+    except RuntimeError as e:
+        err = {"error": str(e)}
+        return {"mmu": err, "sensors": err, "motors": err}
+    return {
+        "mmu": mmu.snapshot().to_dict(),
+        "sensors": [s.dict() for s in mmu_routes.sensors(mmu)],
+        "motors": [m.dict() for m in mmu_routes.motors(mmu)],
+    }
+
+
+class StatusAggregator:
+    """Cached ``/status/all`` document, kept fresh in the background."""
+
+    def __init__(self, interval: float = PROBE_INTERVAL) -> None:
+        self.interval = interval
+        self._external: Dict[str, Any] = {
+            "printer": {"ok": False, "error": "not probed yet"},
+            "webcam": {"ok": False, "http_code": None, "error": "not probed yet"},
+        }
+        self._content: Optional[Dict[str, Any]] = None
+        self._doc: Optional[Dict[str, Any]] = None
+        self._probed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _build(self) -> Dict[str, Any]:
+        content = {
+            "health": {"status": "ok", "version": __version__},
+            "printer": self._external["printer"],
+            "printer_state": {"status": printer_state["status"], "job": printer_state["job"]},
+            "webcam": self._external["webcam"],
+            "spools": spool_tracker.summary(),
+        }
+        content.update(_mmu_sections())
+        return content
+
+    def document(self) -> Dict[str, Any]:
+        if self._doc is None:
+            self._commit(self._build())
+        return self._doc
+
+    def external(self, name: str) -> Tuple[Dict[str, Any], Optional[float]]:
+        """Last result of one external probe and its age (None if never run)."""
+        age = time.monotonic() - self._probed_at if self._probed_at else None
+        return self._external[name], age
+
+    def adopt(self, doc: Dict[str, Any]) -> None:
+        """Serve the owner process's document (multi-worker mode)."""
+        self._content = {k: v for k, v in doc.items() if k != "updated_at"}
+        self._doc = doc
+
+    def _commit(self, content: Dict[str, Any]) -> bool:
+        if content == self._content:
+            return False
+        self._content = content
+        self._doc = dict(content, updated_at=time.time())
+        return True
+
+    async def refresh(self, probe: bool = False) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        if probe:
+            printer, webcam, job = await asyncio.gather(
+                loop.run_in_executor(None, probe_moonraker),
+                loop.run_in_executor(None, probe_webcam),
+                loop.run_in_executor(None, probe_print),
+            )
+            await loop.run_in_executor(None, _follow_print, job)
+            # None: Klipper unreachable; {}: running without the macro.
+            event_bus.publish("klipper_mmu", None if job is None else job.get("gcode_macro _FLUXPATH_MMU", {}))
+            self._external = {"printer": printer, "webcam": webcam}
+            self._probed_at = time.monotonic()
+        if self._commit(await loop.run_in_executor(None, self._build)):
+            event_bus.publish("status_all", self._doc)
+        return self._doc
+
+    async def run(self) -> None:
+        next_probe = 0.0
+        with event_bus.subscribe(["printer_state", "mmu_status", "spools"]) as sub:
+            while True:
+                probe = time.monotonic() >= next_probe
+                try:
+                    await self.refresh(probe=probe)
+                except Exception:
+                    # Everything that polls or streams status depends on
+                    # this one task; keep it alive and retry on schedule.
+                    log.exception("FluxPath status refresh failed")
+                if probe:
+                    next_probe = time.monotonic() + self.interval
+                await sub.get(timeout=max(0.0, next_probe - time.monotonic()))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+status_aggregator = StatusAggregator()
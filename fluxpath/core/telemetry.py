@@ -0,0 +1,524 @@
+# /home/syko/FluxPath/fluxpath/core/telemetry.py
+#
+# Per-print telemetry recorder. Every job gets a recording directory under
+# the instance logs dir (<instance>/logs/telemetry); events
+# outside a job go to a per-day "session" recording. A recording is five
+# append-only column files (t, kind, lane, value, label), each a sequence
+# of zlib-compressed blocks, plus a fixed-width block index that says
+# which time range each block covers and where its column pieces start.
+# Blocks are written column pieces first and fsynced, index record last,
+# so neither a crash nor a power cut leaves the index pointing at a torn
+# block (at worst the last index record is lost or torn, and ignored).
+#
+# Queries mmap the index and column files, skip recordings and blocks
+# outside the requested range by their time bounds, decompress only the
+# overlapping blocks, and reduce each (kind, lane) series to at most
+# ``points`` samples with LTTB. Rare discrete rows (errors, failed
+# phases, job boundaries) are never downsampled.
+
+import asyncio
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from array import array
+from itertools import accumulate
+from pathlib import Path
+from struct import Struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fp_core.config import INSTANCE_DATA_BASE
+
+from .events import event_bus
+
+INSTANCE_ID = int(os.environ.get("FLUXPATH_INSTANCE_ID", "1"))
+
+BLOCK_ROWS = 4096
+FLUSH_INTERVAL = 5.0
+ZLIB_LEVEL = 6
+DEFAULT_POINTS = 500
+MAX_EVENTS = 5000
+
+# Append-only: a kind's position is its id on disk.
+KINDS = (
+    "status",        # MMU state change; value = STATES index, label = state
+    "filament",      # slot presence; value 0/1
+    "load_mm",       # measured park -> sensor distance
+    "error",         # label = message
+    "sensor",        # filament sensor edge; value 0/1
+    "phase",         # value = duration s, label = phase name
+    "phase_failed",  # value = duration s, label = "phase: error"
+    "printer",       # printer status change; label = status
+    "progress",      # job file progress 0..1
+    "spool",         # remaining mm per lane
+    "job",           # label = "started|complete|ended: filename"
+)
+KIND_IDS = {k: i for i, k in enumerate(KINDS)}
+DISCRETE = frozenset(("error", "phase_failed", "job"))
+
+STATES = ("idle", "loading", "unloading", "toolchange", "error", "recovering")
+
+COLUMNS = (("t", "q"), ("kind", "B"), ("lane", "b"), ("value", "d"), ("label", "I"))
+# t_min_us, t_max_us, rows, kind bitmask, then (offset, length) per
+# column. The bitmask lets kind-filtered queries (e.g. only failed phases)
+# skip blocks without decompressing them.
+_INDEX = Struct("<qqII" + "QI" * len(COLUMNS))
+NO_LANE = -1
+
+
+def _le(arr: array) -> array:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def telemetry_dir(instance_id: int = INSTANCE_ID) -> Path:
+    override = os.environ.get("FLUXPATH_TELEMETRY_DIR")
+    if override:
+        return Path(override)
+    path = INSTANCE_DATA_BASE / f"instance_{instance_id}" / "logs" / "telemetry"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", Path(text).stem)[:48] or "job"
+
+
+# ---------------------------------------------------------
+# Writer
+# ---------------------------------------------------------
+class RecordingWriter:
+    def __init__(self, directory: Path, meta: Dict[str, Any]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta_path = self.directory / "meta.json"
+        saved = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        self.meta = dict(saved, **meta)
+        self.meta.setdefault("id", self.directory.name)
+        self.meta.setdefault("rows", 0)
+
+        labels_path = self.directory / "labels.txt"
+        labels = labels_path.read_text().split("\n")[:-1] if labels_path.exists() else []
+        self._labels = {label: i for i, label in enumerate(labels)}
+        self._label_fh = open(labels_path, "a")
+        if not labels:
+            self._label("")
+
+        # Rows arrive on the event loop while flushes run in the executor.
+        self._lock = threading.RLock()
+        self._cols = {name: array(code) for name, code in COLUMNS}
+        self._fhs = {name: open(self.directory / f"{name}.col", "ab") for name, _ in COLUMNS}
+        self._index = open(self.directory / "index.bin", "ab")
+        self._write_meta()
+
+    def _label(self, text: str) -> int:
+        text = text.replace("\n", " ")
+        idx = self._labels.get(text)
+        if idx is None:
+            idx = self._labels[text] = len(self._labels)
+            self._label_fh.write(text + "\n")
+            self._label_fh.flush()
+        return idx
+
+    def append(self, t: float, kind: str, lane: Optional[int] = None, value: float = 0.0, label: str = "") -> None:
+        with self._lock:
+            cols = self._cols
+            cols["t"].append(int(t * 1e6))
+            cols["kind"].append(KIND_IDS[kind])
+            cols["lane"].append(NO_LANE if lane is None else max(-128, min(127, int(lane))))
+            cols["value"].append(float(value))
+            cols["label"].append(self._label(label) if label else 0)
+            if len(cols["t"]) >= BLOCK_ROWS:
+                self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._cols["t"])
+
+    def flush(self) -> None:
+        with self._lock:
+            cols = self._cols
+            t = cols["t"]
+            if not t:
+                return
+            self._write_block(cols)
+            self._cols = {name: array(code) for name, code in COLUMNS}
+
+    def _write_block(self, cols: Dict[str, array]) -> None:
+        t = cols["t"]
+        entries: List[int] = []
+        for name, _ in COLUMNS:
+            arr = cols[name]
+            if name == "t":
+                # Timestamps are close together: deltas compress far better.
+                arr = array("q", [t[0]] + [b - a for a, b in zip(t, t[1:])])
+            data = zlib.compress(_le(arr).tobytes(), ZLIB_LEVEL)
+            fh = self._fhs[name]
+            offset = fh.tell()
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+            entries += [offset, len(data)]
+        # Labels the block refers to must be on disk before it is indexed.
+        os.fsync(self._label_fh.fileno())
+        mask = 0
+        for k in set(cols["kind"]):
+            mask |= 1 << k
+        self._index.write(_INDEX.pack(min(t), max(t), len(t), mask, *entries))
+        self._index.flush()
+
+        self.meta["rows"] += len(t)
+        self.meta.setdefault("t_first", min(t) / 1e6)
+        self.meta["t_last"] = max(t) / 1e6
+        self._write_meta()
+
+    def close(self, **meta) -> None:
+        with self._lock:
+            self.flush()
+            self.meta.update(meta)
+            self._write_meta()
+            for fh in list(self._fhs.values()) + [self._index, self._label_fh]:
+                fh.close()
+
+    def _write_meta(self) -> None:
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta))
+        os.replace(tmp, self.directory / "meta.json")
+
+
+# ---------------------------------------------------------
+# Reader
+# ---------------------------------------------------------
+def _map(path: Path) -> Optional[mmap.mmap]:
+    try:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # missing or empty
+        return None
+
+
+class Recording:
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        self.id = self.directory.name
+
+    def meta(self) -> Dict[str, Any]:
+        try:
+            return json.loads((self.directory / "meta.json").read_text())
+        except (OSError, ValueError):
+            return {"id": self.id}
+
+    def labels(self) -> List[str]:
+        try:
+            return (self.directory / "labels.txt").read_text().split("\n")[:-1]
+        except OSError:
+            return [""]
+
+    def blocks(self, start_us: int, end_us: int, mask: int = ~0) -> Iterator[Tuple]:
+        index = _map(self.directory / "index.bin")
+        if index is None:
+            return
+        with index:
+            # A torn trailing record (crash mid-write) is ignored.
+            whole = len(index) - len(index) % _INDEX.size
+            for rec in _INDEX.iter_unpack(memoryview(index)[:whole]):
+                if rec[1] >= start_us and rec[0] <= end_us and rec[3] & mask:
+                    yield rec
+
+    def rows(self, start_us: int, end_us: int, kinds: Optional[Iterable[int]] = None,
+             lane: Optional[int] = None) -> Iterator[Tuple[int, int, int, float, int]]:
+        kinds = None if kinds is None else set(kinds)
+        mask = ~0 if kinds is None else sum(1 << k for k in kinds)
+        blocks = list(self.blocks(start_us, end_us, mask))
+        if not blocks:
+            return
+        maps = {name: _map(self.directory / f"{name}.col") for name, _ in COLUMNS}
+        try:
+            if any(m is None for m in maps.values()):
+                return
+            for rec in blocks:
+                cols = []
+                for i, (name, code) in enumerate(COLUMNS):
+                    offset, length = rec[4 + 2 * i], rec[5 + 2 * i]
+                    arr = _le(array(code, zlib.decompress(maps[name][offset:offset + length])))
+                    cols.append(accumulate(arr) if name == "t" else arr)
+                for t, k, ln, v, lb in zip(*cols):
+                    if start_us <= t <= end_us and (kinds is None or k in kinds) and (lane is None or ln == lane):
+                        yield t, k, ln, v, lb
+        finally:
+            for m in maps.values():
+                if m is not None:
+                    m.close()
+
+
+def lttb(ts: Sequence[float], vs: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets: indexes of ``threshold`` points that
+    keep the visual shape of the series."""
+    n = len(ts)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_lo = int((i + 1) * every) + 1
+        avg_hi = min(int((i + 2) * every) + 1, n)
+        count = avg_hi - avg_lo
+        avg_t = sum(ts[avg_lo:avg_hi]) / count
+        avg_v = sum(vs[avg_lo:avg_hi]) / count
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        at, av = ts[a], vs[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((at - avg_t) * (vs[j] - av) - (at - ts[j]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+
+# ---------------------------------------------------------
+# Recorder
+# ---------------------------------------------------------
+class TelemetryRecorder:
+    TOPICS = ("mmu_status", "mmu_event", "printer_state", "spools", "job")
+
+    def __init__(self, root: Optional[Path] = None) -> None:
+        self._root = root
+        self._writer: Optional[RecordingWriter] = None
+        self._job: Optional[str] = None
+        self._prev_mmu: Optional[Dict] = None
+        self._prev_printer: Optional[str] = None
+        self._prev_spools: Dict[int, float] = {}
+        self._prev_progress: Optional[float] = None
+        self._flushed_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = telemetry_dir()
+        return self._root
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        root = await loop.run_in_executor(None, lambda: self.root)
+        root.mkdir(parents=True, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        # Deep queue: unlike status monitors, every message matters here.
+        with event_bus.subscribe(self.TOPICS, maxsize=4096) as sub:
+            while True:
+                msg = await sub.get(timeout=FLUSH_INTERVAL)
+                if msg is not None:
+                    self.record(msg["event"], msg["data"])
+                if self._writer is not None and self._writer.pending and (
+                    time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+                ):
+                    await loop.run_in_executor(None, self._writer.flush)
+                    self._flushed_at = time.monotonic()
+
+    # -------------------------------------------------
+    # Recording selection
+    # -------------------------------------------------
+    def _session(self, t: float) -> RecordingWriter:
+        day = time.strftime("%Y%m%d", time.localtime(t))
+        writer = self._writer
+        if writer is None or (self._job is None and writer.meta.get("day") != day):
+            if writer is not None:
+                writer.close()
+            writer = self._writer = RecordingWriter(
+                self.root / f"{day}-session",
+                {"kind": "session", "day": day, "instance": INSTANCE_ID},
+            )
+        return writer
+
+    def _start_job(self, t: float, filename: str) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(t))
+        self._job = filename
+        self._writer = RecordingWriter(
+            self.root / f"{stamp}-{_slug(filename)}",
+            {"kind": "job", "filename": filename, "instance": INSTANCE_ID, "started_at": t},
+        )
+
+    def _end_job(self, t: float, outcome: str) -> None:
+        if self._writer is not None:
+            self._writer.close(ended_at=t, outcome=outcome)
+            self._writer = None
+        self._job = None
+
+    # -------------------------------------------------
+    # Event -> rows
+    # -------------------------------------------------
+    def record(self, topic: str, data: Any, t: Optional[float] = None) -> None:
+        t = time.time() if t is None else t
+        if topic == "job":
+            label = f"{data['state']}: {data.get('filename', '')}"
+            if data["state"] == "started":
+                self._start_job(t, data.get("filename", ""))
+                self._writer.append(t, "job", label=label)
+            else:
+                self._session(t).append(t, "job", label=label)
+                self._end_job(t, data["state"])
+            return
+
+        w = self._session(t)
+        if topic == "mmu_status":
+            self._mmu_rows(w, t, data)
+        elif topic == "mmu_event":
+            t = data.get("t", t)
+            if data["kind"] == "sensor":
+                w.append(t, "sensor", data.get("slot"), float(bool(data.get("triggered"))))
+            elif data["kind"] == "phase":
+                if data.get("ok", True):
+                    w.append(t, "phase", data.get("slot"), data.get("duration_s", 0.0), data["phase"])
+                else:
+                    w.append(t, "phase_failed", data.get("slot"), data.get("duration_s", 0.0),
+                             f"{data['phase']}: {data.get('error') or 'failed'}")
+        elif topic == "printer_state":
+            status = data.get("status")
+            if status != self._prev_printer:
+                self._prev_printer = status
+                w.append(t, "printer", label=str(status))
+        elif topic == "spools":
+            for s in data.get("spools", []):
+                lane, mm = s["lane"], s["remaining_mm"]
+                if self._prev_spools.get(lane) != mm:
+                    self._prev_spools[lane] = mm
+                    w.append(t, "spool", lane, mm)
+            job = data.get("job")
+            progress = job["progress"] if job else None
+            if progress is not None and progress != self._prev_progress:
+                w.append(t, "progress", None, progress)
+            self._prev_progress = progress
+
+    def _mmu_rows(self, w: RecordingWriter, t: float, cur: Dict) -> None:
+        prev = self._prev_mmu or {}
+        self._prev_mmu = cur
+        state = cur.get("state")
+        if state != prev.get("state"):
+            w.append(t, "status", cur.get("active_slot"), STATES.index(state) if state in STATES else -1, state)
+        if cur.get("last_error") and cur["last_error"] != prev.get("last_error"):
+            w.append(t, "error", cur.get("active_slot"), label=cur["last_error"])
+        before = {s["index"]: s for s in prev.get("slots", [])}
+        for s in cur.get("slots", []):
+            old = before.get(s["index"], {})
+            if s.get("has_filament") != old.get("has_filament"):
+                w.append(t, "filament", s["index"], float(bool(s.get("has_filament"))))
+            if s.get("last_load_mm") is not None and s["last_load_mm"] != old.get("last_load_mm"):
+                w.append(t, "load_mm", s["index"], s["last_load_mm"])
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def recordings(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        out = []
+        try:
+            dirs = sorted(p for p in self.root.iterdir() if p.is_dir())
+        except OSError:
+            return out
+        for d in dirs:
+            meta = Recording(d).meta()
+            first = meta.get("t_first", meta.get("started_at"))
+            last = meta.get("t_last", meta.get("ended_at", first))
+            if first is None:
+                continue
+            if (end is not None and first > end) or (start is not None and last < start):
+                continue
+            out.append(meta)
+        return out
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        recording: Optional[str] = None,
+        kinds: Optional[Sequence[str]] = None,
+        lane: Optional[int] = None,
+        points: int = DEFAULT_POINTS,
+    ) -> Dict:
+        """Rows in [start, end] (epoch seconds), one series per (kind, lane),
+        each downsampled to at most ``points`` with LTTB. Rows still
+        buffered (up to FLUSH_INTERVAL old) are not included."""
+        start_us = int(start * 1e6) if start is not None else 0
+        end_us = int(end * 1e6) if end is not None else 2 ** 62
+        kind_ids = None
+        if kinds:
+            unknown = [k for k in kinds if k not in KIND_IDS]
+            if unknown:
+                raise ValueError(f"unknown kinds: {', '.join(unknown)}")
+            kind_ids = [KIND_IDS[k] for k in kinds]
+
+        if recording is not None:
+            if "/" in recording or recording.startswith("."):
+                raise ValueError("invalid recording id")
+            recs = [Recording(self.root / recording)]
+            if not recs[0].directory.is_dir():
+                raise KeyError(recording)
+        else:
+            recs = [Recording(self.root / m["id"]) for m in self.recordings(start, end)]
+
+        series: Dict[Tuple[int, int], Dict[str, list]] = {}
+        events: List[Dict] = []
+        for rec in recs:
+            labels = rec.labels()
+            for t, k, ln, v, lb in rec.rows(start_us, end_us, kind_ids, lane):
+                kind = KINDS[k] if k < len(KINDS) else str(k)
+                text = labels[lb] if lb < len(labels) else ""
+                if kind in DISCRETE:
+                    if len(events) < MAX_EVENTS:
+                        events.append({"t": t / 1e6, "kind": kind, "lane": None if ln == NO_LANE else ln,
+                                       "value": v, "label": text, "recording": rec.id})
+                    continue
+                s = series.setdefault((k, ln), {"t": [], "v": [], "label": []})
+                s["t"].append(t / 1e6)
+                s["v"].append(v)
+                s["label"].append(text)
+
+        out = []
+        for (k, ln), s in sorted(series.items()):
+            n = len(s["t"])
+            keep = lttb(s["t"], s["v"], points)
+            entry = {
+                "kind": KINDS[k] if k < len(KINDS) else str(k),
+                "lane": None if ln == NO_LANE else ln,
+                "count": n,
+                "t": [s["t"][i] for i in keep],
+                "v": [s["v"][i] for i in keep],
+            }
+            if any(s["label"]):
+                entry["label"] = [s["label"][i] for i in keep]
+            out.append(entry)
+        events.sort(key=lambda e: e["t"])
+        return {"recordings": [r.id for r in recs], "series": out, "events": events}
+
+
+telemetry_recorder = TelemetryRecorder()
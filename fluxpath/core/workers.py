@@ -0,0 +1,312 @@
+# /home/syko/FluxPath/fluxpath/core/workers.py
+#
+# Multi-worker mode (FLUXPATH_WORKERS=N, N > 1). The process systemd
+# starts is the owner: it holds all authoritative state (MMU controller,
+# journal, spools, instances) and runs every background service, exactly
+# like single-process mode. It also starts N-1 worker processes that
+# accept connections on the same listening sockets, so the kernel spreads
+# clients over all cores.
+#
+# A worker mirrors the owner's state over the control socket: one
+# ``watch`` stream delivers a full snapshot first and then every change,
+# which the worker applies to its own singletons and republishes on its
+# own event bus, so WebSocket and SSE clients attached to a worker see
+# the same updates. Workers answer WORKER_ROUTES (read-mostly and
+# CPU-heavy planning routes) themselves and forward every other request
+# to the owner over a private HTTP Unix socket, so each command still
+# runs in exactly one place.
+
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .control import CONTROL_SOCKET
+from .events import event_bus
+
+log = logging.getLogger(__name__)
+
+WORKERS = max(1, int(os.environ.get("FLUXPATH_WORKERS", "1")))
+ROLE = os.environ.get("FLUXPATH_ROLE", "owner")
+IS_WORKER = ROLE == "worker"
+WORKER_ID = int(os.environ.get("FLUXPATH_WORKER_ID", "0"))
+
+OWNER_SOCKET = Path(os.environ.get("FLUXPATH_OWNER_SOCKET", CONTROL_SOCKET.parent / "fluxpath-owner.sock"))
+LISTEN_FDS_ENV = "FLUXPATH_LISTEN_FDS"
+
+MIRROR_RETRY = 1.0
+RESPAWN_DELAY = 2.0
+STOP_TIMEOUT = 5.0
+LINE_LIMIT = 1 << 24
+
+_HOP_BY_HOP = frozenset((
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade",
+))
+
+
+# ---------------------------------------------------------
+# Owner side: sockets and worker processes
+# ---------------------------------------------------------
+def bind_owner_socket(path: Path = OWNER_SOCKET) -> socket.socket:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(path))
+    os.chmod(path, 0o600)
+    return sock
+
+
+def inherited_sockets() -> List[socket.socket]:
+    """Listening sockets passed down by the owner (worker processes)."""
+    fds = [int(fd) for fd in os.environ.get(LISTEN_FDS_ENV, "").split(",") if fd]
+    return [socket.socket(fileno=fd) for fd in fds]
+
+
+class WorkerPool:
+    """Starts the worker processes and restarts any that exit."""
+
+    def __init__(self, count: int, sockets: Iterable[socket.socket]) -> None:
+        self.count = count
+        self.fds = [s.fileno() for s in sockets]
+        self.cwd = Path(__file__).resolve().parents[2]
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _spawn(self, worker_id: int) -> subprocess.Popen:
+        env = dict(
+            os.environ,
+            FLUXPATH_ROLE="worker",
+            FLUXPATH_WORKER_ID=str(worker_id),
+            **{LISTEN_FDS_ENV: ",".join(str(fd) for fd in self.fds)},
+        )
+        # Readiness is the owner's to report (NotifyAccess=main).
+        env.pop("NOTIFY_SOCKET", None)
+        return subprocess.Popen([sys.executable, "-m", "fluxpath.server"], cwd=self.cwd, env=env, pass_fds=self.fds)
+
+    def start(self) -> None:
+        for worker_id in range(1, self.count + 1):
+            self._procs[worker_id] = self._spawn(worker_id)
+        self._thread = threading.Thread(target=self._supervise, name="fluxpath-workers", daemon=True)
+        self._thread.start()
+
+    def _supervise(self) -> None:
+        while not self._stopping.wait(RESPAWN_DELAY):
+            for worker_id, proc in list(self._procs.items()):
+                if proc.poll() is not None and not self._stopping.is_set():
+                    log.warning("FluxPath worker %d exited (%s); restarting", worker_id, proc.returncode)
+                    self._procs[worker_id] = self._spawn(worker_id)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for proc in self._procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for proc in self._procs.values():
+            try:
+                proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def status(self) -> List[Dict]:
+        return [{"worker": i, "pid": p.pid, "alive": p.poll() is None} for i, p in sorted(self._procs.items())]
+
+
+# ---------------------------------------------------------
+# Worker side: state mirror
+# ---------------------------------------------------------
+class StateMirror:
+    """Follows the owner's event bus through the control socket.
+
+    ``appliers`` maps a topic to a function that folds the owner's data
+    into this process's singletons (or None); the data is then
+    republished on the local bus. ``snapshot`` names the control method
+    returning every topic's current data, delivered first on the same
+    stream so no change can slip in between.
+    """
+
+    def __init__(self, appliers: Dict[str, Optional[Callable[[Any], None]]], snapshot: str = "state.snapshot",
+                 path: Path = CONTROL_SOCKET) -> None:
+        self.appliers = appliers
+        self.snapshot = snapshot
+        self.path = Path(path)
+        self.synced = asyncio.Event()
+        self._parent = os.getppid()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Follow the owner and wait for the first snapshot."""
+        self._task = asyncio.ensure_future(self.run())
+        await self.synced.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _apply(self, topic: str, data: Any) -> None:
+        fn = self.appliers.get(topic)
+        if fn is not None:
+            fn(data)
+        event_bus.publish(topic, data)
+
+    async def _follow(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(str(self.path), limit=LINE_LIMIT)
+        try:
+            req = {"id": 1, "method": "watch",
+                   "params": {"topics": [self.snapshot, *self.appliers], "initial": self.snapshot}}
+            writer.write(json.dumps(req).encode() + b"\n")
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("owner closed the control socket")
+                msg = json.loads(line)
+                if "event" not in msg:
+                    raise ConnectionError(msg.get("error") or "watch refused")
+                if msg["event"] == self.snapshot:
+                    for topic, data in msg["data"].items():
+                        self._apply(topic, data)
+                    self.synced.set()
+                else:
+                    self._apply(msg["event"], msg["data"])
+        finally:
+            writer.close()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._follow()
+            except (OSError, ValueError) as e:
+                if self.synced.is_set():
+                    log.warning("FluxPath worker %d: lost owner (%s); reconnecting", WORKER_ID, e)
+            except Exception:
+                # A failing applier must not end the mirror: before the
+                # first snapshot that would leave start() waiting forever.
+                log.exception("FluxPath worker %d: applying owner state failed; reconnecting", WORKER_ID)
+            if os.getppid() != self._parent:
+                # Owner is gone for good; let uvicorn shut this worker down.
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            await asyncio.sleep(MIRROR_RETRY)
+
+
+# ---------------------------------------------------------
+# Worker side: request routing
+# ---------------------------------------------------------
+def _route_pattern(template: str) -> "re.Pattern[str]":
+    return re.compile("^" + re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(template)) + "$")
+
+
+class OwnerRouter:
+    """ASGI middleware for workers: serve ``local_routes`` here, proxy
+    every other HTTP request to the owner's Unix socket."""
+
+    def __init__(self, app, local_routes: Iterable[Tuple[str, str]], path: Path = OWNER_SOCKET) -> None:
+        self.app = app
+        self.path = Path(path)
+        self._local: Dict[str, List["re.Pattern[str]"]] = {}
+        for method, template in local_routes:
+            methods = ("GET", "HEAD") if method == "GET" else (method,)
+            for m in methods:
+                self._local.setdefault(m, []).append(_route_pattern(template))
+
+    def is_local(self, method: str, path: str) -> bool:
+        return any(p.match(path) for p in self._local.get(method, ()))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.is_local(scope["method"], scope["path"]):
+            return await self.app(scope, receive, send)
+        await self._proxy(scope, receive, send)
+
+    async def _proxy(self, scope, receive, send) -> None:
+        body = b""
+        while True:
+            msg = await receive()
+            body += msg.get("body", b"")
+            if not msg.get("more_body"):
+                break
+        try:
+            reader, writer = await asyncio.open_unix_connection(str(self.path))
+        except OSError:
+            return await _json_response(send, 503, {"result": "error", "error": "owner process unavailable"})
+
+        try:
+            target = scope.get("raw_path") or scope["path"].encode()
+            if scope.get("query_string"):
+                target += b"?" + scope["query_string"]
+            head = [scope["method"].encode() + b" " + target + b" HTTP/1.1"]
+            for name, value in scope["headers"]:
+                if name.lower() not in _HOP_BY_HOP and name.lower() != b"content-length":
+                    head.append(name + b": " + value)
+            head += [b"content-length: %d" % len(body), b"connection: close",
+                     b"x-fluxpath-worker: %d" % WORKER_ID]
+            writer.write(b"\r\n".join(head) + b"\r\n\r\n" + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            headers = []
+            chunked = False
+            length = None
+            while True:
+                line = (await reader.readline()).rstrip(b"\r\n")
+                if not line:
+                    break
+                name, _, value = line.partition(b":")
+                name, value = name.strip().lower(), value.strip()
+                if name == b"transfer-encoding":
+                    chunked = b"chunked" in value.lower()
+                if name == b"content-length":
+                    length = int(value)
+                # The worker's CommandIdMiddleware adds x-request-id (the
+                # same ID it forwarded) to the response itself.
+                if name not in _HOP_BY_HOP and name != b"x-request-id":
+                    headers.append((name, value))
+
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            if chunked:
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    if size == 0:
+                        break
+                    chunk = await reader.readexactly(size + 2)
+                    await send({"type": "http.response.body", "body": chunk[:-2], "more_body": True})
+            elif length is not None:
+                await send({"type": "http.response.body", "body": await reader.readexactly(length),
+                            "more_body": True})
+            else:
+                while True:
+                    chunk = await reader.read(65536)
+                    if not chunk:
+                        break
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            # Response already started: nothing sensible left to send.
+            pass
+        finally:
+            writer.close()
+
+
+async def _json_response(send, status: int, doc: Dict) -> None:
+    body = json.dumps(doc).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,208 @@
+# /home/syko/FluxPath/fluxpath/dashboard.py
+
+import json
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
+from typing import List
+
+from .core.codec import FrameCache, negotiate
+from .core.events import event_bus
+from .core.state import printer_state
+from .core.status import status_aggregator
+
+router = APIRouter()
+
+# ---------------------------------------------------------
+# WebSocket connection manager
+# ---------------------------------------------------------
+class ConnectionManager:
+    def __init__(self):
+        self.active_connections: List[WebSocket] = []
+
+    async def connect(self, websocket: WebSocket, subprotocol: str | None = None):
+        await websocket.accept(subprotocol=subprotocol)
+        self.active_connections.append(websocket)
+
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+
+manager = ConnectionManager()
+
+# ---------------------------------------------------------
+# Dashboard HTML
+# ---------------------------------------------------------
+DASHBOARD_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>FluxPath Dashboard</title>
+    <style>
+        body { font-family: sans-serif; background: #111; color: #eee; padding: 20px; }
+        h1 { color: #4fd1c5; }
+        .card { background: #1a202c; padding: 16px; border-radius: 8px; margin-bottom: 16px; }
+        .label { color: #a0aec0; font-size: 0.9em; }
+        .value { font-size: 1.1em; }
+        pre { background: #2d3748; padding: 12px; border-radius: 6px; }
+    </style>
+</head>
+<body>
+    <h1>FluxPath Backend</h1>
+
+    <div class="card">
+        <div class="label">Health</div>
+        <div class="value" id="health">Loading...</div>
+    </div>
+
+    <div class="card">
+        <div class="label">Printer Status</div>
+        <pre id="printer-status">{}</pre>
+    </div>
+
+    <div class="card">
+        <div class="label">MMU</div>
+        <pre id="mmu-status">{}</pre>
+    </div>
+
+    <div class="card">
+        <div class="label">Live stream</div>
+        <div class="value" id="stream-status">Connecting...</div>
+    </div>
+
+    <script>
+        // One persistent stream of /status/all documents; EventSource
+        // reconnects by itself, so there is nothing to poll.
+        function ok(flag) { return flag ? 'ok' : 'down'; }
+
+        function render(doc) {
+            document.getElementById('health').innerText =
+                'backend ' + doc.health.status +
+                ' | moonraker ' + ok(doc.printer.ok) +
+                ' | webcam ' + ok(doc.webcam.ok);
+            document.getElementById('printer-status').innerText = JSON.stringify(
+                {printer_state: doc.printer_state, moonraker: doc.printer}, null, 2);
+            document.getElementById('mmu-status').innerText = JSON.stringify(
+                {mmu: doc.mmu, sensors: doc.sensors, motors: doc.motors}, null, 2);
+        }
+
+        const stream = new EventSource('/status/stream');
+        stream.onopen = () => {
+            document.getElementById('stream-status').innerText = 'connected';
+        };
+        stream.onerror = () => {
+            document.getElementById('stream-status').innerText = 'disconnected (retrying...)';
+        };
+        stream.addEventListener('status', (event) => {
+            render(JSON.parse(event.data));
+            document.getElementById('stream-status').innerText = 'connected';
+        });
+    </script>
+</body>
+</html>
+"""
+
+@router.get("/")
+async def dashboard():
+    return HTMLResponse(DASHBOARD_HTML)
+
+# ---------------------------------------------------------
+# Health + Printer API
+# ---------------------------------------------------------
+@router.get("/health")
+async def health():
+    return JSONResponse({"status": "ok"})
+
+@router.get("/health/deep")
+async def health_deep(probe: str | None = None):
+    # Cached probe results only; nothing is probed on request. The
+    # monitor starts after READY, so health.py is imported here.
+    from .core.health import health_monitor
+
+    doc = health_monitor.report(probe.split(",") if probe else None)
+    return JSONResponse(doc, status_code=503 if doc["status"] == "fail" else 200)
+
+@router.get("/printer/info")
+async def printer_info():
+    return JSONResponse({
+        "name": printer_state["name"],
+        "model": printer_state["model"],
+        "firmware": printer_state["firmware"],
+        "mmu": printer_state["mmu"]["enabled"],
+    })
+
+@router.get("/printer/status")
+async def printer_status():
+    return JSONResponse({
+        "status": printer_state["status"],
+        "job": printer_state["job"],
+        "mmu": printer_state["mmu"],
+    })
+
+# ---------------------------------------------------------
+# Aggregate status
+# ---------------------------------------------------------
+# Idle streams get a comment line this often so proxies and clients can
+# tell a quiet backend from a dead connection.
+SSE_KEEPALIVE = 15.0
+
+def _sse(doc: dict) -> str:
+    return "event: status\ndata: " + json.dumps(doc, separators=(",", ":"), default=str) + "\n\n"
+
+@router.get("/status/all")
+async def status_all():
+    return JSONResponse(status_aggregator.document())
+
+@router.get("/status/stream")
+async def status_stream(request: Request):
+    async def events():
+        with event_bus.subscribe(["status_all"]) as sub:
+            yield "retry: 2000\n" + _sse(status_aggregator.document())
+            while not await request.is_disconnected():
+                msg = await sub.get(timeout=SSE_KEEPALIVE)
+                yield _sse(msg["data"]) if msg else ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ---------------------------------------------------------
+# WebSocket endpoint
+# ---------------------------------------------------------
+# Status is pushed whenever printer or MMU state changes, with a periodic
+# refresh so idle dashboards still see they are connected. Frames are
+# encoded once per change and codec, then shared by every client.
+WS_REFRESH_INTERVAL = 2.0
+
+_status_frames = FrameCache()
+
+def _status_message() -> dict:
+    msg = {
+        "type": "status",
+        "status": printer_state["status"],
+        "mmu": printer_state["mmu"],
+    }
+    mmu_status = event_bus.latest("mmu_status")
+    if mmu_status is not None:
+        msg["mmu_status"] = mmu_status
+    return msg
+
+@router.websocket("/fluxpath/ws")
+async def fluxpath_ws(websocket: WebSocket):
+    codec, subprotocol = negotiate(websocket)
+    await manager.connect(websocket, subprotocol)
+    try:
+        await codec.send_hello(websocket)
+        await codec.send(websocket, {"status": "connected", "source": "fluxpath"})
+        with event_bus.subscribe(["printer_state", "mmu_status"]) as sub:
+            while True:
+                key = (event_bus.version("printer_state"), event_bus.version("mmu_status"))
+                frame = _status_frames.get(key, codec, _status_message)
+                await codec.send(websocket, None, frame)
+                await sub.get(timeout=WS_REFRESH_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
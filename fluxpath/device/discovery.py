@@ -1,30 +1,293 @@
-import socket
+# /home/syko/FluxPath/fluxpath/device/discovery.py
+#
+# LAN discovery. One UDP socket on DISCOVERY_PORT answers queries on
+# demand: a client sends {"msg": "query"} (unicast, broadcast or to the
+# multicast group) and gets one {"msg": "discover", ...} reply listing
+# every instance on this host. The reply carries the address of the
+# interface that faces the client. After startup, and again whenever the
+# instance registries change, the same payload is announced with
+# exponential backoff (1, 2, 4 ... s) and then the service stays quiet.
+
+import asyncio
 import json
-import threading
+import os
+import socket
+import struct
 import time
+import uuid
+from typing import Dict, List, Optional, Tuple
 
-BROADCAST_PORT = 2021
-INTERVAL = 3
+from .. import __version__
+from ..core.codec import CODECS
+from ..core.events import event_bus
+from ..core.instances import instance_manager
+from ..core.mmu import mmu_manager
+
+DISCOVERY_PORT = 2021
+MULTICAST_GROUP = "239.255.20.21"
+
+ANNOUNCE_DELAYS = (1, 2, 4, 8, 16, 32)
+MAX_DATAGRAM = 60000
+
+SIOCGIFADDR = 0x8915
+
+
+def interface_addresses() -> List[str]:
+    """IPv4 address of every non-loopback interface that is up."""
+    addrs: List[str] = []
+    try:
+        import fcntl
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for _, name in socket.if_nameindex():
+                try:
+                    req = struct.pack("256s", name.encode()[:15])
+                    addr = socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, req)[20:24])
+                except OSError:
+                    continue  # down or no IPv4 address
+                if not addr.startswith("127.") and addr not in addrs:
+                    addrs.append(addr)
+        finally:
+            s.close()
+    except (ImportError, OSError):
+        pass
+    if not addrs:
+        addr = route_address("192.0.2.1")
+        if addr:
+            addrs.append(addr)
+    return addrs
+
+
+def route_address(peer: str) -> Optional[str]:
+    """Local address the kernel would use to reach ``peer`` (no packet sent)."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((peer, DISCOVERY_PORT))
+        return s.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+def _serial() -> str:
+    try:
+        with open("/etc/machine-id") as f:
+            ident = f.read().strip()[:8]
+    except OSError:
+        ident = f"{uuid.getnode():012x}"[-8:]
+    return f"FLUXPATH-{ident.upper()}"
+
+
+def _listen_ports() -> List[int]:
+    from ..app import DEFAULT_LISTEN, parse_listeners
+
+    return [p for _, p in parse_listeners(os.environ.get("FLUXPATH_LISTEN", DEFAULT_LISTEN))]
 
-def broadcast_loop():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
-    payload = {
-        "msg": "discover",
-        "dev": "printer",
-        "ip": "192.168.0.122",
-        "fw": "1.0.0",
-        "sn": "FLUXPATH-0001",
-        "name": "FluxPath MMU Controller"
-    }
+class _Registry:
+    """fp_core's instances.json, re-read only when it changes."""
 
-    data = json.dumps(payload).encode()
+    def __init__(self) -> None:
+        self._mtime: Optional[float] = None
+        self._items: List[Dict] = []
+
+    def instances(self) -> List[Dict]:
+        from fp_core.config import INSTANCES_REGISTRY
+        from fp_core.instances import load_instances
+
+        try:
+            mtime = INSTANCES_REGISTRY.stat().st_mtime
+        except OSError:
+            return []
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._items = [
+                {
+                    "id": f"klipper-{i.id}",
+                    "name": i.name,
+                    "kind": "klipper",
+                    "ports": {"klipper": i.klipper_port, "moonraker": i.moonraker_port},
+                    "caps": {"active": i.active, "sandbox": i.sandbox},
+                }
+                for i in load_instances()
+            ]
+        return self._items
+
+
+class DiscoveryService(asyncio.DatagramProtocol):
+    def __init__(self, port: int = DISCOVERY_PORT, group: str = MULTICAST_GROUP) -> None:
+        self.port = port
+        self.group = group
+        self.serial = _serial()
+        self.hostname = socket.gethostname()
+        self._registry = _Registry()
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._sock: Optional[socket.socket] = None
+        self._task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    # -------------------------------------------------
+    # Payload
+    # -------------------------------------------------
+    def advertisement(self, ip: Optional[str]) -> Dict:
+        ports = _listen_ports()
+        backend = {
+            "id": "fluxpath",
+            "name": "FluxPath MMU Controller",
+            "kind": "fluxpath",
+            "ports": {"http": ports, "ws": "/fluxpath/ws", "device_ws": "/"},
+            "caps": dict(mmu_manager.get_capabilities(), encodings=sorted(CODECS)),
+        }
+        virtual = [
+            dict(inst, kind="virtual", ports={"http": ports})
+            for inst in instance_manager.list_instances()
+        ]
+        # Top-level fields keep the shape of the old broadcast payload.
+        return {
+            "msg": "discover",
+            "dev": "printer",
+            "ip": ip,
+            "fw": __version__,
+            "sn": self.serial,
+            "name": "FluxPath MMU Controller",
+            "host": self.hostname,
+            "instances": [backend] + self._registry.instances() + virtual,
+        }
+
+    def _encode(self, ip: Optional[str]) -> bytes:
+        data = json.dumps(self.advertisement(ip), separators=(",", ":")).encode()
+        if len(data) > MAX_DATAGRAM:
+            raise ValueError(f"discovery payload too large ({len(data)} bytes)")
+        return data
+
+    # -------------------------------------------------
+    # Socket
+    # -------------------------------------------------
+    def _open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        sock.bind(("", self.port))
+        for addr in interface_addresses():
+            try:
+                mreq = socket.inet_aton(self.group) + socket.inet_aton(addr)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            except OSError:
+                pass
+        sock.setblocking(False)
+        return sock
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._sock = self._open_socket()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=self._sock)
+        self._task = asyncio.ensure_future(self._announce_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def changed(self) -> None:
+        """Restart the announcement schedule (instance list changed)."""
+        self._changed.set()
+
+    # -------------------------------------------------
+    # Queries
+    # -------------------------------------------------
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(msg, dict) or msg.get("msg") != "query":
+            return  # other hosts' announcements, or noise
+        try:
+            self._transport.sendto(self._encode(route_address(addr[0])), addr)
+        except (OSError, ValueError):
+            pass
+
+    # -------------------------------------------------
+    # Announcements
+    # -------------------------------------------------
+    def announce(self) -> None:
+        addrs = interface_addresses()
+        for addr in addrs:
+            try:
+                data = self._encode(addr)
+                self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(addr))
+                self._sock.sendto(data, (self.group, self.port))
+            except (OSError, ValueError):
+                continue
+        try:
+            # Legacy listeners only watch the broadcast address.
+            self._sock.sendto(self._encode(addrs[0] if addrs else None), ("255.255.255.255", self.port))
+        except (OSError, ValueError):
+            pass
+
+    async def _announce_loop(self) -> None:
+        with event_bus.subscribe(["instances"]) as sub:
+            watch = asyncio.ensure_future(self._watch(sub))
+            try:
+                while True:
+                    self._changed.clear()
+                    for delay in ANNOUNCE_DELAYS:
+                        self.announce()
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), delay)
+                            break  # changed: start over from the short delay
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._changed.wait()
+            finally:
+                watch.cancel()
+
+    async def _watch(self, sub) -> None:
+        while True:
+            await sub.get()
+            self.changed()
+
+
+def query(timeout: float = 1.0, port: int = DISCOVERY_PORT, group: str = MULTICAST_GROUP) -> List[Dict]:
+    """Ask the LAN for FluxPath hosts; returns one reply per host."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    probe = json.dumps({"msg": "query"}).encode()
+    replies: Dict[str, Dict] = {}
+    try:
+        for target in (group, "255.255.255.255"):
+            try:
+                sock.sendto(probe, (target, port))
+            except OSError:
+                pass
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            sock.settimeout(remaining)
+            try:
+                data, addr = sock.recvfrom(65535)
+            except socket.timeout:
+                break
+            try:
+                msg = json.loads(data)
+            except ValueError:
+                continue
+            if msg.get("msg") == "discover":
+                replies.setdefault(msg.get("sn") or addr[0], dict(msg, ip=msg.get("ip") or addr[0]))
+    finally:
+        sock.close()
+    return list(replies.values())
 
-    while True:
-        sock.sendto(data, ("255.255.255.255", BROADCAST_PORT))
-        time.sleep(INTERVAL)
 
-def start_broadcast():
-    t = threading.Thread(target=broadcast_loop, daemon=True)
-    t.start()
+discovery_service = DiscoveryService()
@@ -1,27 +1,61 @@
 import asyncio
 import json
 import websockets
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from fluxpath.core.codec import FrameCache, negotiate
+from fluxpath.core.events import event_bus
 from fluxpath.core.mmu import mmu_manager
 
 WS_PORT = 9876
+STATUS_INTERVAL = 2
 
-async def handler(websocket):
-    await websocket.send(json.dumps({
+router = APIRouter()
+
+def device_info():
+    return {
         "msg": "device_info",
         "name": "FluxPath MMU Controller",
         "fw": "1.0.0",
         "sn": "FLUXPATH-0001",
         "tools": mmu_manager.get_capabilities()["tools"]
-    }))
+    }
+
+def mmu_status():
+    return {
+        "msg": "mmu_status",
+        "filaments": mmu_manager.get_filaments(),
+        "caps": mmu_manager.get_capabilities()
+    }
+
+# Filament changes bump the "filaments" event version; until then every
+# client shares the same encoded frame.
+_status_frames = FrameCache()
+
+# Served from the combined app (fluxpath.app) at ws://<host>:9876/ so
+# slicer-side device clients keep working without a second listener.
+# Encoding is negotiated per client (see fluxpath.core.codec).
+@router.websocket("/")
+async def device_ws(websocket: WebSocket):
+    codec, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    try:
+        await codec.send_hello(websocket)
+        await codec.send(websocket, device_info())
+        while True:
+            frame = _status_frames.get(event_bus.version("filaments"), codec, mmu_status)
+            await codec.send(websocket, None, frame)
+            await asyncio.sleep(STATUS_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+
+# Standalone server, for running the device endpoint without the backend.
+async def handler(websocket):
+    await websocket.send(json.dumps(device_info()))
 
     while True:
-        await websocket.send(json.dumps({
-            "msg": "mmu_status",
-            "filaments": mmu_manager.get_filaments(),
-            "caps": mmu_manager.get_capabilities()
-        }))
-        await asyncio.sleep(2)
+        await websocket.send(json.dumps(mmu_status()))
+        await asyncio.sleep(STATUS_INTERVAL)
 
 async def start_ws():
     async with websockets.serve(handler, "0.0.0.0", WS_PORT):
@@ -0,0 +1,419 @@
+"""Config doctor engine: scan, plan, clean and restore Klipper config trees.
+
+Every tree keeps a manifest (config_archives/.manifest.json) of path,
+size, mtime and content hash, plus what the scan found in each file.
+A rescan only stats the tree; files whose size and mtime match the
+manifest are not read again. Files modified within RACY_NS of the last
+scan are always re-read, since a second write in the same mtime tick
+would otherwise go unnoticed. Several trees (one per printer instance)
+are scanned in parallel.
+
+The strict cleanup rules are the ones scripts/fluxpath_config_doctor.sh
+always applied: under mmu/ only the known MMU files stay, elsewhere only
+*.cfg and *.conf stay; everything else moves into a timestamped archive.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .config import HOME
+from .instances import load_instances
+from .utils import log_error, log_info, log_warn
+
+CONFIG_DIR = HOME / "printer_data" / "config"
+ARCHIVE_DIR = "config_archives"
+MANIFEST = ".manifest.json"
+MANIFEST_VERSION = 1
+RACY_NS = 2 * 10 ** 9
+CHUNK = 1 << 20
+
+MMU_REQUIRED_FILES = frozenset(
+    "mmu/" + name
+    for name in (
+        "mmu_main.cfg", "mmu_vars.cfg", "mmu_primitives.cfg", "mmu_preload.cfg",
+        "mmu_load.cfg", "mmu_unload.cfg", "mmu_toolchange.cfg", "mmu_sensors.cfg",
+        "mmu_calibration.cfg", "mmu_diagnostics.cfg", "mmu_ui.cfg", "mmu_hardware.cfg",
+        "mmu_steppers.cfg",
+    )
+)
+CONFIG_SUFFIXES = (".cfg", ".conf")
+
+_MACRO = re.compile(rb"^\[gcode_macro\s+([^\]\s]+)\s*\]", re.MULTILINE)
+_JINJA_TAG = re.compile(rb"{%-?\s*(\w+)")
+_JINJA_BLOCKS = {b"if": b"endif", b"for": b"endfor", b"macro": b"endmacro"}
+
+
+@dataclass
+class Entry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    crlf: bool = False
+    macros: List[str] = field(default_factory=list)
+    jinja: Optional[str] = None  # first unbalanced block, if any
+
+
+@dataclass
+class Move:
+    rel: str
+    rule: str  # mmu | config
+
+
+@dataclass
+class TreeReport:
+    root: str
+    files: int = 0
+    hashed: int = 0
+    bytes_hashed: int = 0
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    crlf: List[str] = field(default_factory=list)
+    duplicate_macros: Dict[str, List[str]] = field(default_factory=dict)
+    jinja: Dict[str, str] = field(default_factory=dict)
+    moves: List[Move] = field(default_factory=list)
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def classify(rel: str) -> Optional[str]:
+    """The strict rule that archives ``rel``, or None if it stays."""
+    if rel.startswith("mmu/") and rel not in MMU_REQUIRED_FILES:
+        return "mmu"
+    if not rel.endswith(CONFIG_SUFFIXES):
+        return "config"
+    return None
+
+
+def _jinja_balance(data: bytes) -> Optional[str]:
+    stack = []
+    for m in _JINJA_TAG.finditer(data):
+        tag = m.group(1)
+        if tag in _JINJA_BLOCKS:
+            stack.append(tag)
+        elif tag.startswith(b"end"):
+            if not stack or _JINJA_BLOCKS[stack[-1]] != tag:
+                return "unexpected {0} at byte {1}".format(tag.decode(), m.start())
+            stack.pop()
+    if stack:
+        return "unclosed {0}".format(stack[-1].decode())
+    return None
+
+
+def _examine(path: Path, st: os.stat_result) -> Entry:
+    digest = hashlib.sha256()
+    is_cfg = path.name.endswith(CONFIG_SUFFIXES)
+    parts = []
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if is_cfg:
+                parts.append(chunk)
+    entry = Entry(st.st_size, st.st_mtime_ns, digest.hexdigest())
+    if is_cfg:
+        data = b"".join(parts)
+        entry.crlf = b"\r" in data
+        entry.macros = [m.decode(errors="replace") for m in _MACRO.findall(data)]
+        entry.jinja = _jinja_balance(data)
+    return entry
+
+
+def _walk(root: Path, skip: Optional[Path] = None):
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError:
+            continue
+        with it:
+            for de in it:
+                if de.is_dir(follow_symlinks=False):
+                    if Path(de.path) != skip:
+                        stack.append(de.path)
+                elif de.is_file(follow_symlinks=False):
+                    yield de.path, de.stat(follow_symlinks=False)
+
+
+def archive_root(root: Path) -> Path:
+    return Path(root) / ARCHIVE_DIR
+
+
+def load_manifest(root: Path) -> Dict:
+    try:
+        data = json.loads((archive_root(root) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {"entries": {}}
+    if data.get("version") != MANIFEST_VERSION:
+        return {"entries": {}}
+    data["entries"] = {k: Entry(**v) for k, v in data.get("entries", {}).items()}
+    return data
+
+
+def _save_manifest(root: Path, entries: Dict[str, Entry], scanned_ns: int) -> None:
+    target = archive_root(root) / MANIFEST
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    tmp.write_text(json.dumps({
+        "version": MANIFEST_VERSION,
+        "root": str(root),
+        "scanned_ns": scanned_ns,
+        "entries": {k: vars(v) for k, v in sorted(entries.items())},
+    }))
+    os.replace(tmp, target)
+
+
+def scan(root: Path = CONFIG_DIR, save: bool = True) -> TreeReport:
+    """Bring the manifest of one tree up to date and report its findings
+    and strict cleanup plan."""
+    root = Path(root)
+    started = time.monotonic()
+    report = TreeReport(str(root))
+    if not root.is_dir():
+        report.error = "not a directory"
+        return report
+
+    manifest = load_manifest(root)
+    old: Dict[str, Entry] = manifest["entries"]
+    racy_after = manifest.get("scanned_ns", 0) - RACY_NS
+    scanned_ns = time.time_ns()
+    entries: Dict[str, Entry] = {}
+    prefix = len(str(root)) + 1
+
+    for path, st in _walk(root, archive_root(root)):
+        rel = path[prefix:].replace(os.sep, "/")
+        prev = old.get(rel)
+        if prev is not None and prev.size == st.st_size and prev.mtime_ns == st.st_mtime_ns \
+                and st.st_mtime_ns < racy_after:
+            entry = prev
+        else:
+            try:
+                entry = _examine(Path(path), st)
+            except OSError:
+                continue  # vanished or unreadable
+            report.hashed += 1
+            report.bytes_hashed += st.st_size
+            if prev is None:
+                report.added.append(rel)
+            elif prev.sha256 != entry.sha256:
+                report.changed.append(rel)
+        entries[rel] = entry
+
+    report.removed = sorted(set(old) - set(entries))
+    report.files = len(entries)
+    macros: Dict[str, List[str]] = {}
+    for rel, entry in sorted(entries.items()):
+        if entry.crlf:
+            report.crlf.append(rel)
+        if entry.jinja:
+            report.jinja[rel] = entry.jinja
+        for name in entry.macros:
+            macros.setdefault(name.upper(), []).append(rel)
+        rule = classify(rel)
+        if rule:
+            report.moves.append(Move(rel, rule))
+    report.duplicate_macros = {n: files for n, files in macros.items() if len(files) > 1}
+
+    # Nothing re-read means nothing new to record; keeping the older scan
+    # time only widens the racy window.
+    if save and (report.hashed or report.removed):
+        _save_manifest(root, entries, scanned_ns)
+    report.seconds = round(time.monotonic() - started, 3)
+    return report
+
+
+def instance_trees() -> List[Path]:
+    """The main config tree plus every registered instance's."""
+    trees = [CONFIG_DIR]
+    for inst in load_instances():
+        path = Path(inst.config_dir)
+        if path not in trees:
+            trees.append(path)
+    return trees
+
+
+def scan_all(roots: Sequence[Path], workers: Optional[int] = None) -> List[TreeReport]:
+    """scan() every tree in parallel, in the order given."""
+    workers = workers or min(8, len(roots)) or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan, roots))
+
+
+def plan(root: Path = CONFIG_DIR) -> List[Move]:
+    return scan(root).moves
+
+
+def clean(root: Path = CONFIG_DIR, moves: Optional[List[Move]] = None) -> Optional[Path]:
+    """Move every file the strict rules reject into a new archive under
+    config_archives/, with its own manifest for restore. Returns the
+    archive directory, or None if there was nothing to move."""
+    root = Path(root)
+    if moves is None:
+        moves = plan(root)
+    if not moves:
+        return None
+    manifest = load_manifest(root)["entries"]
+    archive = archive_root(root) / "archive_{0}".format(time.strftime("%Y%m%d_%H%M%S"))
+    archive.mkdir(parents=True, exist_ok=False)
+    moved: Dict[str, Dict] = {}
+    for move in moves:
+        src = root / move.rel
+        dest = archive / move.rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            shutil.move(str(src), str(dest))
+        except OSError as e:
+            log_warn("Could not move {0}: {1}".format(move.rel, e))
+            continue
+        entry = manifest.get(move.rel)
+        moved[move.rel] = dict(rule=move.rule, **(asdict(entry) if entry else {}))
+    (archive / MANIFEST).write_text(json.dumps({"version": MANIFEST_VERSION, "entries": moved}, indent=2))
+    scan(root)
+    return archive
+
+
+def archives(root: Path = CONFIG_DIR) -> List[str]:
+    try:
+        return sorted(p.name for p in archive_root(root).iterdir() if p.is_dir())
+    except OSError:
+        return []
+
+
+def restore(root: Path, name: str) -> Dict[str, List[str]]:
+    """Move an archive's files back. A file that exists again in the tree
+    with different content is left in the archive and reported."""
+    root = Path(root)
+    if "/" in name or name.startswith("."):
+        raise ValueError("invalid archive name {0!r}".format(name))
+    archive = archive_root(root) / name
+    if not archive.is_dir():
+        raise FileNotFoundError("archive not found: {0}".format(archive))
+
+    result: Dict[str, List[str]] = {"restored": [], "identical": [], "conflicts": []}
+    prefix = len(str(archive)) + 1
+    for path, st in sorted(_walk(archive)):
+        rel = path[prefix:].replace(os.sep, "/")
+        if rel == MANIFEST:
+            continue
+        dest = root / rel
+        if dest.exists():
+            if _examine(dest, dest.stat()).sha256 == _examine(Path(path), st).sha256:
+                os.unlink(path)
+                result["identical"].append(rel)
+            else:
+                result["conflicts"].append(rel)
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(path, str(dest))
+        result["restored"].append(rel)
+
+    if not result["conflicts"]:
+        shutil.rmtree(archive, ignore_errors=True)
+    scan(root)
+    return result
+
+
+def _print_report(report: TreeReport, verbose: bool) -> None:
+    if report.error:
+        log_error("{0}: {1}".format(report.root, report.error))
+        return
+    log_info("{0}: {1} files, {2} re-read ({3:.1f} MB) in {4:.2f}s".format(
+        report.root, report.files, report.hashed, report.bytes_hashed / 1e6, report.seconds))
+    for label, paths in (("ADDED", report.added), ("CHANGED", report.changed), ("REMOVED", report.removed)):
+        if verbose or len(paths) <= 20:
+            for rel in paths:
+                print("  {0}: {1}".format(label, rel))
+        else:
+            print("  {0}: {1} files".format(label, len(paths)))
+    for rel in report.crlf:
+        log_warn("CRLF: {0}".format(rel))
+    for name, files in sorted(report.duplicate_macros.items()):
+        log_warn("DUPLICATE MACRO: {0} in {1}".format(name, ", ".join(files)))
+    for rel, problem in sorted(report.jinja.items()):
+        log_warn("JINJA: {0}: {1}".format(rel, problem))
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="fluxpath-doctor", description="Scan and clean Klipper config trees")
+    p.add_argument("command", choices=("scan", "plan", "clean", "restore", "archives"))
+    p.add_argument("archive", nargs="?", help="archive name for restore")
+    p.add_argument("--root", type=Path, action="append", help="config tree (repeatable; default {0})".format(CONFIG_DIR))
+    p.add_argument("--all-instances", action="store_true", help="every registered instance's config tree too")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="trees scanned in parallel")
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    p.add_argument("-v", "--verbose", action="store_true", help="list every added/changed file")
+    args = p.parse_args(argv)
+
+    roots = list(args.root or [])
+    if args.all_instances:
+        roots += [t for t in instance_trees() if t not in roots]
+    roots = roots or [CONFIG_DIR]
+
+    if args.command == "restore":
+        if not args.archive or len(roots) != 1:
+            p.error("restore needs one archive name and one --root")
+        try:
+            result = restore(roots[0], args.archive)
+        except (ValueError, FileNotFoundError) as e:
+            log_error(str(e))
+            return 1
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            for rel in result["restored"]:
+                print("  RESTORED: {0}".format(rel))
+            for rel in result["conflicts"]:
+                log_warn("KEPT IN ARCHIVE (file changed since): {0}".format(rel))
+            log_info("Restored {0} files".format(len(result["restored"])))
+        return 1 if result["conflicts"] else 0
+
+    if args.command == "archives":
+        out = {str(r): archives(r) for r in roots}
+        if args.json:
+            print(json.dumps(out, indent=2))
+        else:
+            for root, names in out.items():
+                log_info(root)
+                for name in names:
+                    print("  {0}".format(name))
+        return 0
+
+    reports = scan_all(roots, args.jobs)
+    if args.command == "clean":
+        moved = False
+        for report in reports:
+            if report.error:
+                continue
+            archive = clean(Path(report.root), report.moves)
+            if archive:
+                moved = True
+                log_info("{0}: moved {1} files to {2}".format(report.root, len(report.moves), archive))
+        if moved:
+            # Report the trees as the clean left them.
+            reports = scan_all(roots, args.jobs)
+
+    if args.json:
+        print(json.dumps([asdict(r) for r in reports], indent=2))
+        return 0
+    for report in reports:
+        _print_report(report, args.verbose)
+        if args.command == "plan":
+            for move in report.moves:
+                print("  WOULD MOVE ({0}): {1}".format(move.rule, move.rel))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
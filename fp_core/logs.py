@@ -0,0 +1,350 @@
+"""Non-blocking structured logging for FluxPath.
+
+Callers never wait on journald or a disk: the root logger has one
+QueueHandler that stamps each record with the current instance and
+command IDs and drops it on a bounded queue (a full queue drops the
+record and counts it). One listener thread writes the records to an
+in-memory ring the backend serves at /fluxpath/logs and to rotating
+JSON-lines files -- one per printer instance under
+``<instance>/logs/fluxpath.log``, everything else under
+``~/FluxPath/logs/fluxpath.log``. The console is written synchronously,
+so CLI output stays in order with ``print()``; the backend passes
+``queue_console=True`` and leaves the console to the listener as well.
+
+Code logs through the standard library (``logging.getLogger(__name__)``)
+or the ``fp_core.utils.log_*`` helpers; ``log_context`` scopes IDs:
+
+    with log_context(instance_id=3, command_id=new_command_id("provision")):
+        ...
+"""
+
+import atexit
+import contextlib
+import contextvars
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from .config import FLUXPATH_ROOT, INSTANCE_DATA_BASE
+
+LOG_DIR = Path(os.environ.get("FLUXPATH_LOG_DIR", FLUXPATH_ROOT / "logs"))
+LOG_LEVEL = os.environ.get("FLUXPATH_LOG_LEVEL", "INFO").upper()
+QUEUE_SIZE = 10000
+RING_SIZE = int(os.environ.get("FLUXPATH_LOG_RING", "2000"))
+FILE_MAX_BYTES = 5 * 1024 * 1024
+FILE_BACKUPS = 3
+
+_LEVEL_TAGS = {
+    logging.DEBUG: ("[DEBUG]", "\033[34m"),
+    logging.INFO: ("[INFO]", "\033[32m"),
+    logging.WARNING: ("[WARN]", "\033[33m"),
+    logging.ERROR: ("[ERROR]", "\033[31m"),
+    logging.CRITICAL: ("[ERROR]", "\033[31m"),
+}
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+_STANDARD = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "instance_id", "command_id"}
+
+
+def _default_instance():
+    value = os.environ.get("FLUXPATH_INSTANCE_ID")
+    return int(value) if value else None
+
+
+_instance_id = contextvars.ContextVar("fluxpath_instance_id", default=_default_instance())
+_command_id = contextvars.ContextVar("fluxpath_command_id", default=None)
+_ids = itertools.count(1)
+
+
+def new_command_id(prefix="cmd"):
+    return "{0}-{1:x}-{2}".format(prefix, os.getpid(), next(_ids))
+
+
+def current_command_id():
+    return _command_id.get()
+
+
+@contextlib.contextmanager
+def log_context(instance_id=None, command_id=None):
+    """Tag every record logged inside the block (None leaves a field as is)."""
+    tokens = []
+    if instance_id is not None:
+        tokens.append((_instance_id, _instance_id.set(instance_id)))
+    if command_id is not None:
+        tokens.append((_command_id, _command_id.set(command_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def record_dict(record):
+    doc = {
+        "t": record.created,
+        "level": record.levelname,
+        "logger": record.name,
+        "msg": record.getMessage(),
+        "instance_id": getattr(record, "instance_id", None),
+        "command_id": getattr(record, "command_id", None),
+        "pid": record.process,
+        "thread": record.threadName,
+    }
+    if record.exc_text:
+        doc["exc"] = record.exc_text
+    fields = {k: v for k, v in vars(record).items() if k not in _STANDARD}
+    if fields:
+        doc["fields"] = fields
+    return doc
+
+
+# ---------------------------------------------------------
+# Producer side
+# ---------------------------------------------------------
+def _stamp(record):
+    if not hasattr(record, "instance_id"):
+        record.instance_id = _instance_id.get()
+    if not hasattr(record, "command_id"):
+        record.command_id = _command_id.get()
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the IDs for handlers that run in the calling thread."""
+
+    def filter(self, record):
+        _stamp(record)
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Freezes the record in the calling thread and never blocks."""
+
+    _exc_formatter = logging.Formatter()
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        _stamp(record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ---------------------------------------------------------
+# Listener side
+# ---------------------------------------------------------
+class ConsoleFormatter(logging.Formatter):
+    """``[INFO] message`` as the CLI always printed it; ANSI only on a tty."""
+
+    def __init__(self, color):
+        super().__init__()
+        self.color = color
+
+    def format(self, record):
+        msg = record.getMessage()
+        if getattr(record, "header", False):
+            line = "== {0} ==".format(msg)
+            return "\033[36m{0}\033[0m".format(line) if self.color else line
+        tag, ansi = _LEVEL_TAGS.get(record.levelno, ("[{0}]".format(record.levelname), ""))
+        if self.color:
+            tag = "{0}{1}\033[0m".format(ansi, tag)
+        if getattr(record, "command_id", None) and not self.color:
+            msg = "{0} [{1}]".format(msg, record.command_id)
+        exc_text = record.exc_text
+        if not exc_text and record.exc_info:
+            exc_text = self.formatException(record.exc_info)
+        if exc_text:
+            msg = "{0}\n{1}".format(msg, exc_text)
+        return "{0} {1}".format(tag, msg)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record_dict(record), default=str)
+
+
+class RingHandler(logging.Handler):
+    """The last ``size`` records as dicts, newest last."""
+
+    def __init__(self, size=RING_SIZE):
+        super().__init__()
+        self.records = deque(maxlen=size)
+
+    def emit(self, record):
+        self.records.append(record_dict(record))
+
+    def query(self, level=None, instance_id=None, command_id=None, since=None, contains=None, limit=200):
+        floor = logging.getLevelName(level.upper()) if level else 0
+        if not isinstance(floor, int):
+            raise ValueError("Unknown level {0!r}".format(level))
+        needle = contains.lower() if contains else None
+        out = []
+        for doc in reversed(list(self.records)):
+            if since is not None and doc["t"] <= since:
+                continue
+            if logging.getLevelName(doc["level"]) < floor:
+                continue
+            if instance_id is not None and doc["instance_id"] != instance_id:
+                continue
+            if command_id is not None and doc["command_id"] != command_id:
+                continue
+            if needle and needle not in doc["msg"].lower():
+                continue
+            out.append(doc)
+            if len(out) >= limit:
+                break
+        out.reverse()
+        return out
+
+
+class InstanceFileHandler(logging.Handler):
+    """Rotating JSON-lines file per instance, opened on first use."""
+
+    def __init__(self, default_dir=LOG_DIR):
+        super().__init__()
+        self.default_dir = Path(default_dir)
+        self._sinks = {}
+        self._formatter = JsonFormatter()
+
+    def path_for(self, instance_id):
+        if instance_id is None:
+            return self.default_dir / "fluxpath.log"
+        return INSTANCE_DATA_BASE / "instance_{0}".format(instance_id) / "logs" / "fluxpath.log"
+
+    def _sink(self, instance_id):
+        if instance_id not in self._sinks:
+            path = self.path_for(instance_id)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                sink = logging.handlers.RotatingFileHandler(
+                    str(path), maxBytes=FILE_MAX_BYTES, backupCount=FILE_BACKUPS, encoding="utf-8")
+                sink.setFormatter(self._formatter)
+            except OSError as e:
+                sys.stderr.write("FluxPath log sink {0} disabled: {1}\n".format(path, e))
+                sink = None
+            self._sinks[instance_id] = sink
+        return self._sinks[instance_id]
+
+    def emit(self, record):
+        sink = self._sink(getattr(record, "instance_id", None))
+        if sink is not None:
+            sink.emit(record)
+
+    def close(self):
+        for sink in self._sinks.values():
+            if sink is not None:
+                sink.close()
+        super().close()
+
+
+# ---------------------------------------------------------
+# Setup
+# ---------------------------------------------------------
+_lock = threading.Lock()
+_state = {}
+
+
+def setup_logging(console=True, files=True, level=LOG_LEVEL, queue_console=False):
+    """Install the queue pipeline on the root logger (idempotent).
+
+    The console handler sits on the root logger next to the queue unless
+    ``queue_console`` is set (the backend, where stdout is journald).
+    """
+    with _lock:
+        if _state:
+            return
+        q = queue.Queue(QUEUE_SIZE)
+        ring = RingHandler()
+        handlers = [ring]
+        stream = None
+        if console:
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(ConsoleFormatter(sys.stdout.isatty()))
+            if queue_console:
+                handlers.append(stream)
+                stream = None
+            else:
+                stream.addFilter(ContextFilter())
+        if files:
+            handlers.append(InstanceFileHandler())
+        listener = logging.handlers.QueueListener(q, *handlers)
+        producer = ContextQueueHandler(q)
+        root = logging.getLogger()
+        root.addHandler(producer)
+        if stream is not None:
+            root.addHandler(stream)
+        root.setLevel(level)
+        listener.start()
+        _state.update(queue=q, ring=ring, listener=listener, producer=producer, console=stream)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Drain the queue and close the sinks."""
+    with _lock:
+        if not _state:
+            return
+        logging.getLogger().removeHandler(_state["producer"])
+        if _state["console"] is not None:
+            logging.getLogger().removeHandler(_state["console"])
+            _state["console"].close()
+        _state["listener"].stop()
+        for handler in _state["listener"].handlers:
+            handler.close()
+        _state.clear()
+
+
+def flush(timeout=1.0):
+    """Wait until queued records are written (e.g. before a subprocess
+    writes to the same terminal)."""
+    q = _state.get("queue")
+    if q is None:
+        return
+    deadline = time.monotonic() + timeout
+    with q.all_tasks_done:
+        while q.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            q.all_tasks_done.wait(remaining)
+
+
+def recent(**filters):
+    """Query the in-memory ring (see RingHandler.query)."""
+    ring = _state.get("ring")
+    return ring.query(**filters) if ring is not None else []
+
+
+def stats():
+    producer = _state.get("producer")
+    return {
+        "queued": _state["queue"].qsize() if producer else 0,
+        "dropped": producer.dropped if producer else 0,
+        "ring": len(_state["ring"].records) if producer else 0,
+    }
+
+
+def get_logger(name="fluxpath"):
+    setup_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,248 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from .config import FLUXPATH_ROOT
+from .utils import log_info
+
+CONFIG_PATH = FLUXPATH_ROOT / "config" / "fluxpath_config.json"
+
+# Defaults match the hand-written 4-lane mmu_vars.cfg these files replace.
+DEFAULT_PARKING_TO_CUTTER = 55.0
+DEFAULT_CUTTER_TO_FILAMENT_SENSOR = 40.0
+DEFAULT_FILAMENT_SENSOR_TO_EXTRUDER = 60.0
+DEFAULT_NOZZLE_PUSH = 8.0
+# Distance before the sensor where loads drop from fast feed to slow approach.
+DEFAULT_SENSOR_APPROACH_MARGIN = 10.0
+# Extra retract past the sensor on unload so it reliably clears.
+UNLOAD_SENSOR_CLEARANCE = 5.0
+# How far behind the merge point a partially parked tip stops.
+MERGE_CLEARANCE = 5.0
+
+
+@dataclass
+class LaneGeometry:
+    parking_to_cutter: List[float]
+    cutter_to_filament_sensor: float = DEFAULT_CUTTER_TO_FILAMENT_SENSOR
+    filament_sensor_to_extruder: float = DEFAULT_FILAMENT_SENSOR_TO_EXTRUDER
+    nozzle_push: float = DEFAULT_NOZZLE_PUSH
+    sensor_approach_margin: float = DEFAULT_SENSOR_APPROACH_MARGIN
+    # Distance from the point where lane paths merge back to the cutter.
+    # Unknown (None) means toolchanges always park fully.
+    merge_to_cutter: Optional[float] = None
+    cutter_servo: str = "mmu_cutter"
+    cutter_angle_open: int = 30
+    cutter_angle_cut: int = 120
+    # On runout, switch to a matching lane instead of pausing.
+    runout_failover: bool = True
+
+    @property
+    def lanes(self) -> int:
+        return len(self.parking_to_cutter)
+
+    def partial_park(self, index: int) -> float:
+        """Retract after a toolchange cut: just clear of the merge point."""
+        park = self.parking_to_cutter[index]
+        if self.merge_to_cutter is None:
+            return park
+        return min(park, self.merge_to_cutter + MERGE_CLEARANCE)
+
+    def lane_table(self) -> List[dict]:
+        """Per-lane distances with the combined moves precomputed, so macros
+        index one entry instead of adding variables on every swap."""
+        table = []
+        for i, park in enumerate(self.parking_to_cutter):
+            to_sensor = park + self.cutter_to_filament_sensor
+            table.append({
+                "park": round(park, 3),
+                "partial_park": round(self.partial_park(i), 3),
+                "park_to_sensor": round(to_sensor, 3),
+                "park_to_nozzle": round(to_sensor + self.filament_sensor_to_extruder, 3),
+                "unload_to_sensor": round(self.filament_sensor_to_extruder + UNLOAD_SENSOR_CLEARANCE, 3),
+            })
+        return table
+
+
+def load_lane_geometry(config_path: Path = CONFIG_PATH, lanes: Optional[int] = None) -> LaneGeometry:
+    data = json.loads(Path(config_path).read_text()) if Path(config_path).exists() else {}
+    count = int(lanes or data.get("mmu_lanes") or data.get("drive_motors") or 4)
+
+    park = data.get("parking_to_cutter_mm", DEFAULT_PARKING_TO_CUTTER)
+    if not isinstance(park, list):
+        park = [park]
+    park = [float(p) for p in park]
+    # Short lists repeat their last entry so adding lanes never needs every
+    # distance re-entered.
+    park = (park + [park[-1]] * count)[:count]
+
+    merge = data.get("merge_to_cutter_mm")
+
+    return LaneGeometry(
+        parking_to_cutter=park,
+        merge_to_cutter=float(merge) if merge is not None else None,
+        cutter_to_filament_sensor=float(data.get("cutter_to_filament_sensor_mm", DEFAULT_CUTTER_TO_FILAMENT_SENSOR)),
+        filament_sensor_to_extruder=float(data.get("filament_sensor_to_extruder_mm", DEFAULT_FILAMENT_SENSOR_TO_EXTRUDER)),
+        nozzle_push=float(data.get("nozzle_push_mm", DEFAULT_NOZZLE_PUSH)),
+        sensor_approach_margin=float(data.get("sensor_approach_margin_mm", DEFAULT_SENSOR_APPROACH_MARGIN)),
+        cutter_servo=data.get("cutter_servo", "mmu_cutter"),
+        cutter_angle_open=int(data.get("cutter_angle_open", 30)),
+        cutter_angle_cut=int(data.get("cutter_angle_cut", 120)),
+        runout_failover=bool(data.get("runout_failover", True)),
+    )
+
+
+COMMAND = "python3 -m fp_core.macros"
+
+_HEADER = (
+    "# ============================================\n"
+    "# File: mmu/{name}\n"
+    "# Location: ~/printer_data/config/mmu/\n"
+    "#\n"
+    "# GENERATED by fp_core.macros from config/fluxpath_config.json.\n"
+    "# Do not edit by hand; re-run:\n"
+    "#   {command}\n"
+    "#\n"
+    "# Purpose:\n"
+    "#   {purpose}\n"
+    "# ============================================\n\n"
+)
+
+
+def render_vars_cfg(geom: LaneGeometry, command: str = COMMAND) -> str:
+    lanes = ",\n    ".join(json.dumps(row) for row in geom.lane_table())
+    return (
+        _HEADER.format(name="mmu_vars.cfg", purpose="Core MMU variables and per-lane geometry lookup table.",
+                       command=command)
+        + "[gcode_macro MMU_VARS]\n\n"
+        "# Number of MMU lanes/colors\n"
+        "variable_mmu_lanes: {lanes}\n\n"
+        "# Currently active lane (1-based)\n"
+        "variable_active_lane: 1\n\n"
+        "# Lane loaded to the nozzle: 0 = none, -1 = unknown (after restart)\n"
+        "variable_loaded_lane: -1\n\n"
+        "# Current tip position of each lane, mm behind the cutter\n"
+        "variable_parked: {parked}\n\n"
+        "# Lane used by each tool (T0 = first entry); runout failover remaps it\n"
+        "variable_tool_map: {tool_map}\n\n"
+        "# Runout failover: substitute lane per lane, 0 = none (PAUSE instead).\n"
+        "# Kept up to date by the FluxPath backend from the loaded filaments.\n"
+        "variable_runout_failover: {failover}\n"
+        "variable_runout_backup: {none}\n\n"
+        "# Lanes whose spool ran out (1) until they load again\n"
+        "variable_empty: {none}\n\n"
+        "# Per-lane geometry, indexed by lane - 1:\n"
+        "#   park                 PARK -> CUTTER\n"
+        "#   partial_park         toolchange retract after the cut (clear of the merge)\n"
+        "#   park_to_sensor       PARK -> filament sensor\n"
+        "#   park_to_nozzle       PARK -> extruder gears\n"
+        "#   unload_to_sensor     extruder -> past filament sensor (retract)\n"
+        "variable_lanes: [\n    {table}\n  ]\n\n"
+        "# Shared geometry\n"
+        "variable_cutter_to_filament_sensor: {c2s:g}\n"
+        "variable_filament_sensor_to_extruder: {s2e:g}\n\n"
+        "# Slow approach window before the filament sensor\n"
+        "variable_sensor_approach_margin: {margin:g}\n\n"
+        "# Cutter servo\n"
+        "variable_cutter_servo: \"{servo}\"\n"
+        "variable_cutter_angle_open: {open}\n"
+        "variable_cutter_angle_cut: {cut}\n\n"
+        "# Nozzle push\n"
+        "variable_nozzle_push: {push:g}\n\n"
+        "gcode:\n"
+        "  RESPOND PREFIX=MMU MSG=\"MMU_VARS loaded: lanes={{printer['gcode_macro MMU_VARS'].mmu_lanes}}, "
+        "active_lane={{printer['gcode_macro MMU_VARS'].active_lane}}\"\n"
+    ).format(
+        lanes=geom.lanes,
+        parked=json.dumps([round(p, 3) for p in geom.parking_to_cutter]),
+        tool_map=json.dumps(list(range(1, geom.lanes + 1))),
+        failover=int(geom.runout_failover),
+        none=json.dumps([0] * geom.lanes),
+        table=lanes,
+        c2s=geom.cutter_to_filament_sensor,
+        s2e=geom.filament_sensor_to_extruder,
+        margin=geom.sensor_approach_margin,
+        servo=geom.cutter_servo,
+        open=geom.cutter_angle_open,
+        cut=geom.cutter_angle_cut,
+        push=geom.nozzle_push,
+    )
+
+
+def render_toolchange_cfg(geom: LaneGeometry, command: str = COMMAND) -> str:
+    out = [
+        _HEADER.format(name="mmu_toolchange.cfg", purpose="Lane-aware toolchange + T0-T{0} for slicer.".format(geom.lanes - 1),
+                       command=command),
+        "[gcode_macro MMU_TOOL_CHANGE]\n"
+        "description: Switch lanes; skips if the lane is already loaded\n"
+        "gcode:\n"
+        "  {% set lane = params.LANE|int %}\n"
+        "  {% set v = printer[\"gcode_macro MMU_VARS\"] %}\n"
+        "  {% set loaded = v.loaded_lane|int %}\n\n"
+        "  {% if lane < 1 or lane > v.mmu_lanes %}\n"
+        "    MMU_ERROR MSG=\"Requested lane {lane} but mmu_lanes={v.mmu_lanes}\"\n"
+        "  {% elif lane == loaded %}\n"
+        "    RESPOND PREFIX=MMU MSG=\"TOOL_CHANGE: lane {lane} already loaded, skipping\"\n"
+        "  {% else %}\n"
+        "    RESPOND PREFIX=MMU MSG=\"TOOL_CHANGE: from lane {v.active_lane} to lane {lane}\"\n"
+        "    # Outgoing lane only retracts clear of the merge point; the\n"
+        "    # incoming lane feeds from wherever it was left (MMU_VARS.parked).\n"
+        "    {% if loaded != 0 %}\n"
+        "      MMU_UNLOAD PARK=PARTIAL\n"
+        "    {% endif %}\n"
+        "    MMU_SET_LANE LANE={lane}\n"
+        "    MMU_LOAD\n"
+        "    RESPOND PREFIX=MMU MSG=\"TOOL_CHANGE complete, active lane {lane}\"\n"
+        "  {% endif %}\n",
+    ]
+    for tool in range(geom.lanes):
+        out.append(
+            "\n[gcode_macro T{tool}]\n"
+            "gcode:\n"
+            "  MMU_TOOL_CHANGE LANE={{printer[\"gcode_macro MMU_VARS\"].tool_map[{tool}]}}\n".format(tool=tool)
+        )
+    return "".join(out)
+
+
+def write_mmu_macros(mmu_dir: Path, geom: LaneGeometry, command: str = COMMAND) -> List[Path]:
+    """Write the generated files; ``command`` (how to regenerate them) goes
+    in their headers."""
+    mmu_dir = Path(mmu_dir)
+    mmu_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for name, text in (
+        ("mmu_vars.cfg", render_vars_cfg(geom, command)),
+        ("mmu_toolchange.cfg", render_toolchange_cfg(geom, command)),
+    ):
+        path = mmu_dir / name
+        path.write_text(text)
+        written.append(path)
+    log_info("Generated {0}-lane MMU macros in {1}".format(geom.lanes, mmu_dir))
+    return written
+
+
+def main(argv=None):
+    # Imported here: the backend imports this module for load_lane_geometry
+    # and never parses arguments.
+    import argparse
+
+    p = argparse.ArgumentParser(prog="fluxpath-macros", description="Generate N-lane MMU Klipper macros")
+    p.add_argument("--config", type=Path, default=CONFIG_PATH, help="fluxpath_config.json to read")
+    p.add_argument("--out", type=Path, default=FLUXPATH_ROOT / "mmu", help="mmu/ directory to write into")
+    p.add_argument("--lanes", type=int, default=None, help="override lane count from config")
+    p.add_argument("--transitions", action="store_true", help="print the lane transition table as JSON instead")
+    args = p.parse_args(argv)
+
+    geom = load_lane_geometry(args.config, args.lanes)
+    if args.transitions:
+        from .transitions import transition_table
+
+        print(json.dumps({"lanes": geom.lanes, "transitions": transition_table(geom)}, indent=2))
+        return
+    # A --lanes override is not in the config: keep it in the re-run line.
+    command = COMMAND if args.lanes is None else "{0} --lanes {1}".format(COMMAND, args.lanes)
+    write_mmu_macros(args.out, geom, command)
+
+
+if __name__ == "__main__":
+    main()
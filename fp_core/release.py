@@ -0,0 +1,442 @@
+"""Content-addressed release packages and delta updates.
+
+A package is a directory (or a tar of one) holding manifest.json -- every
+release file with its sha256, size and mode -- and objects/<hash>, one
+blob per distinct content. A delta package is built against the
+manifest of an older release and only carries the objects that release
+does not have.
+
+Applying a package compares it with the installed manifest
+(.release/manifest.json) and writes only files whose content differs.
+Each one is written and fsynced in .release/staging on the same
+filesystem, then renamed over the target, so a file is either the old or
+the new version, never half-written. The new manifest is recorded last;
+an interrupted update simply redoes the remaining files next time.
+Installed files are re-hashed only if their size or mtime no longer
+match the manifest, so local edits are still detected. A file changed
+since its release installed it, or an existing config/ file no release
+installed (the printer's own pins and lane colors), is kept when the
+package leaves it as it was and is a conflict otherwise: the update is
+refused unless forced (``--force``). Manifest paths
+(the package's and the installed one) must stay inside the install
+directory; anything else rejects the whole update before a file changes.
+
+The backend only needs a restart when Python code, dependencies or
+config/ (read once at startup) changed; UI panels, macros, docs and
+scripts are picked up without one.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+
+from .config import FLUXPATH_ROOT
+from .utils import log_error, log_info, log_warn, run_cmd
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+OBJECTS = "objects"
+STATE_DIR = ".release"
+CHUNK = 1 << 20
+
+INCLUDE_DIRS = (
+    "backend", "core", "fluxpath", "fp_core", "klipper", "mmu", "ui",
+    "config", "systemd", "scripts", "docs",
+)
+INCLUDE_FILES = ("server.py", "__init__.py", "pyproject.toml", "install.sh", "VERSION")
+EXCLUDE_PARTS = frozenset(("__pycache__", ".git", "dist", "venv", ".venv", STATE_DIR))
+EXCLUDE_SUFFIXES = (".pyc", ".pyo", ".swp")
+
+RESTART_SUFFIXES = (".py",)
+RESTART_FILES = frozenset(("pyproject.toml", "requirements.txt"))
+RESTART_DIRS = ("config/",)
+# Device configuration: an existing file here is the printer's own even
+# when no release recorded it.
+LOCAL_DIRS = ("config/",)
+SERVICE = "fluxpath.service"
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+
+def release_files(root: Path) -> List[str]:
+    """Paths (relative, '/'-separated) that make up a release of ``root``."""
+    root = Path(root)
+    out = [name for name in INCLUDE_FILES if (root / name).is_file()]
+    out += [p.name for p in root.glob("requirements*.txt") if p.is_file()]
+    for top in INCLUDE_DIRS:
+        for dirpath, dirnames, filenames in os.walk(root / top):
+            dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDE_PARTS)
+            rel_dir = Path(dirpath).relative_to(root).as_posix()
+            for name in filenames:
+                if not name.endswith(EXCLUDE_SUFFIXES):
+                    out.append("{0}/{1}".format(rel_dir, name))
+    return sorted(set(out))
+
+
+def check_path(rel: str) -> str:
+    """``rel`` if it is a plain relative path inside a release, else
+    ValueError: no absolute paths, no .. and nothing under .release."""
+    parts = PurePosixPath(rel).parts
+    if (not parts or PurePosixPath(rel).is_absolute() or "\\" in rel
+            or any(part in ("..", ".") for part in parts) or parts[0] == STATE_DIR):
+        raise ValueError("unsafe path in manifest: {0!r}".format(rel))
+    return rel
+
+
+def _target(install_dir: Path, rel: str) -> Path:
+    """Where ``rel`` goes under ``install_dir``; ValueError if that is
+    outside it (including through a symlinked directory)."""
+    target = install_dir / check_path(rel)
+    root = install_dir.resolve()
+    if root not in target.resolve().parents:
+        raise ValueError("{0!r} resolves outside {1}".format(rel, install_dir))
+    return target
+
+
+def _check_hash(sha: str) -> str:
+    if len(sha) != 64 or any(c not in "0123456789abcdef" for c in sha):
+        raise ValueError("bad object hash in manifest: {0!r}".format(sha))
+    return sha
+
+
+def needs_restart(paths) -> bool:
+    return any(p.endswith(RESTART_SUFFIXES) or p.startswith(RESTART_DIRS)
+               or p.rsplit("/", 1)[-1] in RESTART_FILES for p in paths)
+
+
+# -------------------------------------------------
+# Build
+# -------------------------------------------------
+def build(root: Path, out_dir: Path, version: str, base: Optional[Path] = None,
+          meta: Optional[Dict] = None, tar: bool = True) -> Path:
+    """Package ``root`` as release ``version`` under ``out_dir``.
+
+    With ``base`` (an older release's manifest.json, package directory or
+    tar) only objects that release lacks are included. Returns the tar
+    (or directory, with ``tar=False``).
+    """
+    root = Path(root)
+    base_hashes = set()
+    base_version = None
+    if base is not None:
+        old = read_package_manifest(Path(base))
+        base_hashes = {f["sha256"] for f in old["files"].values()}
+        base_version = old["version"]
+
+    name = "fluxpath-{0}".format(version) + ("-delta-{0}".format(base_version) if base_version else "")
+    pkg = Path(out_dir) / name
+    if pkg.exists():
+        shutil.rmtree(pkg)
+    (pkg / OBJECTS).mkdir(parents=True)
+
+    files: Dict[str, Dict] = {}
+    shipped = 0
+    for rel in release_files(root):
+        src = root / check_path(rel)
+        sha = _hash_file(src)
+        st = src.stat()
+        files[rel] = {"sha256": sha, "size": st.st_size, "mode": st.st_mode & 0o777}
+        obj = pkg / OBJECTS / sha
+        if sha not in base_hashes and not obj.exists():
+            shutil.copyfile(src, obj)
+            shipped += 1
+
+    manifest = dict(meta or {}, format=FORMAT, version=version, created_at=time.time(),
+                    base=base_version, files=files)
+    (pkg / MANIFEST).write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    log_info("Packaged {0} files ({1} objects) as {2}".format(len(files), shipped, name))
+    if not tar:
+        return pkg
+
+    archive = pkg.with_name(name + ".tar.gz")
+    with tarfile.open(archive, "w:gz") as t:
+        t.add(pkg, arcname=name)
+    shutil.rmtree(pkg)
+    return archive
+
+
+# -------------------------------------------------
+# Package access (directory or tar)
+# -------------------------------------------------
+class Package:
+    def __init__(self, source: Path) -> None:
+        self.source = Path(source)
+        self._tar: Optional[tarfile.TarFile] = None
+        self._prefix = ""
+        if self.source.is_dir():
+            self.manifest = json.loads((self.source / MANIFEST).read_text())
+            return
+        self._tar = tarfile.open(self.source)
+        for member in self._tar:
+            if member.name == MANIFEST or member.name.endswith("/" + MANIFEST):
+                self._prefix = member.name[: -len(MANIFEST)]
+                self.manifest = json.load(self._tar.extractfile(member))
+                break
+        else:
+            raise ValueError("no {0} in {1}".format(MANIFEST, self.source))
+
+    def has(self, sha: str) -> bool:
+        if self._tar is None:
+            return (self.source / OBJECTS / sha).is_file()
+        try:
+            self._tar.getmember(self._prefix + OBJECTS + "/" + sha)
+            return True
+        except KeyError:
+            return False
+
+    def open(self, sha: str):
+        if self._tar is None:
+            return open(self.source / OBJECTS / sha, "rb")
+        return self._tar.extractfile(self._prefix + OBJECTS + "/" + sha)
+
+    def close(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_package_manifest(path: Path) -> Dict:
+    """Manifest of a package (dir or tar) or a bare manifest.json."""
+    path = Path(path)
+    if path.is_file() and path.name.endswith(".json"):
+        return json.loads(path.read_text())
+    with Package(path) as pkg:
+        return pkg.manifest
+
+
+# -------------------------------------------------
+# Apply
+# -------------------------------------------------
+@dataclass
+class UpdatePlan:
+    version: str
+    installed_version: Optional[str]
+    write: List[str] = field(default_factory=list)
+    chmod: List[str] = field(default_factory=list)
+    remove: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    bytes: int = 0
+    restart: bool = False
+    missing: List[str] = field(default_factory=list)  # objects the package lacks
+    conflicts: List[str] = field(default_factory=list)  # locally edited files it would replace
+    kept: List[str] = field(default_factory=list)  # locally edited files it does not change
+
+
+def installed_manifest(install_dir: Path) -> Dict:
+    try:
+        return json.loads((Path(install_dir) / STATE_DIR / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {"version": None, "files": {}}
+
+
+def _current_hash(path: Path, record: Optional[Dict]) -> Optional[str]:
+    """sha256 of an installed file, trusting the manifest while its size
+    and mtime are unchanged."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    if record and record.get("size") == st.st_size and record.get("mtime_ns") == st.st_mtime_ns:
+        return record["sha256"]
+    return _hash_file(path)
+
+
+def _locally_changed(rel: str, current: Optional[str], record: Optional[Dict]) -> bool:
+    """Whether the installed file (hash ``current``, None if absent) holds
+    content no release put there."""
+    if current is None:
+        return False
+    if record is not None:
+        return current != record["sha256"]
+    return rel.startswith(LOCAL_DIRS)
+
+
+def plan_update(pkg: Package, install_dir: Path) -> UpdatePlan:
+    install_dir = Path(install_dir)
+    new = pkg.manifest["files"]
+    old = installed_manifest(install_dir)
+    plan = UpdatePlan(pkg.manifest["version"], old.get("version"))
+    # Every path is checked before anything is compared or written.
+    targets = {rel: _target(install_dir, rel) for rel in list(new) + list(old["files"])}
+    for f in new.values():
+        _check_hash(f["sha256"])
+    for rel, f in sorted(new.items()):
+        target = targets[rel]
+        record = old["files"].get(rel)
+        current = _current_hash(target, record)
+        if current == f["sha256"]:
+            if target.stat().st_mode & 0o777 != f["mode"]:
+                plan.chmod.append(rel)
+            plan.unchanged += 1
+            continue
+        if _locally_changed(rel, current, record):
+            if record is not None and record["sha256"] == f["sha256"]:
+                plan.kept.append(rel)
+                continue
+            plan.conflicts.append(rel)
+        if not pkg.has(f["sha256"]):
+            plan.missing.append(rel)
+        plan.write.append(rel)
+        plan.bytes += f["size"]
+    # Only files an earlier release installed are ever removed.
+    plan.remove = sorted(rel for rel in old["files"] if rel not in new and targets[rel].exists())
+    for rel in plan.remove:
+        if _locally_changed(rel, _current_hash(targets[rel], old["files"][rel]), old["files"][rel]):
+            plan.conflicts.append(rel)
+    plan.restart = needs_restart(plan.write + plan.remove)
+    return plan
+
+
+def apply(source: Path, install_dir: Path = FLUXPATH_ROOT, dry_run: bool = False,
+          force: bool = False) -> UpdatePlan:
+    """Install the package at ``source``. Locally edited files it would
+    replace or remove (``plan.conflicts``) refuse the update unless
+    ``force`` is set."""
+    install_dir = Path(install_dir)
+    with Package(source) as pkg:
+        if pkg.manifest.get("format") != FORMAT:
+            raise ValueError("unsupported package format {0}".format(pkg.manifest.get("format")))
+        old_files = installed_manifest(install_dir)["files"]
+        plan = plan_update(pkg, install_dir)
+        if plan.missing:
+            raise ValueError("delta package (base {0}) lacks {1} files this install needs, e.g. {2}".format(
+                pkg.manifest.get("base"), len(plan.missing), plan.missing[0]))
+        if dry_run:
+            return plan
+        if plan.conflicts and not force:
+            raise ValueError("{0} locally modified files would be replaced, e.g. {1}; "
+                             "keep a copy and rerun with --force".format(len(plan.conflicts), plan.conflicts[0]))
+
+        staging = install_dir / STATE_DIR / "staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        files = pkg.manifest["files"]
+
+        # Stage everything first: a bad object aborts before any file changes.
+        for i, rel in enumerate(plan.write):
+            f = files[rel]
+            staged = staging / str(i)
+            digest = hashlib.sha256()
+            with pkg.open(f["sha256"]) as src, open(staged, "wb") as dst:
+                while True:
+                    chunk = src.read(CHUNK)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            if digest.hexdigest() != f["sha256"]:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise ValueError("object for {0} is corrupt".format(rel))
+            os.chmod(staged, f["mode"])
+
+        for i, rel in enumerate(plan.write):
+            target = install_dir / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging / str(i), target)
+        for rel in plan.chmod:
+            os.chmod(install_dir / rel, files[rel]["mode"])
+        for rel in plan.remove:
+            try:
+                os.unlink(install_dir / rel)
+            except OSError as e:
+                log_warn("Could not remove {0}: {1}".format(rel, e))
+        shutil.rmtree(staging, ignore_errors=True)
+
+        record = {}
+        for rel, f in files.items():
+            if rel in plan.kept:
+                # Still the release's hash and the old size/mtime, so the
+                # edit is found again next time.
+                record[rel] = old_files[rel]
+                continue
+            st = (install_dir / rel).stat()
+            record[rel] = dict(f, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        state = install_dir / STATE_DIR / MANIFEST
+        tmp = state.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": plan.version, "installed_at": time.time(), "files": record}))
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, state)
+    return plan
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(prog="fluxpath-release", description="Build and apply FluxPath release packages")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="package a source tree")
+    b.add_argument("--root", type=Path, default=FLUXPATH_ROOT)
+    b.add_argument("--out", type=Path, default=FLUXPATH_ROOT / "dist")
+    b.add_argument("--version", required=True)
+    b.add_argument("--base", type=Path, help="older release (package or manifest.json) to build a delta against")
+    b.add_argument("--meta", action="append", default=[], metavar="KEY=VALUE", help="extra manifest fields")
+    b.add_argument("--dir", action="store_true", help="leave the package as a directory instead of a tar")
+
+    for name, text in (("apply", "install a package"), ("plan", "show what a package would change")):
+        a = sub.add_parser(name, help=text)
+        a.add_argument("source", type=Path, help="package tar or directory")
+        a.add_argument("--install-dir", type=Path, default=FLUXPATH_ROOT)
+        if name == "apply":
+            a.add_argument("--restart", action="store_true",
+                           help="restart {0} if Python code or config changed".format(SERVICE))
+            a.add_argument("--force", action="store_true", help="replace locally modified files")
+        a.add_argument("--json", action="store_true")
+
+    args = p.parse_args(argv)
+
+    if args.command == "build":
+        meta = dict(item.split("=", 1) for item in args.meta)
+        print(build(args.root, args.out, args.version, args.base, meta, tar=not args.dir))
+        return 0
+
+    try:
+        plan = apply(args.source, args.install_dir, dry_run=args.command == "plan",
+                     force=getattr(args, "force", False))
+    except (OSError, ValueError, tarfile.TarError) as e:
+        log_error(str(e))
+        return 1
+
+    if args.json:
+        print(json.dumps(plan.__dict__, indent=2))
+    else:
+        verb = "Would write" if args.command == "plan" else "Wrote"
+        log_info("{0} -> {1}: {2} {3} files ({4:.1f} kB), removed {5}, {6} unchanged, {7} kept".format(
+            plan.installed_version or "unversioned", plan.version, verb, len(plan.write),
+            plan.bytes / 1e3, len(plan.remove), plan.unchanged, len(plan.kept)))
+        for rel in plan.write:
+            print("  {0}".format(rel))
+        for rel in plan.remove:
+            print("  removed {0}".format(rel))
+        for rel in plan.conflicts:
+            log_warn("Locally modified: {0}".format(rel))
+        log_info("Restart needed: {0}".format("yes" if plan.restart else "no"))
+
+    if args.command == "apply" and args.restart and plan.restart:
+        run_cmd(["systemctl", "restart", SERVICE], sudo=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from .macros import LaneGeometry
+
+# Feed rates (mm/min), matching the MMU_* macros.
+RETRACT_F = 1800
+FAST_FEED_F = 1800
+SLOW_FEED_F = 300
+EXTRUDER_FEED_F = 1500
+NOZZLE_PUSH_F = 600
+
+# Lane number used for "no lane loaded" (lanes are 1-based, like MMU_VARS).
+NO_LANE = 0
+
+
+@dataclass
+class Step:
+    op: str  # tip_form | retract | check_clear | cut | select | feed | wait_sensor | push
+    lane: int
+    mm: float = 0.0
+    f: int = 0
+
+
+@dataclass
+class Transition:
+    from_lane: int
+    to_lane: int
+    steps: List[Step] = field(default_factory=list)
+    retract_mm: float = 0.0
+    feed_mm: float = 0.0
+    # Where from_lane's tip ends up, measured back from the cutter.
+    from_parked_mm: Optional[float] = None
+
+    @property
+    def skipped(self) -> bool:
+        return not self.steps
+
+    def to_dict(self) -> Dict:
+        d = asdict(self)
+        d["skipped"] = self.skipped
+        return d
+
+
+def _combine(steps: Sequence[Step]) -> List[Step]:
+    """Merge back-to-back moves of the same kind, lane and speed."""
+    out: List[Step] = []
+    for s in steps:
+        if s.op in ("retract", "feed") and s.mm <= 0:
+            continue
+        prev = out[-1] if out else None
+        if prev and s.op in ("retract", "feed") and (prev.op, prev.lane, prev.f) == (s.op, s.lane, s.f):
+            prev.mm = round(prev.mm + s.mm, 3)
+        else:
+            out.append(Step(s.op, s.lane, round(s.mm, 3), s.f))
+    return out
+
+
+def plan_transition(
+    geom: LaneGeometry,
+    from_lane: int,
+    to_lane: int,
+    parked_mm: Optional[Sequence[float]] = None,
+    partial: bool = True,
+) -> Transition:
+    """Minimal move sequence to go from ``from_lane`` (NO_LANE if nothing is
+    loaded) to ``to_lane``.
+
+    ``parked_mm`` is each lane's current tip position behind the cutter
+    (defaults to a full park). With ``partial`` the outgoing lane only
+    retracts to just behind the merge point, which is all the next lane
+    needs to pass.
+    """
+    if not 1 <= to_lane <= geom.lanes:
+        raise ValueError("to_lane {0} outside 1..{1}".format(to_lane, geom.lanes))
+    if not 0 <= from_lane <= geom.lanes:
+        raise ValueError("from_lane {0} outside 0..{1}".format(from_lane, geom.lanes))
+
+    if from_lane == to_lane:
+        return Transition(from_lane, to_lane, from_parked_mm=0.0)
+
+    parked = list(parked_mm) if parked_mm is not None else list(geom.parking_to_cutter)
+    steps: List[Step] = []
+    retract = 0.0
+    from_parked = None
+
+    if from_lane != NO_LANE:
+        i = from_lane - 1
+        from_parked = geom.partial_park(i) if partial else geom.parking_to_cutter[i]
+        unload = geom.lane_table()[i]["unload_to_sensor"]
+        steps += [
+            Step("tip_form", from_lane),
+            Step("retract", from_lane, unload, RETRACT_F),
+            Step("check_clear", from_lane),
+            Step("retract", from_lane, geom.cutter_to_filament_sensor, RETRACT_F),
+            Step("cut", from_lane),
+            Step("retract", from_lane, from_parked, RETRACT_F),
+        ]
+        retract = unload + geom.cutter_to_filament_sensor + from_parked
+
+    # Park -> cutter and cutter -> sensor are one fast move; only the last
+    # approach_margin before the sensor runs slow.
+    to_sensor = parked[to_lane - 1] + geom.cutter_to_filament_sensor
+    fast = max(0.0, to_sensor - geom.sensor_approach_margin)
+    steps += [
+        Step("select", to_lane),
+        Step("feed", to_lane, fast, FAST_FEED_F),
+        Step("feed", to_lane, to_sensor - fast, SLOW_FEED_F),
+        Step("wait_sensor", to_lane),
+        Step("feed", to_lane, geom.filament_sensor_to_extruder, EXTRUDER_FEED_F),
+        Step("push", to_lane, geom.nozzle_push, NOZZLE_PUSH_F),
+    ]
+    feed = to_sensor + geom.filament_sensor_to_extruder + geom.nozzle_push
+
+    return Transition(
+        from_lane,
+        to_lane,
+        steps=_combine(steps),
+        retract_mm=round(retract, 3),
+        feed_mm=round(feed, 3),
+        from_parked_mm=from_parked,
+    )
+
+
+def transition_table(geom: LaneGeometry, partial: bool = True) -> List[Dict]:
+    """Every (from, to) transition, including first loads from NO_LANE.
+
+    Mid-print lanes sit where the previous toolchange left them (partial
+    park); first loads start from a full park.
+    """
+    steady = [geom.partial_park(i) if partial else p for i, p in enumerate(geom.parking_to_cutter)]
+    table = []
+    for a in range(geom.lanes + 1):
+        for b in range(1, geom.lanes + 1):
+            parked = geom.parking_to_cutter if a == NO_LANE else steady
+            table.append(plan_transition(geom, a, b, parked, partial).to_dict())
+    return table
@@ -1,5 +1,7 @@
 import subprocess
 
+from . import logs
+
 
 class Colors(object):
     RESET = "\033[0m"
@@ -28,23 +30,29 @@ def color_text(text, color):
     return "{0}{1}{2}".format(prefix, text, Colors.RESET)
 
 
-def log_info(msg):
-    print("{0} {1}".format(color_text("[INFO]", "green"), msg))
+# Structured (see fp_core.logs); the console still shows "[INFO] msg"
+# lines, written before the call returns, so they interleave correctly
+# with print(). The ring and file sinks are queued.
+def log_info(msg, **fields):
+    logs.get_logger("fluxpath").info(msg, extra=fields)
 
 
-def log_warn(msg):
-    print("{0} {1}".format(color_text("[WARN]", "yellow"), msg))
+def log_warn(msg, **fields):
+    logs.get_logger("fluxpath").warning(msg, extra=fields)
 
 
-def log_error(msg):
-    print("{0} {1}".format(color_text("[ERROR]", "red"), msg))
+def log_error(msg, **fields):
+    logs.get_logger("fluxpath").error(msg, extra=fields)
 
 
 def log_header(msg):
-    print(color_text("== {0} ==".format(msg), "cyan"))
+    logs.get_logger("fluxpath").info(msg, extra={"header": True})
 
 
 def run_cmd(cmd, sudo=False, check=True):
     full = ["sudo"] + cmd if sudo else cmd
-    log_info("run: {0}".format(" ".join(full)))
+    log_info("run: {0}".format(" ".join(full)), cmd=full)
+    # The command writes to the same terminal: with a queued console
+    # (queue_console=True), print what is queued first.
+    logs.flush()
     return subprocess.run(full, check=check)
@@ -104,11 +104,11 @@ mmu_pins:    $MMU_PINS_CFG
 
 # ---------- Backend / API helpers ----------
 get_backend_health_raw() { curl -s http://localhost:9876/health 2>/dev/null || echo "unreachable"; }
-get_printer_info_raw()  { curl -s http://localhost:7125/printer/info 2>/dev/null || echo "unreachable"; }
-get_mmu_status_raw()    { curl -s http://localhost:9876/mmu/status 2>/dev/null || echo "unreachable"; }
-get_mmu_sensors_raw()   { curl -s http://localhost:9876/sensors 2>/dev/null || echo "unreachable"; }
-get_mmu_motors_raw()    { curl -s http://localhost:9876/motors 2>/dev/null || echo "unreachable"; }
-get_webcam_status_raw() { curl -s -o /dev/null -w "%{http_code}" "http://localhost:8080/?action=snapshot" 2>/dev/null || echo "unreachable"; }
+
+# Backend, Moonraker, MMU, sensors, motors and webcam come from one
+# aggregate document (/status/all) or its stream (/status/stream).
+FLUXPATH_CLI="$BASE_DIR/scripts/fluxpath_cli.py"
+get_system_status_text() { python3 "$FLUXPATH_CLI" status --text 2>&1 || true; }
 
 backend_service_state() {
   if command -v systemctl >/dev/null 2>&1 && systemctl is-active --quiet fluxpath.service; then
@@ -118,26 +118,11 @@ backend_service_state() {
   fi
 }
 
-fmt_status() {
-  local label="$1"
-  local raw="$2"
-  if [[ "$raw" == "unreachable" ]]; then
-    echo "✖ $label: unreachable"
-  elif echo "$raw" | grep -q '"detail":"Not Found"'; then
-    echo "⚠ $label: endpoint not found"
-  else
-    echo "✔ $label: $raw"
-  fi
-}
-
-fmt_webcam() {
-  local code="$1"
-  if [[ "$code" == "unreachable" ]]; then
-    echo "✖ Webcam: unreachable"
-  elif [[ "$code" =~ ^[0-9]+$ ]] && [ "$code" -ge 200 ] && [ "$code" -lt 400 ]; then
-    echo "✔ Webcam HTTP: $code"
+fmt_service() {
+  if [[ "$1" == "active" ]]; then
+    echo "✔ Backend service: active"
   else
-    echo "⚠ Webcam HTTP: $code"
+    echo "✖ Backend service: $1"
   fi
 }
 
@@ -149,11 +134,12 @@ ensure_ui_panels() {
   "type": "custom",
   "content": {
     "title": "FluxPath MMU Status",
+    "object": "gcode_macro _FLUXPATH_MMU",
     "widgets": [
       { "type": "webcam", "source": "/webcam/stream" },
-      { "type": "status", "source": "/mmu/status" },
-      { "type": "colors", "source": "/mmu/colors" },
-      { "type": "sensors", "source": "/mmu/sensors" }
+      { "type": "status", "object": "gcode_macro _FLUXPATH_MMU", "fields": ["backend", "state", "active_slot", "last_error"] },
+      { "type": "colors", "object": "gcode_macro _FLUXPATH_MMU", "field": "slots", "key": "color" },
+      { "type": "sensors", "object": "gcode_macro _FLUXPATH_MMU", "field": "slots", "key": "has_filament" }
     ]
   }
 }
@@ -203,30 +189,14 @@ MMU config source:
 
 # ---------- Status screens ----------
 show_system_status_once() {
-  local backend_state backend_health printer mmu_status mmu_sensors mmu_motors webcam panels
-
-  backend_state=$(backend_service_state)
-  backend_health=$(get_backend_health_raw)
-  printer=$(get_printer_info_raw)
-  mmu_status=$(get_mmu_status_raw)
-  mmu_sensors=$(get_mmu_sensors_raw)
-  mmu_motors=$(get_mmu_motors_raw)
-  webcam=$(get_webcam_status_raw)
+  local panels
   panels=$(ui_panels_status)
 
   local msg="
 FluxPath System Snapshot
 ------------------------
-$(fmt_status 'Backend service' "$backend_state")
-$(fmt_status 'Backend health' "$backend_health")
-
-$(fmt_status 'Printer API' "$printer")
-
-$(fmt_status 'MMU status' "$mmu_status")
-$(fmt_status 'MMU sensors' "$mmu_sensors")
-$(fmt_status 'MMU motors' "$mmu_motors")
-
-$(fmt_webcam "$webcam")
+$(fmt_service "$(backend_service_state)")
+$(get_system_status_text)
 
 UI Panels:
 $panels
@@ -235,39 +205,25 @@ $panels
 }
 
 show_system_status_live() {
-  while true; do
-    backend_state=$(backend_service_state)
-    backend_health=$(get_backend_health_raw)
-    printer=$(get_printer_info_raw)
-    mmu_status=$(get_mmu_status_raw)
-    mmu_sensors=$(get_mmu_sensors_raw)
-    mmu_motors=$(get_mmu_motors_raw)
-    webcam=$(get_webcam_status_raw)
-    panels=$(ui_panels_status)
-
-    msg="
-FluxPath Live Status (auto-refresh)
------------------------------------
-$(fmt_status 'Backend service' "$backend_state")
-$(fmt_status 'Backend health' "$backend_health")
-
-$(fmt_status 'Printer API' "$printer")
-
-$(fmt_status 'MMU status' "$mmu_status")
-$(fmt_status 'MMU sensors' "$mmu_sensors")
-$(fmt_status 'MMU motors' "$mmu_motors")
-
-$(fmt_webcam "$webcam")
-
-UI Panels:
-$panels
-
-Press <Yes> to refresh, <No> to return.
-"
-    if ! whiptail --title "FluxPath – Live Status" --yesno "$msg" 25 100; then
-      break
-    fi
-  done
+  # Redraw on every pushed change instead of re-polling each endpoint;
+  # frames from the CLI are separated by form feeds. Ctrl+C returns here.
+  local frame="" interrupted=""
+  trap 'interrupted=1' INT
+  while IFS= read -r -d $'\f' frame; do
+    clear
+    echo "FluxPath Live Status (streaming)"
+    echo "--------------------------------"
+    fmt_service "$(backend_service_state)"
+    frame="${frame#$'\n'}"
+    echo "${frame%$'\n'}"
+    echo
+    echo "Press Ctrl+C to return to the menu."
+  done < <(python3 "$FLUXPATH_CLI" status --watch --text 2>&1 || true)
+  trap - INT
+  if [ -z "$interrupted" ] && [ -n "$frame" ]; then
+    whiptail --title "FluxPath – Live Status" --msgbox "Status stream ended:
+$frame" 12 80
+  fi
 }
 
 show_config_summary() {
@@ -105,11 +105,12 @@ ensure_ui_panels() {
   "type": "custom",
   "content": {
     "title": "FluxPath MMU Status",
+    "object": "gcode_macro _FLUXPATH_MMU",
     "widgets": [
       { "type": "webcam", "source": "/webcam/stream" },
-      { "type": "status", "source": "/mmu/status" },
-      { "type": "colors", "source": "/mmu/colors" },
-      { "type": "sensors", "source": "/mmu/sensors" }
+      { "type": "status", "object": "gcode_macro _FLUXPATH_MMU", "fields": ["backend", "state", "active_slot", "last_error"] },
+      { "type": "colors", "object": "gcode_macro _FLUXPATH_MMU", "field": "slots", "key": "color" },
+      { "type": "sensors", "object": "gcode_macro _FLUXPATH_MMU", "field": "slots", "key": "has_filament" }
     ]
   }
 }
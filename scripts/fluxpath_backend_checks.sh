@@ -0,0 +1,29 @@
+#!/bin/bash
+# Backend checks shared by fluxpath_full_check.sh and
+# fluxpath_system_check.sh (sourced, not run). /health/deep is read once;
+# the service caches every probe, so this costs it no extra work.
+
+FLUXPATH_URL="${FLUXPATH_URL:-http://localhost:9876}"
+
+# probe_ok NAME: "true" if the cached probe NAME passed, else "false".
+probe_ok() {
+    python3 -c 'import json,sys; d=json.load(sys.stdin); print(str(d["probes"][sys.argv[1]]["ok"] is True).lower())' "$1" <<< "$HEALTH" 2>/dev/null || echo false
+}
+
+backend_checks() {
+    HEALTH=$(curl -s "$FLUXPATH_URL/health/deep")
+    echo "BACKEND_HEALTH=$(python3 -c 'import json,sys; print(json.load(sys.stdin)["status"])' <<< "$HEALTH" 2>/dev/null || echo unreachable)"
+
+    # Mounted means the route exists: an MMU in error answers, just not 200.
+    local code
+    code=$(curl -s -o /dev/null -w "%{http_code}" "$FLUXPATH_URL/mmu/status")
+    if [ "$code" != "000" ] && [ "$code" != "404" ]; then
+        echo "MMU_ROUTER_MOUNTED=true"
+    else
+        echo "MMU_ROUTER_MOUNTED=false"
+    fi
+
+    echo "MMU_OK=$(probe_ok mmu)"
+    echo "MOONRAKER_REACHABLE=$(probe_ok moonraker)"
+    echo "KLIPPER_READY=$(probe_ok klipper)"
+}
@@ -25,12 +25,14 @@ fi
 
 echo "VERSION=$VERSION"
 
-RELEASE_NAME="fluxpath-$VERSION"
-RELEASE_DIR="$DIST_DIR/$RELEASE_NAME"
+# Optional: previous release (tar, directory or manifest.json) to build a
+# delta package against. Devices on that release only download changes.
+BASE_RELEASE="${1:-}"
 
-# Clean old dist
-rm -rf "$DIST_DIR"
-mkdir -p "$RELEASE_DIR"
+mkdir -p "$DIST_DIR"
+
+PYTHON="$ROOT_DIR/venv/bin/python"
+[ -x "$PYTHON" ] || PYTHON="python3"
 
 # ---------------------------------------------------------
 # 2. Validate Git state
@@ -51,66 +53,37 @@ CURRENT_BRANCH=$(git rev-parse --abbrev-ref HEAD)
 echo "GIT_BRANCH=$CURRENT_BRANCH"
 
 # ---------------------------------------------------------
-# 3. Copy project components into release folder
+# 3. Build content-addressed package
 # ---------------------------------------------------------
 echo ""
-echo "--- Copying Project Files ---"
-
-mkdir -p "$RELEASE_DIR/backend"
-mkdir -p "$RELEASE_DIR/ui"
-mkdir -p "$RELEASE_DIR/config"
-mkdir -p "$RELEASE_DIR/scripts"
-mkdir -p "$RELEASE_DIR/systemd"
-
-# Backend
-cp -r "$ROOT_DIR/backend/"* "$RELEASE_DIR/backend/" 2>/dev/null || true
-
-# UI Panels
-cp -r "$ROOT_DIR/ui/"* "$RELEASE_DIR/ui/" 2>/dev/null || true
+echo "--- Building Package ---"
 
-# Config templates
-cp -r "$ROOT_DIR/config/"* "$RELEASE_DIR/config/" 2>/dev/null || true
-
-# Scripts (excluding dist)
-find "$ROOT_DIR/scripts" -maxdepth 1 -type f -exec cp {} "$RELEASE_DIR/scripts/" \;
+BUILD_ARGS=(build --root "$ROOT_DIR" --out "$DIST_DIR" --version "$VERSION"
+    --meta "git_branch=$CURRENT_BRANCH" --meta "git_commit=$(git rev-parse HEAD)")
+if [ -n "$BASE_RELEASE" ]; then
+    echo "DELTA_BASE=$BASE_RELEASE"
+    BUILD_ARGS+=(--base "$BASE_RELEASE")
+fi
 
-# Systemd units
-cp -r "$ROOT_DIR/systemd/"* "$RELEASE_DIR/systemd/" 2>/dev/null || true
+if PACKAGE=$(cd "$ROOT_DIR" && "$PYTHON" -m fp_core.release "${BUILD_ARGS[@]}" | tail -n 1) && [ -f "$PACKAGE" ]; then
+    TARBALL_CREATED=true
+else
+    TARBALL_CREATED=false
+fi
 
-echo "FILES_COPIED=true"
+echo "TARBALL_CREATED=$TARBALL_CREATED"
 
 # ---------------------------------------------------------
-# 4. Generate release metadata
+# 4. Release metadata
 # ---------------------------------------------------------
-echo ""
-echo "--- Generating Release Metadata ---"
-
 cat << EOF > "$RELEASE_META"
 FluxPath Release: $VERSION
 Build Date: $(date)
 Git Branch: $CURRENT_BRANCH
 Git Commit: $(git rev-parse HEAD)
+Delta Base: ${BASE_RELEASE:-none}
 EOF
 
-echo "RELEASE_METADATA=true"
-
-# ---------------------------------------------------------
-# 5. Create tarball
-# ---------------------------------------------------------
-echo ""
-echo "--- Creating Tarball ---"
-
-cd "$DIST_DIR"
-tar -czf "$RELEASE_NAME.tar.gz" "$RELEASE_NAME"
-
-if [ -f "$RELEASE_NAME.tar.gz" ]; then
-    TARBALL_CREATED=true
-else
-    TARBALL_CREATED=false
-fi
-
-echo "TARBALL_CREATED=$TARBALL_CREATED"
-
 # ---------------------------------------------------------
 # 6. Final Summary
 # ---------------------------------------------------------
@@ -121,7 +94,7 @@ echo "==============================================="
 echo "Version:                $VERSION"
 echo "Git Clean:              $GIT_CLEAN"
 echo "Tarball Created:        $TARBALL_CREATED"
-echo "Output:                 $DIST_DIR/$RELEASE_NAME.tar.gz"
+echo "Output:                 $PACKAGE"
 echo "==============================================="
 echo "Release build complete."
 echo "Ready for GitHub Releases."
@@ -1,33 +1,310 @@
 #!/usr/bin/env python3
-import argparse
-import json
+# Keep module-level imports to the bare minimum: this script is called in
+# tight shell loops and interpreter start + imports dominate its runtime.
+# Everything beyond sys/os is imported inside the code path that needs it.
+import os
+import sys
 
-import requests
+FLUXPATH_URL = os.environ.get("FLUXPATH_URL", "http://127.0.0.1:9999")
+MMU_URL = os.environ.get("FLUXPATH_MMU_URL", "http://127.0.0.1:9876")
+CONTROL_SOCKET = os.environ.get(
+    "FLUXPATH_CONTROL_SOCKET", os.path.expanduser("~/FluxPath/run/fluxpath.sock")
+)
 
-FLUXPATH_URL = "http://127.0.0.1:9999"
+# method -> (HTTP verb, path, payload key) used when the control socket is
+# unavailable. The payload key picks the socket method's result out of the
+# route's {"result": "ok", ...} envelope; without one only "result" is
+# dropped (routes that return the payload's own keys, or no envelope).
+HTTP_FALLBACK = {
+    "version": ("GET", "/fluxpath/version", None),
+    "capabilities": ("GET", "/fluxpath/capabilities", "capabilities"),
+    "diagnostics": ("GET", "/fluxpath/diagnostics", "diagnostics"),
+    "mmu.status": ("GET", "/mmu/status", None),
+    "mmu.load": ("POST", "/mmu/load_slot/{slot}", None),
+    "mmu.unload": ("POST", "/mmu/unload", None),
+    "mmu.tool": ("POST", "/mmu/tool/{slot}", None),
+    "mmu.recover": ("POST", "/mmu/recover", None),
+    "instances.list": ("GET", "/fluxpath/instances", "instances"),
+    "instances.create": ("POST", "/fluxpath/instances?name={name}", "instance"),
+    "filaments": ("GET", "/fluxpath/filaments", "filaments"),
+    "plan": ("POST", "/fluxpath/slicer/plan", "plan"),
+    "status.all": ("GET", "/status/all", None),
+    "spools": ("GET", "/fluxpath/spools", None),
+    "job.check": ("POST", "/fluxpath/job/check", "prediction"),
+}
 
-def cmd_version(args):
-    r = requests.get(f"{FLUXPATH_URL}/fluxpath/version", timeout=5)
-    print(json.dumps(r.json(), indent=2))
+# topic -> SSE path used by --watch when the control socket is unavailable.
+SSE_FALLBACK = {
+    "status_all": "/status/stream",
+}
 
-def cmd_caps(args):
-    r = requests.get(f"{FLUXPATH_URL}/fluxpath/capabilities", timeout=5)
-    print(json.dumps(r.json(), indent=2))
 
-def cmd_diag(args):
-    r = requests.get(f"{FLUXPATH_URL}/fluxpath/diagnostics", timeout=5)
-    print(json.dumps(r.json(), indent=2))
+class CLIError(Exception):
+    pass
+
+
+def _connect():
+    import socket
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(CONTROL_SOCKET)
+    except OSError:
+        s.close()
+        return None
+    return s
+
+
+def _send(sock, method, params):
+    import json
+
+    sock.sendall(json.dumps({"id": 1, "method": method, "params": params}).encode() + b"\n")
+
+
+def _lines(sock):
+    import json
+
+    buf = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return
+        buf += chunk
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            yield json.loads(line)
+
+
+def call(method, **params):
+    sock = _connect()
+    if sock is None:
+        return _call_http(method, params)
+    with sock:
+        try:
+            _send(sock, method, params)
+            for msg in _lines(sock):
+                if not msg.get("ok"):
+                    raise CLIError(msg.get("error", "request failed"))
+                return msg["data"]
+        except OSError as e:
+            raise CLIError(f"control socket: {e}")
+    raise CLIError("backend closed the control socket")
+
+
+def _call_http(method, params):
+    import json
+    import urllib.error
+    import urllib.request
+
+    verb, path, key = HTTP_FALLBACK[method]
+    base = MMU_URL if path.startswith("/mmu/") else FLUXPATH_URL
+    url = base + path.format(**params)
+    body = None
+    if method == "plan":
+        body = json.dumps({"sequence": params["sequence"]}).encode()
+    elif method == "job.check":
+        body = json.dumps({"filename": params["filename"], "tool_map": params.get("tool_map")}).encode()
+    req = urllib.request.Request(url, data=body, method=verb, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as r:
+            data = json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        raise CLIError(f"HTTP {e.code}: {e.read().decode(errors='replace')}")
+    except OSError as e:
+        raise CLIError(f"backend unreachable: {e}")
+    # Same payload as the control socket returns.
+    if key is not None:
+        return data[key]
+    if isinstance(data, dict):
+        data.pop("result", None)
+    return data
+
+
+def watch(topics, initial, out=None):
+    out = out or _print
+    sock = _connect()
+    if sock is None:
+        path = SSE_FALLBACK.get(topics[0])
+        if path is None:
+            raise CLIError(f"--watch needs the control socket at {CONTROL_SOCKET}")
+        for data in _sse(MMU_URL + path):
+            out(data)
+        raise CLIError("backend closed the event stream")
+    with sock:
+        try:
+            _send(sock, "watch", {"topics": topics, "initial": initial})
+            for msg in _lines(sock):
+                if msg.get("ok") is False:
+                    raise CLIError(msg.get("error", "watch failed"))
+                out(msg["data"])
+        except OSError as e:
+            raise CLIError(f"control socket: {e}")
+
+
+def _sse(url):
+    import json
+    import urllib.request
+
+    req = urllib.request.Request(url, headers={"Accept": "text/event-stream"})
+    try:
+        resp = urllib.request.urlopen(req, timeout=60)
+    except OSError as e:
+        raise CLIError(f"backend unreachable: {e}")
+    with resp:
+        data = []
+        for raw in resp:
+            line = raw.decode().rstrip("\r\n")
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip())
+            elif not line and data:
+                yield json.loads("\n".join(data))
+                data = []
+
+
+def _print(data):
+    import json
+
+    sys.stdout.write(json.dumps(data, indent=2) + "\n")
+    sys.stdout.flush()
+
+
+def _mark(ok):
+    return "\u2714" if ok else "\u2716"
+
+
+def render_status(doc):
+    """Plain-text view of a /status/all document, one line per subsystem."""
+    lines = []
+    health = doc.get("health", {})
+    lines.append(f"{_mark(health.get('status') == 'ok')} Backend health: {health.get('status')} (v{health.get('version')})")
+
+    printer = doc.get("printer", {})
+    if printer.get("ok"):
+        info = printer.get("info", {})
+        lines.append(f"{_mark(True)} Printer API: {info.get('state', 'unknown')} {info.get('state_message', '')}".rstrip())
+    else:
+        lines.append(f"{_mark(False)} Printer API: {printer.get('error', 'unreachable')}")
+    job = doc.get("printer_state", {})
+    lines.append(f"  Printer: {job.get('status')}, job: {job.get('job') or '-'}")
+    lines.append("")
+
+    mmu = doc.get("mmu", {})
+    if "error" in mmu:
+        lines.append(f"{_mark(False)} MMU status: {mmu['error']}")
+    else:
+        active = mmu.get("active_slot")
+        state = f"{mmu.get('state')}, active slot: {'-' if active is None else active}"
+        if mmu.get("last_error"):
+            state += f" ({mmu['last_error']})"
+        lines.append(f"{_mark(mmu.get('state') != 'error')} MMU status: {state}")
+    sensors = doc.get("sensors")
+    if isinstance(sensors, list):
+        marks = " ".join("{}:{}".format(s["index"], "\u25cf" if s["triggered"] else "\u25cb") for s in sensors)
+        lines.append(f"{_mark(True)} MMU sensors: {marks}")
+    motors = doc.get("motors")
+    if isinstance(motors, list):
+        lines.append(f"{_mark(True)} MMU motors: {len(motors)} ({', '.join(m['pin'] for m in motors)})")
+    lines.append("")
+
+    webcam = doc.get("webcam", {})
+    if webcam.get("http_code") is None:
+        lines.append(f"{_mark(False)} Webcam: {webcam.get('error', 'unreachable')}")
+    else:
+        lines.append(f"{_mark(webcam.get('ok'))} Webcam HTTP: {webcam['http_code']}")
+    return "\n".join(lines)
+
+
+def _print_text(data, end="\n"):
+    sys.stdout.write(render_status(data) + end)
+    sys.stdout.flush()
+
+
+def _tool_lane(text):
+    import argparse
+
+    tool, sep, lane = text.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        return int(tool), int(lane)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TOOL=LANE, got {text!r}")
+
+
+def build_parser():
+    import argparse
 
-def main():
     p = argparse.ArgumentParser(prog="fluxpath")
     sub = p.add_subparsers(dest="cmd", required=True)
 
-    sub.add_parser("version").set_defaults(func=cmd_version)
-    sub.add_parser("caps").set_defaults(func=cmd_caps)
-    sub.add_parser("diag").set_defaults(func=cmd_diag)
+    sub.add_parser("version").set_defaults(method="version")
+    sub.add_parser("caps").set_defaults(method="capabilities")
+    sub.add_parser("diag").set_defaults(method="diagnostics")
+    sub.add_parser("filaments").set_defaults(method="filaments")
+
+    mmu = sub.add_parser("mmu").add_subparsers(dest="mmu_cmd", required=True)
+    st = mmu.add_parser("status")
+    st.add_argument("--watch", action="store_true", help="stream status changes")
+    st.set_defaults(method="mmu.status", watch_topic="mmu_status")
+    for name, method in (("load", "mmu.load"), ("tool", "mmu.tool")):
+        c = mmu.add_parser(name)
+        c.add_argument("slot", type=int)
+        c.set_defaults(method=method)
+    mmu.add_parser("unload").set_defaults(method="mmu.unload")
+    mmu.add_parser("recover").set_defaults(method="mmu.recover")
+
+    inst = sub.add_parser("instances").add_subparsers(dest="inst_cmd")
+    inst.add_parser("list").set_defaults(method="instances.list")
+    create = inst.add_parser("create")
+    create.add_argument("name")
+    create.set_defaults(method="instances.create")
+
+    status = sub.add_parser("status", help="aggregate backend/printer/MMU/webcam status")
+    status.add_argument("--watch", action="store_true", help="stream status changes")
+    status.add_argument("--text", action="store_true", help="human-readable output")
+    status.set_defaults(method="status.all", watch_topic="status_all")
+
+    plan = sub.add_parser("plan")
+    plan.add_argument("sequence", type=int, nargs="+", help="tool sequence, e.g. 0 1 0 2")
+    plan.set_defaults(method="plan")
+
+    sub.add_parser("spools", help="remaining filament per lane").set_defaults(method="spools")
+    check = sub.add_parser("check", help="predict spool runouts for a G-code file")
+    check.add_argument("filename", help="path, or name relative to the gcodes dir")
+    check.add_argument("--map", dest="tool_map", action="append", type=_tool_lane, metavar="TOOL=LANE",
+                       help="lane a tool will print from (repeatable)")
+    check.set_defaults(method="job.check")
+
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    method = getattr(args, "method", "instances.list")
+    params = {
+        k: v for k, v in vars(args).items()
+        if k in ("slot", "name", "sequence", "filename") and v is not None
+    }
+    if getattr(args, "tool_map", None):
+        params["tool_map"] = dict(args.tool_map)
+    out = _print
+    if getattr(args, "text", False):
+        # Watched blocks end with a form feed so shell loops can
+        # `read -d $'\f'` one whole frame at a time.
+        end = "\n\f" if args.watch else "\n"
+        out = lambda data: _print_text(data, end)
+    try:
+        if getattr(args, "watch", False):
+            watch([args.watch_topic], method, out)
+        else:
+            out(call(method, **params))
+    except CLIError as e:
+        sys.stderr.write(f"fluxpath: {e}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
 
-    args = p.parse_args()
-    args.func(args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
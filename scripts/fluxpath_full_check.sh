@@ -74,12 +74,8 @@ else
     echo "SERVICE_RUNNING=false"
 fi
 
-# Check MMU router mounted
-if curl -s http://localhost:9876/openapi.json | grep -q "/mmu/status"; then
-    echo "MMU_ROUTER_MOUNTED=true"
-else
-    echo "MMU_ROUTER_MOUNTED=false"
-fi
+. "$(dirname "$0")/fluxpath_backend_checks.sh"
+backend_checks
 
 # Check config exists
 CONFIG="$HOME/FluxPath/config/fluxpath_config.json"
@@ -137,6 +133,8 @@ echo "Webcam Detected:        $(grep WEBCAM_DETECTED=true <<< $(cat))"
 echo "Webcam Configured:      $(grep WEBCAM_CONFIGURED=true <<< $(cat))"
 echo "Backend Running:        $(grep SERVICE_RUNNING=true <<< $(cat))"
 echo "MMU Router Mounted:     $(grep MMU_ROUTER_MOUNTED=true <<< $(cat))"
+echo "MMU OK:                 $(grep MMU_OK=true <<< $(cat))"
+echo "Klipper Ready:          $(grep KLIPPER_READY=true <<< $(cat))"
 echo "MMU Status Endpoint:    $(grep MMU_STATUS_ENDPOINT=true <<< $(cat))"
 echo "Webcam Stream Active:   $(grep WEBCAM_STREAM_ACTIVE=true <<< $(cat))"
 echo "==============================================="
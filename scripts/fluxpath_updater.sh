@@ -4,10 +4,26 @@ set -e
 USER_NAME="syko"
 BASE_DIR="/home/${USER_NAME}/FluxPath"
 
+PACKAGE="${1:+$(realpath "$1")}"
 cd "$BASE_DIR"
 
+# fluxpath_updater.sh <package.tar.gz|package dir>
+#   Apply a release package built by fluxpath_build_release.sh. Only files
+#   that differ from the installed release are written, and the service
+#   is restarted only when Python code or dependencies changed. Works
+#   offline from a local file (USB stick, scp).
+if [ -n "$PACKAGE" ]; then
+  PYTHON="$BASE_DIR/venv/bin/python"
+  [ -x "$PYTHON" ] || PYTHON="python3"
+  echo "==> Applying release package $PACKAGE..."
+  "$PYTHON" -m fp_core.release apply "$PACKAGE" --install-dir "$BASE_DIR" --restart
+  echo "FluxPath updated."
+  exit 0
+fi
+
 if [ ! -d .git ]; then
   echo "No git repo here; updater expects FluxPath to be a git clone."
+  echo "To update from a release package: $0 <package.tar.gz>"
   exit 1
 fi
 